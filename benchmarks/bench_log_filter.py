@@ -0,0 +1,39 @@
+"""
+Mesure le débit du filtre local de pertinence (journaux/seconde).
+
+Utilisation, depuis la racine du dépôt :
+    python -m benchmarks.bench_log_filter --lines 1000000
+"""
+import argparse
+import time
+
+from benchmarks.synthetic_logs import generate_logs
+from processors.log_filter import LogRelevanceScorer
+from processors.log_record import LogRecord
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark du filtre local de pertinence.")
+    parser.add_argument("--lines", type=int, default=1_000_000, help="Nombre total de journaux à évaluer")
+    parser.add_argument("--batch-size", type=int, default=10_000, help="Taille des lots évalués")
+    args = parser.parse_args()
+
+    scorer = LogRelevanceScorer()
+    batch = [LogRecord.from_source(log) for log in generate_logs(args.batch_size)]
+    batches = max(1, args.lines // args.batch_size)
+
+    started = time.perf_counter()
+    for _ in range(batches):
+        scorer.score_batch(batch)
+    score_elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(batches):
+        scorer.select(batch)
+    select_elapsed = time.perf_counter() - started
+
+    total = batches * args.batch_size
+    print(f"score_batch : {total / score_elapsed:,.0f} journaux/s ({total} journaux, lots de {args.batch_size})")
+    print(f"select      : {total / select_elapsed:,.0f} journaux/s")
+
+if __name__ == "__main__":
+    main()
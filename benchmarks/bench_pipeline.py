@@ -0,0 +1,288 @@
+"""
+Benchmark hors ligne du pipeline d'analyse complet, avec Elasticsearch et modèle IA factices.
+
+Exécute le vrai AnalysisPipeline (filtre local, modèles de journaux, cache et limites IA,
+écriture bulk, état groupé) sur des journaux synthétiques, pour plusieurs nombres de clients
+et tailles de lots, puis rapporte :
+- le débit et les percentiles de latence de chaque étape;
+- les percentiles de durée de cycle et le débit global (journaux/seconde);
+- le pic de mémoire allouée pendant un cycle (tracemalloc).
+
+Les résultats peuvent être enregistrés comme référence (--save-baseline) puis comparés
+à une exécution ultérieure (--compare) : le code de sortie vaut 1 en cas de régression.
+
+Utilisation, depuis la racine du dépôt :
+    python -m benchmarks.bench_pipeline --clients 10,100 --batch-sizes 50,200 --save-baseline baseline.json
+    python -m benchmarks.bench_pipeline --clients 10,100 --batch-sizes 50,200 --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import math
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from benchmarks.fakes import FakeElasticsearchClient, FakeIABackend
+from config import settings
+from core.bulk_writer import BulkResultWriter
+from core.ia_api_handler import IAApiHandler
+from core.pipeline import AnalysisPipeline
+from processors.log_processor import LogProcessor
+from state_manager.analysis_state import AnalysisStateManager
+from utils.notifier import Notifier
+
+STAGES = ("discover", "state_load", "fetch", "filter", "prepare", "ia", "write", "state_flush")
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    Percentile par rang le plus proche d'une liste de valeurs (0 si la liste est vide).
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+class StageTimer:
+    """
+    Accumule la durée et le nombre d'éléments traités par étape, de façon sûre entre threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {stage: [] for stage in STAGES}
+        self.items = {stage: 0 for stage in STAGES}
+
+    def record(self, stage: str, duration: float, items: int):
+        with self._lock:
+            self.durations[stage].append(duration)
+            self.items[stage] += items
+
+    def wrap(self, obj, method_name: str, stage: str, count=lambda args, result: 1):
+        """
+        Remplace obj.method_name par une version chronométrée. count(args, résultat) donne le nombre d'éléments traités.
+        """
+        original = getattr(obj, method_name)
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            result = original(*args, **kwargs)
+            self.record(stage, time.perf_counter() - started, count(args, result))
+            return result
+        setattr(obj, method_name, timed)
+
+    def wrap_pages(self, obj, method_name: str, stage: str):
+        """
+        Chronomètre chaque page produite par un générateur de pages (journaux, valeurs de tri).
+        """
+        original = getattr(obj, method_name)
+
+        def timed_pages(*args, **kwargs):
+            pages = original(*args, **kwargs)
+            try:
+                while True:
+                    started = time.perf_counter()
+                    page = next(pages, None)
+                    if page is None:
+                        return
+                    self.record(stage, time.perf_counter() - started, len(page[0]))
+                    yield page
+            finally:
+                pages.close()
+        setattr(obj, method_name, timed_pages)
+
+    def summary(self) -> dict:
+        report = {}
+        for stage in STAGES:
+            durations = self.durations[stage]
+            busy = sum(durations)
+            report[stage] = {
+                "calls": len(durations),
+                "items": self.items[stage],
+                "busy_seconds": round(busy, 4),
+                "items_per_second": round(self.items[stage] / busy, 1) if busy else 0.0,
+                "p50_ms": round(percentile(durations, 0.50) * 1000, 3),
+                "p95_ms": round(percentile(durations, 0.95) * 1000, 3),
+                "p99_ms": round(percentile(durations, 0.99) * 1000, 3),
+            }
+        return report
+
+def configure_settings(args):
+    """
+    Applique la configuration du benchmark avant la création des composants (qui lisent settings à l'initialisation).
+    """
+    settings.ANALYSIS_WORKERS = args.workers
+    settings.ES_FETCH_CONCURRENCY = args.workers
+    settings.IA_CONCURRENCY = args.ia_concurrency
+    settings.IA_REQUESTS_PER_MINUTE = args.ia_rpm
+    settings.IA_TOKENS_PER_MINUTE = args.ia_tpm
+    settings.ENABLE_IA_CACHE = args.ia_cache
+    settings.ENABLE_IA_PACKING = args.ia_packing
+    settings.ENABLE_LOG_DIGEST = args.log_digest
+    settings.ENABLE_ANOMALY_GATE = args.anomaly_gate
+    settings.ANOMALY_BASELINE_PATH = ""
+    settings.IA_CACHE_PATH = ""
+    settings.ENABLE_EMAIL_NOTIFICATIONS = False
+    settings.MAX_BATCHES_PER_CLIENT_CYCLE = 0
+
+def silence_logging():
+    """
+    Les modules du dépôt configurent leurs propres loggers au niveau INFO : on les limite aux avertissements.
+    """
+    logging.getLogger().setLevel(logging.WARNING)
+    for logger in list(logging.root.manager.loggerDict.values()):
+        if isinstance(logger, logging.Logger):
+            logger.setLevel(logging.WARNING)
+
+def run_scenario(client_count: int, batch_size: int, args) -> dict:
+    """
+    Exécute args.cycles cycles du pipeline pour un nombre de clients et une taille de lot donnés.
+    """
+    settings.MAX_LOGS_PER_BATCH = batch_size
+    es_client = FakeElasticsearchClient(es_latency=args.es_latency, seed=args.seed)
+    backend = FakeIABackend(latency=args.ia_latency, jitter=args.ia_jitter, error_rate=args.ia_error_rate)
+    ia_handler = IAApiHandler(backend=backend)
+    log_processor = LogProcessor()
+    state_manager = AnalysisStateManager(es_client)
+    result_writer = BulkResultWriter(es_client)
+    pipeline = AnalysisPipeline(es_client, ia_handler, log_processor, state_manager, Notifier(), result_writer)
+    silence_logging()
+
+    timer = StageTimer()
+    timer.wrap(es_client, "get_active_clients_with_latest", "discover", lambda args, result: len(result))
+    timer.wrap(state_manager, "load_states", "state_load", lambda args, result: len(args[0]))
+    timer.wrap_pages(es_client, "iter_logs_for_client", "fetch")
+    if pipeline.log_filter:
+        timer.wrap(pipeline.log_filter, "select", "filter", lambda args, result: len(args[0]))
+    timer.wrap(log_processor, "prepare_logs_for_ia", "prepare", lambda args, result: len(args[0]))
+    timer.wrap(backend, "generate", "ia")
+    timer.wrap(result_writer, "_send", "write", lambda args, result: len(args[0]))
+    timer.wrap(state_manager, "flush", "state_flush", lambda args, result: 0)
+
+    cycle_durations = []
+    cycle_peaks = []
+    interval = timedelta(seconds=args.window_seconds)
+    cycle_time = datetime.utcnow().replace(microsecond=0)
+    try:
+        for _ in range(args.cycles):
+            # Journaux de la fenêtre du cycle, générés hors mesure
+            es_client.populate(client_count, args.logs_per_client, cycle_time - interval, args.window_seconds)
+            if args.trace_memory:
+                tracemalloc.start()
+                baseline_memory = tracemalloc.get_traced_memory()[0]
+
+            started = time.perf_counter()
+            active_clients = es_client.get_active_clients_with_latest()
+            pipeline.run_cycle(active_clients, cycle_time)
+            cycle_durations.append(time.perf_counter() - started)
+
+            if args.trace_memory:
+                cycle_peaks.append(tracemalloc.get_traced_memory()[1] - baseline_memory)
+                tracemalloc.stop()
+            cycle_time += interval
+    finally:
+        result_writer.close()
+
+    total_logs = client_count * args.logs_per_client * args.cycles
+    total_seconds = sum(cycle_durations)
+    results_written = len(es_client.es.documents(settings.IA_RESULTS_INDEX))
+    return {
+        "clients": client_count,
+        "batch_size": batch_size,
+        "logs_per_client": args.logs_per_client,
+        "cycles": args.cycles,
+        "logs_per_second": round(total_logs / total_seconds, 1) if total_seconds else 0.0,
+        "cycle_p50_seconds": round(percentile(cycle_durations, 0.50), 4),
+        "cycle_p95_seconds": round(percentile(cycle_durations, 0.95), 4),
+        "cycle_p99_seconds": round(percentile(cycle_durations, 0.99), 4),
+        "peak_cycle_memory_mb": round(max(cycle_peaks) / 2 ** 20, 2) if cycle_peaks else None,
+        "ia_calls": backend.calls,
+        "results_written": results_written,
+        "stages": timer.summary(),
+    }
+
+def scenario_key(result: dict) -> str:
+    return f"clients={result['clients']},batch={result['batch_size']}"
+
+def compare(results: list, baseline: dict, tolerance: float) -> list:
+    """
+    Compare les résultats à une référence. Renvoie la liste des régressions (débit en baisse ou
+    latence de cycle p95 en hausse de plus de tolerance).
+    """
+    regressions = []
+    baseline_scenarios = {scenario_key(result): result for result in baseline.get("scenarios", [])}
+    for result in results:
+        reference = baseline_scenarios.get(scenario_key(result))
+        if not reference:
+            continue
+        if reference["logs_per_second"] and result["logs_per_second"] < reference["logs_per_second"] * (1 - tolerance):
+            regressions.append(f"{scenario_key(result)}: débit {result['logs_per_second']} journaux/s (référence {reference['logs_per_second']})")
+        if reference["cycle_p95_seconds"] and result["cycle_p95_seconds"] > reference["cycle_p95_seconds"] * (1 + tolerance):
+            regressions.append(f"{scenario_key(result)}: cycle p95 {result['cycle_p95_seconds']}s (référence {reference['cycle_p95_seconds']}s)")
+    return regressions
+
+def print_report(results: list):
+    for result in results:
+        memory = f", pic mémoire {result['peak_cycle_memory_mb']} Mo" if result["peak_cycle_memory_mb"] is not None else ""
+        print(f"\n== {scenario_key(result)} : {result['logs_per_second']:,.0f} journaux/s, "
+              f"cycle p50/p95/p99 {result['cycle_p50_seconds']}/{result['cycle_p95_seconds']}/{result['cycle_p99_seconds']}s"
+              f"{memory}, {result['ia_calls']} appels IA, {result['results_written']} résultats écrits")
+        for stage, stats in result["stages"].items():
+            if stats["calls"]:
+                print(f"  {stage:<12} {stats['calls']:>6} appels {stats['items']:>9} éléments "
+                      f"{stats['items_per_second']:>12,.0f} él./s occupé  p50 {stats['p50_ms']:>8.2f}ms  p95 {stats['p95_ms']:>8.2f}ms  p99 {stats['p99_ms']:>8.2f}ms")
+
+def _int_list(value: str) -> list:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark hors ligne du pipeline d'analyse.")
+    parser.add_argument("--clients", type=_int_list, default=[10, 100], help="Nombres de clients, séparés par des virgules")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[50, 200], help="Tailles de lots (MAX_LOGS_PER_BATCH), séparées par des virgules")
+    parser.add_argument("--logs-per-client", type=int, default=400, help="Journaux par client et par cycle")
+    parser.add_argument("--cycles", type=int, default=3, help="Cycles mesurés par scénario")
+    parser.add_argument("--window-seconds", type=float, default=300, help="Durée de la fenêtre d'un cycle")
+    parser.add_argument("--workers", type=int, default=settings.ANALYSIS_WORKERS, help="ANALYSIS_WORKERS (et ES_FETCH_CONCURRENCY)")
+    parser.add_argument("--ia-concurrency", type=int, default=settings.IA_CONCURRENCY)
+    parser.add_argument("--es-latency", type=float, default=0.002, help="Latence simulée par requête ES (secondes)")
+    parser.add_argument("--ia-latency", type=float, default=0.05, help="Latence simulée par appel IA (secondes)")
+    parser.add_argument("--ia-jitter", type=float, default=0.0, help="Écart type de la latence IA (secondes)")
+    parser.add_argument("--ia-error-rate", type=float, default=0.0, help="Proportion d'erreurs IA temporaires")
+    parser.add_argument("--ia-rpm", type=float, default=0, help="IA_REQUESTS_PER_MINUTE (0 : pas de limite)")
+    parser.add_argument("--ia-tpm", type=float, default=0, help="IA_TOKENS_PER_MINUTE (0 : pas de limite)")
+    parser.add_argument("--ia-cache", action="store_true", help="Active le cache des résultats IA")
+    parser.add_argument("--ia-packing", action="store_true", help="Regroupe les petites requêtes IA de plusieurs clients")
+    parser.add_argument("--log-digest", action="store_true", help="Analyse les gros clients à partir d'une synthèse côté serveur (seuil : DIGEST_MIN_LOGS)")
+    parser.add_argument("--anomaly-gate", action="store_true", help="N'appelle l'IA que pour les lots anormaux (apprentissage : ANOMALY_MIN_OBSERVATIONS)")
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false", help="Désactive la mesure mémoire (tracemalloc ralentit l'exécution)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Écrit les résultats au format JSON dans ce fichier")
+    parser.add_argument("--save-baseline", help="Enregistre les résultats comme référence dans ce fichier JSON")
+    parser.add_argument("--compare", help="Compare les résultats à ce fichier de référence JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Écart relatif toléré avant de signaler une régression")
+    args = parser.parse_args()
+
+    configure_settings(args)
+    results = [run_scenario(client_count, batch_size, args)
+               for client_count in args.clients for batch_size in args.batch_sizes]
+    print_report(results)
+
+    report = {"created_at": datetime.utcnow().isoformat(timespec='seconds') + "Z", "config": vars(args), "scenarios": results}
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nRégressions détectées :")
+            for regression in regressions:
+                print(f"  - {regression}")
+            sys.exit(1)
+        print("\nAucune régression par rapport à la référence.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Serveur Elasticsearch factice en mémoire, partageable entre plusieurs processus locaux.
+
+Sert le sous-ensemble de l'API REST utilisé par l'analyseur pour son état et ses résultats
+(index, get, mget, bulk, search, msearch, avec if_seq_no / if_primary_term et op_type create),
+à partir de benchmarks.fakes.InMemoryDocumentStore.
+
+Utilisation, depuis la racine du dépôt :
+    python -m benchmarks.fake_es_server --port 9299
+    ES_HOST=http://127.0.0.1:9299 SHARDING_ENABLED=True python main.py
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from benchmarks.fakes import InMemoryDocumentStore
+
+def make_handler(store: InMemoryDocumentStore):
+    class FakeESHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _handle(self):
+            url = urlsplit(self.path)
+            length = int(self.headers.get("Content-Length", 0))
+            raw_body = self.rfile.read(length) if length else b""
+            body = raw_body
+            if raw_body and not url.path.rstrip("/").endswith(("_bulk", "_msearch")):
+                body = json.loads(raw_body)
+            try:
+                status, response = store.handle(self.command, url.path, dict(parse_qsl(url.query)), body or None)
+            except NotImplementedError as e:
+                status, response = 400, {"error": {"type": "illegal_argument_exception", "reason": str(e)}, "status": 400}
+
+            payload = b"" if self.command == "HEAD" else json.dumps(response).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("X-Elastic-Product", "Elasticsearch") # Vérifié par le client Python
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+        def log_message(self, format, *args):
+            pass # Pas de journal par requête
+
+    return FakeESHandler
+
+def start_server(port: int = 0, store: InMemoryDocumentStore = None):
+    """
+    Démarre le serveur dans un thread d'arrière-plan. Renvoie (serveur, URL, stockage).
+    """
+    store = store or InMemoryDocumentStore()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(store))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-es-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}", store
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur Elasticsearch factice en mémoire.")
+    parser.add_argument("--port", type=int, default=9299)
+    args = parser.parse_args()
+
+    server, url, store = start_server(args.port)
+    print(f"Elasticsearch factice à l'écoute sur {url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(", ".join(f"{name}: {len(docs)} documents" for name, docs in store.indices.items()) or "Aucun index")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
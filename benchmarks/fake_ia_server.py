@@ -0,0 +1,80 @@
+"""
+Serveur de modèle IA factice pour les tests de débit (backend IA « http »).
+
+Répond à POST {"prompt": ...} par {"text": ...} après une latence simulée, et renvoie
+une erreur 429 avec la probabilité donnée pour exercer les nouveaux essais.
+
+Utilisation, depuis la racine du dépôt :
+    python -m benchmarks.fake_ia_server --port 8089 --latency 0.5 --error-rate 0.05
+    IA_BACKEND=http IA_BACKEND_URL=http://127.0.0.1:8089/generate python main.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+FAKE_SUMMARY = "Aucun problème significatif détecté. (réponse du serveur IA factice)"
+
+def make_handler(latency: float, jitter: float, error_rate: float):
+    stats = {"requests": 0, "errors": 0}
+    lock = threading.Lock()
+
+    class FakeIAHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            prompt = json.loads(self.rfile.read(length) or b"{}").get("prompt", "")
+            time.sleep(max(0.0, random.gauss(latency, jitter)))
+
+            with lock:
+                stats["requests"] += 1
+                failed = random.random() < error_rate
+                if failed:
+                    stats["errors"] += 1
+            if failed:
+                self.send_response(429)
+                self.end_headers()
+                return
+
+            body = json.dumps({"text": FAKE_SUMMARY, "prompt_chars": len(prompt)}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Pas de journal par requête : le serveur sert aux mesures de débit
+
+    return FakeIAHandler, stats
+
+def start_server(port: int = 0, latency: float = 0.2, jitter: float = 0.0, error_rate: float = 0.0):
+    """
+    Démarre le serveur dans un thread d'arrière-plan. Renvoie (serveur, URL, statistiques).
+    """
+    handler, stats = make_handler(latency, jitter, error_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ia-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/generate", stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur de modèle IA factice.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.5, help="Latence moyenne simulée (secondes)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Écart type de la latence (secondes)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Proportion de réponses 429")
+    args = parser.parse_args()
+
+    server, url, stats = start_server(args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Serveur IA factice à l'écoute sur {url}")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"{stats['requests']} requêtes, {stats['errors']} erreurs 429")
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,366 @@
+"""
+Doublures en mémoire d'Elasticsearch et du modèle IA pour exécuter le vrai pipeline hors ligne.
+
+- InMemoryDocumentStore : stockage de documents en mémoire avec la sémantique Elasticsearch utile à l'analyseur
+  (numéros de séquence, concurrence optimiste, bulk, mget, search), partagé avec benchmarks/fake_es_server.py.
+- InMemoryElasticsearch : client Elasticsearch de bas niveau servi par ce stockage; les helpers bulk
+  et les API du client fonctionnent sans modification.
+- FakeElasticsearchClient : remplace ElasticsearchClient (découverte des clients, pagination et synthèse
+  des journaux) à partir de journaux synthétiques chargés en mémoire.
+- FakeIABackend : backend IA à brancher dans IAApiHandler(backend=...), avec latence simulée.
+"""
+import json
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from datetime import timedelta
+from fnmatch import fnmatch
+from urllib.parse import unquote
+
+from elastic_transport import ApiResponseMeta, HeadApiResponse, HttpHeaders, NodeConfig, ObjectApiResponse
+from elasticsearch import ApiError, Elasticsearch
+from elasticsearch.exceptions import HTTP_EXCEPTIONS
+
+from benchmarks.synthetic_logs import generate_log
+from config import settings
+from core.elasticsearch_client import ElasticsearchClient
+from core.ia_api_handler import PACK_SECTION_HEADER
+from core.ia_backends import IABackendError
+from processors.log_record import LogRecord
+from utils.time_utils import parse_timestamp
+
+FAKE_SUMMARY = "Aucun problème significatif détecté. (réponse du backend IA factice)"
+
+def _simulate_latency(latency: float, jitter: float = 0.0):
+    if latency > 0:
+        time.sleep(max(0.0, random.gauss(latency, jitter)))
+
+def _get_field(source: dict, field: str):
+    value = source
+    for part in field.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+def _matches(source: dict, query: dict) -> bool:
+    """
+    Évalue le sous-ensemble du DSL de requête utilisé par l'analyseur sur ses propres index
+    (match_all, term, terms, range, exists, bool).
+    """
+    if not query:
+        return True
+    kind, clause = next(iter(query.items()))
+    if kind == "match_all":
+        return True
+    if kind == "term":
+        field, expected = next(iter(clause.items()))
+        expected = expected.get("value") if isinstance(expected, dict) else expected
+        return _get_field(source, field) == expected
+    if kind == "terms":
+        field, expected = next(iter(clause.items()))
+        return _get_field(source, field) in expected
+    if kind == "exists":
+        return _get_field(source, clause["field"]) is not None
+    if kind == "range":
+        field, bounds = next(iter(clause.items()))
+        value = _get_field(source, field)
+        if value is None:
+            return False
+        checks = {"gt": lambda b: value > b, "gte": lambda b: value >= b, "lt": lambda b: value < b, "lte": lambda b: value <= b}
+        return all(checks[op](bound) for op, bound in bounds.items() if op in checks)
+    if kind == "bool":
+        must = clause.get("must", []) + clause.get("filter", [])
+        must = must if isinstance(must, list) else [must]
+        should = clause.get("should", [])
+        must_not = clause.get("must_not", [])
+        minimum_should_match = clause.get("minimum_should_match", 1 if should and not must else 0)
+        return (all(_matches(source, q) for q in must)
+                and not any(_matches(source, q) for q in (must_not if isinstance(must_not, list) else [must_not]))
+                and sum(1 for q in should if _matches(source, q)) >= minimum_should_match)
+    raise NotImplementedError(f"Requête non prise en charge par le faux Elasticsearch: {kind}")
+
+class InMemoryDocumentStore:
+    """
+    Stockage de documents en mémoire reproduisant la sémantique Elasticsearch utile à l'analyseur :
+    numéros de séquence et contrôle de concurrence optimiste (if_seq_no / if_primary_term, op_type create),
+    get, mget, index, create, delete, bulk, search et msearch sur un sous-ensemble du DSL.
+    handle() prend et renvoie des objets Python : il sert aussi bien au client en mémoire qu'au serveur HTTP factice.
+    """
+    PRIMARY_TERM = 1
+
+    def __init__(self):
+        self.indices = {}
+        self._seq_no = 0
+        self._lock = threading.RLock()
+
+    def documents(self, index_name: str) -> list:
+        with self._lock:
+            return [doc["_source"] for doc in self.indices.get(index_name, {}).values()]
+
+    def handle(self, method: str, path: str, params: dict = None, body=None) -> tuple:
+        """
+        Traite une requête REST et renvoie (statut HTTP, corps de la réponse).
+        """
+        params = params or {}
+        parts = [unquote(part) for part in path.split("?")[0].split("/") if part]
+        with self._lock:
+            if not parts:
+                return 200, {"name": "fake-elasticsearch", "version": {"number": "9.0.0"}, "tagline": "You Know, for Search"}
+            endpoint = parts[-1] if parts[-1].startswith("_") else None
+            if endpoint == "_bulk":
+                return 200, self._bulk(self._lines(body), parts[0] if len(parts) == 2 else None)
+            if endpoint == "_mget":
+                index_name = parts[0] if len(parts) == 2 else None
+                docs = [self._get(doc.get("_index", index_name), doc["_id"])[1] for doc in self._mget_docs(body, index_name)]
+                return 200, {"docs": docs}
+            if endpoint == "_msearch":
+                lines = self._lines(body)
+                responses = [self._search(header.get("index") or (parts[0] if len(parts) == 2 else "*"), search)
+                             for header, search in zip(lines[::2], lines[1::2])]
+                return 200, {"responses": responses}
+            if endpoint == "_search":
+                return 200, self._search(parts[0] if len(parts) == 2 else "*", body or {})
+            if endpoint == "_refresh":
+                return 200, {"_shards": {"total": 1, "successful": 1, "failed": 0}}
+            if len(parts) == 1:
+                return self._index_admin(method, parts[0])
+            if len(parts) >= 2 and parts[1] in ("_doc", "_create"):
+                index_name, doc_id = parts[0], parts[2] if len(parts) == 3 else None
+                if method == "GET":
+                    return self._get(index_name, doc_id)
+                if method == "DELETE":
+                    return self._write("delete", index_name, doc_id, None, params)
+                op_type = "create" if parts[1] == "_create" or params.get("op_type") == "create" else "index"
+                return self._write(op_type, index_name, doc_id, body, params)
+        raise NotImplementedError(f"Requête non prise en charge par le faux Elasticsearch: {method} {path}")
+
+    @staticmethod
+    def _lines(body) -> list:
+        if isinstance(body, (bytes, str)):
+            body = [line for line in (body.decode("utf-8") if isinstance(body, bytes) else body).splitlines() if line.strip()]
+        return [json.loads(line) if isinstance(line, (bytes, str)) else line for line in body or []]
+
+    @staticmethod
+    def _mget_docs(body: dict, index_name: str) -> list:
+        if "docs" in body:
+            return body["docs"]
+        return [{"_index": index_name, "_id": doc_id} for doc_id in body["ids"]]
+
+    def _index_admin(self, method: str, index_name: str) -> tuple:
+        exists = index_name in self.indices
+        if method == "PUT":
+            if exists:
+                return 400, {"error": {"type": "resource_already_exists_exception"}, "status": 400}
+            self.indices[index_name] = {}
+            return 200, {"acknowledged": True, "index": index_name}
+        if method == "DELETE":
+            self.indices.pop(index_name, None)
+            return (200 if exists else 404), {"acknowledged": exists}
+        return (200 if exists else 404), {}
+
+    def _get(self, index_name: str, doc_id: str) -> tuple:
+        doc = self.indices.get(index_name, {}).get(doc_id)
+        if doc is None:
+            return 404, {"_index": index_name, "_id": doc_id, "found": False}
+        return 200, {"_index": index_name, "_id": doc_id, "found": True, **doc}
+
+    def _write(self, op_type: str, index_name: str, doc_id: str, source, params: dict) -> tuple:
+        """
+        Applique une opération d'écriture avec contrôle de concurrence optimiste. Renvoie (statut, résultat).
+        """
+        index = self.indices.setdefault(index_name, {})
+        if doc_id is None:
+            doc_id = f"auto-{self._seq_no + 1}"
+        current = index.get(doc_id)
+        if_seq_no = params.get("if_seq_no")
+        if_primary_term = params.get("if_primary_term")
+        conflict = None
+        if op_type == "create" and current is not None:
+            conflict = f"[{doc_id}]: version conflict, document already exists"
+        elif if_seq_no is not None and (current is None or current["_seq_no"] != int(if_seq_no)
+                                        or int(if_primary_term if if_primary_term is not None else self.PRIMARY_TERM) != current["_primary_term"]):
+            conflict = f"[{doc_id}]: version conflict, required seqNo [{if_seq_no}]"
+        if conflict:
+            return 409, {"_index": index_name, "_id": doc_id, "status": 409,
+                         "error": {"type": "version_conflict_engine_exception", "reason": conflict}}
+        if op_type == "delete":
+            if current is None:
+                return 404, {"_index": index_name, "_id": doc_id, "result": "not_found", "status": 404}
+            del index[doc_id]
+            self._seq_no += 1
+            return 200, {"_index": index_name, "_id": doc_id, "result": "deleted", "_seq_no": self._seq_no,
+                         "_primary_term": self.PRIMARY_TERM, "status": 200}
+
+        self._seq_no += 1
+        version = current["_version"] + 1 if current else 1
+        index[doc_id] = {"_source": source, "_seq_no": self._seq_no, "_primary_term": self.PRIMARY_TERM, "_version": version}
+        status = 200 if current else 201
+        return status, {"_index": index_name, "_id": doc_id, "result": "updated" if current else "created",
+                        "_seq_no": self._seq_no, "_primary_term": self.PRIMARY_TERM, "_version": version, "status": status}
+
+    def _bulk(self, lines: list, default_index: str = None) -> dict:
+        items = []
+        position = 0
+        while position < len(lines):
+            op_type, meta = next(iter(lines[position].items()))
+            position += 1
+            source = None
+            if op_type != "delete":
+                source = lines[position]
+                position += 1
+            _, result = self._write(op_type, meta.get("_index", default_index), meta.get("_id"), source, meta)
+            items.append({op_type: result})
+        return {"took": 0, "errors": any(next(iter(item.values()))["status"] >= 300 for item in items), "items": items}
+
+    def _search(self, index_pattern: str, search: dict) -> dict:
+        hits = []
+        for index_name, index in self.indices.items():
+            if not any(fnmatch(index_name, pattern) for pattern in index_pattern.split(",")):
+                continue
+            for doc_id, doc in index.items():
+                if _matches(doc["_source"], search.get("query")):
+                    hits.append({"_index": index_name, "_id": doc_id, "_score": 1.0, "_source": doc["_source"],
+                                 "_seq_no": doc["_seq_no"], "_primary_term": doc["_primary_term"]})
+        for sort in reversed(search.get("sort", [])):
+            field, order = (sort, "asc") if isinstance(sort, str) else next(iter(sort.items()))
+            order = order.get("order", "asc") if isinstance(order, dict) else order
+            hits.sort(key=lambda hit: (_get_field(hit["_source"], field) is None, _get_field(hit["_source"], field) or ""),
+                      reverse=order == "desc")
+        total = len(hits)
+        return {"took": 0, "timed_out": False, "hits": {"total": {"value": total, "relation": "eq"},
+                                                        "hits": hits[:search.get("size", 10)]}}
+
+class InMemoryElasticsearch(Elasticsearch):
+    """
+    Client Elasticsearch dont perform_request est servi par un InMemoryDocumentStore, avec une latence par requête.
+    Les helpers bulk et les API du client fonctionnent sans modification.
+    """
+    def __init__(self, latency: float = 0.0, store: InMemoryDocumentStore = None):
+        super().__init__("http://fake-elasticsearch:9200")
+        self.latency = latency
+        self.store = store or InMemoryDocumentStore()
+
+    def options(self, **kwargs):
+        return self # Pas de transport réel à configurer
+
+    def perform_request(self, method, path, *, params=None, headers=None, body=None, endpoint_id=None, path_parts=None):
+        _simulate_latency(self.latency)
+        status, response = self.store.handle(method, path, params, body)
+        meta = ApiResponseMeta(status=status, http_version="1.1", headers=HttpHeaders(), duration=0.0,
+                               node=NodeConfig("http", "fake-elasticsearch", 9200))
+        if method == "HEAD":
+            return HeadApiResponse(meta=meta)
+        if status >= 400:
+            raise HTTP_EXCEPTIONS.get(status, ApiError)(message=str(response.get("error", response)), meta=meta, body=response)
+        return ObjectApiResponse(body=response, meta=meta)
+
+    def documents(self, index_name: str) -> list:
+        return self.store.documents(index_name)
+
+class FakeElasticsearchClient(ElasticsearchClient):
+    """
+    ElasticsearchClient servi par des journaux synthétiques en mémoire, avec une latence par page.
+    La découverte des clients et la pagination reproduisent le contrat du vrai client
+    (dictionnaire client_id -> dernier horodatage, pages (journaux, valeurs de tri)).
+    """
+    def __init__(self, es_latency: float = 0.0, seed: int = 42):
+        self.es = InMemoryElasticsearch(latency=es_latency)
+        self.write_slots = threading.BoundedSemaphore(max(1, settings.ES_WRITE_CONCURRENCY))
+        self._verified_indices = {}
+        self.es_latency = es_latency
+        self.rng = random.Random(seed)
+        self.logs_by_client = {}
+        self.timestamps_by_client = {}
+
+    def populate(self, client_count: int, logs_per_client: int, window_start, window_seconds: float):
+        """
+        Remplace les journaux en mémoire par logs_per_client journaux par client, répartis sur la fenêtre.
+        """
+        self.logs_by_client.clear()
+        self.timestamps_by_client.clear()
+        step = window_seconds / max(1, logs_per_client)
+        for client_index in range(client_count):
+            client_id = f"client-{client_index:05d}"
+            logs = [LogRecord.from_source(generate_log(self.rng, client_id, window_start + timedelta(seconds=index * step)))
+                    for index in range(logs_per_client)]
+            self.logs_by_client[client_id] = logs
+            self.timestamps_by_client[client_id] = [parse_timestamp(log.timestamp) for log in logs]
+
+    def get_active_clients_with_latest(self, lookback_time: str = settings.ACTIVE_CLIENTS_LOOKBACK_TIME) -> dict:
+        _simulate_latency(self.es_latency)
+        return {client_id: logs[-1].timestamp for client_id, logs in self.logs_by_client.items() if logs}
+
+    def iter_logs_for_client(self, client_id: str, start_timestamp: str, end_timestamp: str = "now/s", page_size: int = None):
+        page_size = page_size or settings.MAX_LOGS_PER_BATCH
+        logs = self.logs_by_client.get(client_id, [])
+        timestamps = self.timestamps_by_client.get(client_id, [])
+        position = bisect_left(timestamps, parse_timestamp(start_timestamp))
+        end = bisect_left(timestamps, parse_timestamp(end_timestamp)) if end_timestamp != "now/s" else len(logs)
+        while position < end:
+            _simulate_latency(self.es_latency)
+            page = logs[position:min(position + page_size, end)]
+            position += len(page)
+            yield page, [page[-1].timestamp]
+
+    def fetch_log_digest(self, client_id: str, start_timestamp: str, end_timestamp: str,
+                         sample_size: int = settings.DIGEST_SAMPLE_SIZE) -> dict:
+        """
+        Synthèse calculée en Python, au format de ElasticsearchClient.fetch_log_digest (sans chemins d'URL
+        ni termes significatifs, absents des journaux synthétiques).
+        """
+        _simulate_latency(self.es_latency)
+        top = settings.DIGEST_TOP_TERMS
+        logs = self.logs_by_client.get(client_id, [])
+        timestamps = self.timestamps_by_client.get(client_id, [])
+        start = parse_timestamp(start_timestamp)
+        logs = logs[bisect_left(timestamps, start):bisect_left(timestamps, parse_timestamp(end_timestamp))]
+        window = (parse_timestamp(end_timestamp) - start).total_seconds()
+        step = max(60, int(window / max(1, settings.DIGEST_TIMELINE_BUCKETS)))
+        timeline = {}
+        for log in logs:
+            bucket = int((parse_timestamp(log.timestamp) - start).total_seconds() // step)
+            timeline.setdefault(bucket, Counter())[log.level or "unknown"] += 1
+        return {
+            "total": len(logs),
+            "start": start_timestamp,
+            "end": end_timestamp,
+            "interval": f"{step}s",
+            "timeline": [((start + timedelta(seconds=bucket * step)).isoformat(), sum(levels.values()), levels.most_common(3))
+                         for bucket, levels in sorted(timeline.items())],
+            "hosts": Counter(log.host_name for log in logs if log.host_name).most_common(top),
+            "levels": Counter(log.level for log in logs if log.level).most_common(top),
+            "status_codes": Counter(str(log.status_code) for log in logs if log.status_code is not None).most_common(top),
+            "error_paths": [],
+            "keywords": [],
+            "sample": logs[-sample_size:] if sample_size else [],
+        }
+
+class FakeIABackend:
+    """
+    Backend IA factice : renvoie un résumé fixe après une latence simulée,
+    et une erreur temporaire avec la probabilité error_rate.
+    Pour une requête regroupée (sections « ### <nonce>-S<n> »), renvoie une section par client.
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, summary: str = FAKE_SUMMARY):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.summary = summary
+        self.calls = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        _simulate_latency(self.latency, self.jitter)
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+        if self.error_rate and random.random() < self.error_rate:
+            raise IABackendError("Erreur temporaire simulée du backend IA factice", retryable=True)
+        sections = PACK_SECTION_HEADER.findall(prompt)
+        if sections:
+            return "\n\n".join(f"### {nonce}-S{section}\n{self.summary}" for nonce, section in sections)
+        return self.summary
@@ -0,0 +1,120 @@
+"""
+Vérifie la répartition des clients entre plusieurs processus locaux de l'analyseur.
+
+Démarre un Elasticsearch factice (benchmarks/fake_es_server.py), lance plusieurs processus qui se
+partagent une liste de clients avec ShardCoordinator, puis vérifie que :
+- chaque client a un seul bail, détenu par une instance vivante, avec une répartition équilibrée;
+- après l'arrêt brutal d'une instance (SIGKILL), ses clients sont repris par les instances restantes;
+- après l'ajout d'une instance, une partie des clients lui est attribuée.
+
+Utilisation, depuis la racine du dépôt :
+    python -m benchmarks.sharding_demo --instances 3 --clients 300
+"""
+import argparse
+import logging
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import datetime
+
+from config import settings
+
+# Délais courts pour que le rééquilibrage soit observable en quelques secondes
+DEMO_SETTINGS = {
+    "SHARD_HEARTBEAT_INTERVAL_SECONDS": 0.5,
+    "SHARD_MEMBER_TTL_SECONDS": 2,
+    "SHARD_LEASE_TTL_SECONDS": 3,
+}
+
+def run_worker(args):
+    """
+    Processus d'analyse simulé : à chaque cycle, obtient ses clients auprès du ShardCoordinator.
+    """
+    settings.ES_HOST = args.es_host
+    settings.ES_USER = settings.ES_PASSWORD = None
+    for name, value in DEMO_SETTINGS.items():
+        setattr(settings, name, value)
+
+    from core.elasticsearch_client import ElasticsearchClient
+    from state_manager.shard_coordinator import ShardCoordinator
+
+    for logger in list(logging.root.manager.loggerDict.values()):
+        if isinstance(logger, logging.Logger):
+            logger.setLevel(logging.WARNING)
+
+    coordinator = ShardCoordinator(ElasticsearchClient(), instance_id=args.instance_id)
+    coordinator.start()
+    clients = [f"client-{index:05d}" for index in range(args.clients)]
+    try:
+        while True:
+            coordinator.claim(clients)
+            time.sleep(args.cycle_seconds)
+    finally:
+        coordinator.stop()
+
+def spawn(es_host: str, instance_id: str, args) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", "benchmarks.sharding_demo", "--worker", "--es-host", es_host,
+                             "--instance-id", instance_id, "--clients", str(args.clients),
+                             "--cycle-seconds", str(args.cycle_seconds)])
+
+def lease_holders(store) -> Counter:
+    """
+    Compte les baux non expirés par instance.
+    """
+    now_iso = datetime.utcnow().isoformat(timespec='milliseconds') + "Z"
+    holders = Counter()
+    for doc in store.documents(settings.ANALYSIS_STATE_INDEX):
+        if doc.get("doc_type") == "lease" and doc["expires_at"] > now_iso:
+            holders[doc["holder"]] += 1
+    return holders
+
+def check(store, expected_instances: set, client_count: int, label: str) -> bool:
+    holders = lease_holders(store)
+    ok = set(holders) == expected_instances and sum(holders.values()) == client_count
+    print(f"[{'OK' if ok else 'ÉCHEC'}] {label} : {dict(sorted(holders.items()))} ({sum(holders.values())}/{client_count} clients)")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="Démonstration de la répartition des clients entre instances.")
+    parser.add_argument("--instances", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--cycle-seconds", type=float, default=0.5)
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--es-host", help=argparse.SUPPRESS)
+    parser.add_argument("--instance-id", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        run_worker(args)
+        return
+
+    from benchmarks.fake_es_server import start_server
+    server, es_host, store = start_server()
+    settle = DEMO_SETTINGS["SHARD_MEMBER_TTL_SECONDS"] + DEMO_SETTINGS["SHARD_LEASE_TTL_SECONDS"] + 3 * args.cycle_seconds + 1
+
+    workers = {f"instance-{index}": spawn(es_host, f"instance-{index}", args) for index in range(args.instances)}
+    results = []
+    try:
+        time.sleep(settle)
+        results.append(check(store, set(workers), args.clients, f"{len(workers)} instances"))
+
+        victim = sorted(workers)[0]
+        workers.pop(victim).kill() # Arrêt brutal : ni libération des baux ni retrait de l'instance
+        time.sleep(settle)
+        results.append(check(store, set(workers), args.clients, f"après l'arrêt brutal de {victim}"))
+
+        newcomer = f"instance-{args.instances}"
+        workers[newcomer] = spawn(es_host, newcomer, args)
+        time.sleep(settle)
+        results.append(check(store, set(workers), args.clients, f"après l'ajout de {newcomer}"))
+    finally:
+        for worker in workers.values():
+            worker.terminate()
+        for worker in workers.values():
+            worker.wait()
+        server.shutdown()
+
+    sys.exit(0 if all(results) else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Générateur de journaux synthétiques au format filebeat (ECS) pour les benchmarks.
+"""
+import random
+from datetime import datetime, timedelta
+
+MESSAGES = [
+    "GET /api/v1/orders/{id} 503 in {ms}ms",
+    "Connection refused from 10.0.{a}.{b}:5432",
+    "User {id} authentication failed: invalid password",
+    "Request {id} timed out after {ms}ms",
+    "Cache miss for key session:{id}",
+    "java.lang.NullPointerException at com.example.Service.handle(Service.java:{a})",
+    "Disk usage at {a}% on /dev/sda1",
+    "Permission denied while opening /var/lib/app/{id}.lock",
+]
+LEVELS = ["info", "info", "info", "debug", "warn", "error"]
+MODULES = ["nginx", "system", "postgresql", "apache"]
+
+def generate_log(rng: random.Random, client_id: str, timestamp: datetime) -> dict:
+    """
+    Génère un document de journal filebeat pour un client à un instant donné.
+    """
+    message = rng.choice(MESSAGES).format(id=rng.randint(1, 10 ** 6), ms=rng.randint(1, 30000),
+                                          a=rng.randint(0, 255), b=rng.randint(0, 255))
+    log = {
+        "@timestamp": timestamp.isoformat(timespec='milliseconds') + "Z",
+        "message": message,
+        "log": {"level": rng.choice(LEVELS), "offset": rng.randint(0, 10 ** 9), "file": {"path": "/var/log/app.log"}},
+        "host": {"name": client_id, "hostname": client_id, "os": {"family": "debian", "kernel": "6.1.0"}},
+        "agent": {"type": "filebeat", "version": "8.13.0", "id": f"agent-{client_id}"},
+        "event": {"module": rng.choice(MODULES), "dataset": "app.log"},
+        "ecs": {"version": "8.0.0"},
+    }
+    if message.startswith("GET"):
+        log["http"] = {"response": {"status_code": rng.choice([200, 404, 500, 503])}}
+    if "authentication" in message:
+        log["tags"] = ["security"]
+    return log
+
+def generate_logs(count: int, client_id: str = "client-0", start: datetime = None,
+                  span_seconds: float = 300, seed: int = 42) -> list:
+    """
+    Génère count journaux pour un client, répartis régulièrement sur span_seconds à partir de start.
+    """
+    rng = random.Random(seed)
+    start = start or datetime.utcnow() - timedelta(seconds=span_seconds)
+    step = span_seconds / max(1, count)
+    return [generate_log(rng, client_id, start + timedelta(seconds=index * step)) for index in range(count)]
@@ -8,6 +8,16 @@ ES_PASSWORD = os.getenv("ES_PASSWORD", "")
 LOG_INDEX_PATTERN = os.getenv("LOG_INDEX_PATTERN", "filebeat-*")
 ANALYSIS_STATE_INDEX = os.getenv("ANALYSIS_STATE_INDEX", "ia-analysis-state")
 IA_RESULTS_INDEX = os.getenv("IA_RESULTS_INDEX", "ia-analysis-results")
+# Fichier mémorisant les index déjà vérifiés (avec leur mappage) entre deux exécutions, pour ne pas
+# les revérifier à chaque démarrage d'une exécution unique (--once). Vide = vérification à chaque démarrage
+INDEX_BOOTSTRAP_CACHE_PATH = os.getenv("INDEX_BOOTSTRAP_CACHE_PATH", "")
+# Résultats IA écrits dans un flux de données (data stream) : l'index de support actif est remplacé (rollover)
+# selon son âge ou sa taille, et les anciens sont supprimés après RESULTS_RETENTION (politique ILM).
+# Un index ordinaire IA_RESULTS_INDEX déjà existant (versions précédentes) continue d'être utilisé
+ENABLE_RESULTS_DATA_STREAM = os.getenv("ENABLE_RESULTS_DATA_STREAM", "True").lower() == "true"
+RESULTS_ROLLOVER_MAX_AGE = os.getenv("RESULTS_ROLLOVER_MAX_AGE", "7d")
+RESULTS_ROLLOVER_MAX_PRIMARY_SHARD_SIZE = os.getenv("RESULTS_ROLLOVER_MAX_PRIMARY_SHARD_SIZE", "25gb")
+RESULTS_RETENTION = os.getenv("RESULTS_RETENTION", "90d") # Vide = conservation illimitée
 
 # --- Parametre d'idientification du clients ---
 CLIENT_ID_FIELD = os.getenv("CLIENT_ID_FIELD", "host.name.keyword")
@@ -15,6 +25,21 @@ CLIENT_ID_FIELD = os.getenv("CLIENT_ID_FIELD", "host.name.keyword")
 
 # --- Paramétre de l'API ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+
+# Backend IA : « gemini » (par défaut) ou « http » (serveur de modèle compatible, par exemple local pour les tests de débit)
+IA_BACKEND = os.getenv("IA_BACKEND", "gemini").lower()
+IA_BACKEND_URL = os.getenv("IA_BACKEND_URL", "")
+
+# Limites de débit de l'API IA (0 = pas de limite)
+IA_REQUESTS_PER_MINUTE = float(os.getenv("IA_REQUESTS_PER_MINUTE", 60))
+IA_TOKENS_PER_MINUTE = float(os.getenv("IA_TOKENS_PER_MINUTE", 1000000))
+
+# Délai d'expiration par appel et nouveaux essais sur erreur temporaire (quota, indisponibilité)
+IA_REQUEST_TIMEOUT_SECONDS = float(os.getenv("IA_REQUEST_TIMEOUT_SECONDS", 60))
+IA_MAX_RETRIES = int(os.getenv("IA_MAX_RETRIES", 4))
+IA_RETRY_BASE_DELAY_SECONDS = float(os.getenv("IA_RETRY_BASE_DELAY_SECONDS", 1))
+IA_RETRY_MAX_DELAY_SECONDS = float(os.getenv("IA_RETRY_MAX_DELAY_SECONDS", 30))
 
 
 # Prompt pour l'analyse IA
@@ -31,13 +56,131 @@ Formalisez votre réponse sous forme de texte clair et lisible, en priorisant le
 Journaux à analyser:
 """
 
+# Prompt de la phase de synthèse (reduce) d'une analyse hiérarchique : fusionne les analyses partielles d'un arriéré
+MAP_REDUCE_REDUCE_PROMPT = """
+Les analyses ci-dessous portent chacune sur une partie consécutive des journaux d'un même client.
+Fusionnez-les en une seule analyse : regroupez les problèmes identiques signalés dans plusieurs parties
+(en précisant sur quelles périodes ils apparaissent), conservez pour chaque problème son niveau de gravité
+le plus élevé (critique, élevé, moyen, faible, informatif) et des suggestions d'actions correctives.
+
+Si aucune partie ne signale de problème significatif, indiquez «Aucun problème significatif détecté».
+Formalisez votre réponse sous forme de texte clair et lisible, en priorisant les problèmes critiques.
+
+Analyses partielles à fusionner:
+"""
+
 # --- Paramètres de comportement du script ---
-# Fréquence d'exécution de la boucle principale pour vérifier les nouveaux journaux
+# Intervalle initial de chaque client, et délai maximal entre deux recherches de nouveaux clients
 ANALYSIS_INTERVAL_SECONDS = int(os.getenv("ANALYSIS_INTERVAL_SECONDS", 300)) # 5 minutes
 
+# Planification par client : l'intervalle diminue quand de nouveaux journaux pertinents arrivent
+# (minimum en cas de retard) et augmente pour les clients silencieux, dans ces bornes
+SCHEDULER_MIN_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_MIN_INTERVAL_SECONDS", 30))
+SCHEDULER_MAX_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_MAX_INTERVAL_SECONDS", 1800))
+SCHEDULER_INTERVAL_GROWTH = float(os.getenv("SCHEDULER_INTERVAL_GROWTH", 1.5)) # Facteur appliqué aux clients sans nouveaux journaux
+SCHEDULER_MAX_CLIENTS_PER_ROUND = int(os.getenv("SCHEDULER_MAX_CLIENTS_PER_ROUND", 0)) # 0 = illimité; les plus en retard d'abord
+
 # Nombre maximal de messages de journal individuels à envoyer à l'IA en un seul lot
 MAX_LOGS_PER_BATCH = int(os.getenv("MAX_LOGS_PER_BATCH", 50)) 
 
+# Nombre maximal de lots analysés par client et par cycle (0 = illimité)
+# Les journaux restants sont repris au cycle suivant à partir du dernier lot traité
+MAX_BATCHES_PER_CLIENT_CYCLE = int(os.getenv("MAX_BATCHES_PER_CLIENT_CYCLE", 0))
+
+# Regroupement de plusieurs petits clients dans une même requête IA (une section par client dans le prompt
+# et dans la réponse). Les requêtes de moins de IA_PACK_CLIENT_MAX_TOKENS jetons attendent au plus
+# IA_PACK_LINGER_SECONDS d'être regroupées, dans la limite de IA_PACK_MAX_TOKENS jetons et IA_PACK_MAX_CLIENTS clients.
+# Utile seulement si plusieurs clients sont analysés en parallèle (ANALYSIS_WORKERS > 1, ou BACKFILL_WORKERS > 1 en rejeu)
+ENABLE_IA_PACKING = os.getenv("ENABLE_IA_PACKING", "False").lower() == "true"
+IA_PACK_CLIENT_MAX_TOKENS = int(os.getenv("IA_PACK_CLIENT_MAX_TOKENS", 500))
+IA_PACK_MAX_TOKENS = int(os.getenv("IA_PACK_MAX_TOKENS", 4000))
+IA_PACK_MAX_CLIENTS = int(os.getenv("IA_PACK_MAX_CLIENTS", 20))
+IA_PACK_LINGER_SECONDS = float(os.getenv("IA_PACK_LINGER_SECONDS", 0.2))
+
+# Consignes ajoutées au prompt d'une requête regroupée ({nonce} : identifiant aléatoire des en-têtes de la requête)
+IA_PACK_INSTRUCTIONS = """
+Les journaux ci-dessous proviennent de plusieurs clients indépendants. Les journaux de chaque client suivent
+une ligne d'en-tête de la forme « ### {nonce}-S1 », « ### {nonce}-S2 », etc. Analysez chaque section séparément,
+sans mélanger les clients. Répondez pour chaque section, dans le même ordre, par sa ligne d'en-tête exacte
+(par exemple « ### {nonce}-S1 ») suivie de son analyse au format demandé ci-dessus. N'omettez aucune section et n'ajoutez rien avant la première.
+"""
+
+# Analyse hiérarchique (map-reduce) des arriérés : quand une fenêtre contient plus d'une page de journaux,
+# jusqu'à MAP_REDUCE_MAX_LOGS journaux sont regroupés, découpés en morceaux chronologiques de MAP_REDUCE_CHUNK_LOGS
+# journaux analysés en parallèle, puis les analyses partielles sont fusionnées en un seul résultat (0 = désactivé)
+MAP_REDUCE_MAX_LOGS = int(os.getenv("MAP_REDUCE_MAX_LOGS", 20000))
+MAP_REDUCE_CHUNK_LOGS = int(os.getenv("MAP_REDUCE_CHUNK_LOGS", 1000))
+
+# Synthèse côté serveur des clients très actifs : quand la fenêtre d'un client contient plus d'une page et au moins
+# DIGEST_MIN_LOGS journaux pertinents, une seule requête d'agrégations (chronologie, hôtes, niveaux, codes HTTP,
+# chemins en erreur 5xx, termes significatifs) et un échantillon de DIGEST_SAMPLE_SIZE journaux récents
+# remplacent le transfert de tous les journaux. Prioritaire sur l'analyse hiérarchique
+ENABLE_LOG_DIGEST = os.getenv("ENABLE_LOG_DIGEST", "False").lower() == "true"
+DIGEST_MIN_LOGS = int(os.getenv("DIGEST_MIN_LOGS", 5000))
+DIGEST_SAMPLE_SIZE = int(os.getenv("DIGEST_SAMPLE_SIZE", 50))
+DIGEST_TOP_TERMS = int(os.getenv("DIGEST_TOP_TERMS", 5)) # Valeurs les plus fréquentes par agrégation
+DIGEST_TIMELINE_BUCKETS = int(os.getenv("DIGEST_TIMELINE_BUCKETS", 12)) # Nombre approximatif d'intervalles de la chronologie
+# Champs agrégés (de type keyword)
+DIGEST_HOST_FIELD = os.getenv("DIGEST_HOST_FIELD", "host.name.keyword")
+DIGEST_LEVEL_FIELD = os.getenv("DIGEST_LEVEL_FIELD", "log.level.keyword")
+DIGEST_STATUS_FIELD = os.getenv("DIGEST_STATUS_FIELD", "http.response.status_code")
+DIGEST_URL_FIELD = os.getenv("DIGEST_URL_FIELD", "url.path.keyword")
+
+# Durée de vie du point-in-time utilisé pour parcourir les journaux d'un client page par page
+PIT_KEEP_ALIVE = os.getenv("PIT_KEEP_ALIVE", "2m")
+
+
+# --- Paramètres du filtre local de pertinence (avant l'appel IA) ---
+# Mots-clés recherchés dans les messages, côté Elasticsearch et côté filtre local (séparés par des virgules)
+LOG_FILTER_KEYWORDS = [k.strip().lower() for k in os.getenv(
+    "LOG_FILTER_KEYWORDS",
+    "fail,failed,failure,failing,denied,refused,authentication,permission,timeout,timed out,unauthorized,forbidden,exception,fatal,panic"
+).split(',') if k.strip()]
+# Expressions régulières supplémentaires pour le filtre local (séparées par « ;; »)
+LOG_FILTER_REGEXES = [r for r in os.getenv("LOG_FILTER_REGEXES", "").split(';;') if r.strip()]
+ENABLE_LOG_FILTER = os.getenv("ENABLE_LOG_FILTER", "True").lower() == "true"
+LOG_FILTER_MIN_SCORE = float(os.getenv("LOG_FILTER_MIN_SCORE", 1)) # Score minimal pour qu'un journal soit envoyé à l'IA
+LOG_FILTER_MAX_LINES = int(os.getenv("LOG_FILTER_MAX_LINES", 200)) # Journaux les mieux classés envoyés à l'IA par lot (0 = pas de limite)
+
+# --- Paramètres du filtre statistique (avant l'appel IA) ---
+# Ligne de base par client (moyenne et variance exponentielles) du débit des journaux pertinents, et des journaux
+# d'erreur et d'avertissement par niveau, type de journal et hôte : un lot conforme à la ligne de base et sans
+# nouveau modèle de journal n'est pas envoyé à l'IA. Une synthèse côté serveur (ENABLE_LOG_DIGEST) est évaluée
+# sur ses agrégations (nombre total et niveaux) et les modèles de son échantillon. Un client sans nouveau journal
+# pertinent est observé avec un débit nul, et une alerte est envoyée si ce silence est anormal pour son débit habituel
+# (un client absent de la découverte, sans journal depuis ACTIVE_CLIENTS_LOOKBACK_TIME, n'est plus évalué)
+ENABLE_ANOMALY_GATE = os.getenv("ENABLE_ANOMALY_GATE", "False").lower() == "true"
+ANOMALY_EWMA_ALPHA = float(os.getenv("ANOMALY_EWMA_ALPHA", 0.1)) # Poids d'un nouveau lot dans la ligne de base
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", 3.0)) # Écart (en écarts types) au-delà duquel un débit est anormal
+ANOMALY_MIN_OBSERVATIONS = int(os.getenv("ANOMALY_MIN_OBSERVATIONS", 10)) # Lots toujours analysés avant de filtrer (apprentissage)
+ANOMALY_MIN_STDDEV = float(os.getenv("ANOMALY_MIN_STDDEV", 0.5)) # Écart type minimal, en journaux par minute
+ANOMALY_LEVELS = [l.strip().lower() for l in os.getenv(
+    "ANOMALY_LEVELS", "emergency,emerg,fatal,panic,critical,crit,alert,error,err,warning,warn").split(',') if l.strip()]
+ANOMALY_MAX_DIMENSIONS = int(os.getenv("ANOMALY_MAX_DIMENSIONS", 64)) # Débits suivis par client
+ANOMALY_MAX_TEMPLATES = int(os.getenv("ANOMALY_MAX_TEMPLATES", 1000)) # Modèles connus mémorisés par client
+ANOMALY_BASELINE_PATH = os.getenv("ANOMALY_BASELINE_PATH", "") # Fichier JSON des lignes de base (vide = mémoire uniquement)
+
+# --- Paramètres d'extraction de modèles de journaux (avant l'appel IA) ---
+# Regroupe les messages identiques à des valeurs variables près (ID, IP, nombres...) en une seule ligne
+ENABLE_TEMPLATE_MINING = os.getenv("ENABLE_TEMPLATE_MINING", "True").lower() == "true"
+TEMPLATE_SIMILARITY_THRESHOLD = float(os.getenv("TEMPLATE_SIMILARITY_THRESHOLD", 0.4)) # Similarité minimale pour rattacher un message à un modèle
+TEMPLATE_TREE_DEPTH = int(os.getenv("TEMPLATE_TREE_DEPTH", 4)) # Profondeur de l'arbre de préfixes
+TEMPLATE_MAX_CHILDREN = int(os.getenv("TEMPLATE_MAX_CHILDREN", 100)) # Nombre maximal d'enfants par nœud de l'arbre
+TEMPLATE_MAX_CLUSTERS = int(os.getenv("TEMPLATE_MAX_CLUSTERS", 5000)) # Nombre maximal de modèles conservés en mémoire
+TEMPLATE_EXAMPLES_PER_GROUP = int(os.getenv("TEMPLATE_EXAMPLES_PER_GROUP", 3)) # Valeurs d'exemple affichées par modèle
+
+# Budget de taille des journaux envoyés à l'IA (0 = pas de limite)
+LOG_PROMPT_MAX_BYTES = int(os.getenv("LOG_PROMPT_MAX_BYTES", 16000))
+LOG_PROMPT_MAX_TOKENS = int(os.getenv("LOG_PROMPT_MAX_TOKENS", 4000))
+
+
+# --- Paramètres du cache des résultats IA ---
+# Réutilise le résumé d'un lot dont les modèles de journaux et le prompt ont déjà été analysés
+ENABLE_IA_CACHE = os.getenv("ENABLE_IA_CACHE", "True").lower() == "true"
+IA_CACHE_TTL_SECONDS = int(os.getenv("IA_CACHE_TTL_SECONDS", 3600)) # Durée de validité d'un résultat en cache
+IA_CACHE_MAX_ENTRIES = int(os.getenv("IA_CACHE_MAX_ENTRIES", 2000)) # Nombre maximal de résultats conservés (LRU)
+IA_CACHE_PATH = os.getenv("IA_CACHE_PATH", "") # Fichier SQLite pour conserver le cache entre les redémarrages (vide = mémoire uniquement)
+
 # Différence horaire par rapport à l'heure UTC actuelle pour la récupération initiale du journal
 # Utilisé si aucun état précédent n'est trouvé pour un client 
 INITIAL_LOOKBACK_SECONDS = int(os.getenv("INITIAL_LOOKBACK_SECONDS", 3600)) # 1 hour
@@ -45,6 +188,54 @@ INITIAL_LOOKBACK_SECONDS = int(os.getenv("INITIAL_LOOKBACK_SECONDS", 3600)) # 1
 # Période de temps pour rechercher les clients actifs 
 ACTIVE_CLIENTS_LOOKBACK_TIME = os.getenv("ACTIVE_CLIENTS_LOOKBACK_TIME", "24h")
 
+# Nombre de clients récupérés par page lors de la recherche des clients actifs (agrégation composite)
+CLIENT_DISCOVERY_PAGE_SIZE = int(os.getenv("CLIENT_DISCOVERY_PAGE_SIZE", 1000))
+
+
+# --- Paramètres d'exécution concurrente ---
+# Nombre de clients traités en parallèle par cycle (1 = traitement séquentiel)
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", 1))
+
+# Nombre maximal d'opérations simultanées par étape du pipeline
+ES_FETCH_CONCURRENCY = int(os.getenv("ES_FETCH_CONCURRENCY", 4)) # Récupération des journaux depuis Elasticsearch
+ES_WRITE_CONCURRENCY = int(os.getenv("ES_WRITE_CONCURRENCY", 2)) # Requêtes bulk d'écriture (résultats IA, états, journal d'écriture), partagées par instance
+IA_CONCURRENCY = int(os.getenv("IA_CONCURRENCY", 4)) # Appels simultanés à l'API IA
+
+# --- Paramètres du rejeu historique (main.py --backfill-start/--backfill-end) ---
+BACKFILL_SLICE_SECONDS = int(os.getenv("BACKFILL_SLICE_SECONDS", 3600)) # Durée d'une tranche (unité de parallélisme et de reprise)
+BACKFILL_WORKERS = int(os.getenv("BACKFILL_WORKERS", 8)) # Tranches analysées en parallèle (appels IA bornés par IA_CONCURRENCY)
+
+# --- Paramètres de répartition des clients entre plusieurs instances ---
+# Les instances se partagent les clients par hachage cohérent, avec baux et battements de cœur dans l'index d'état
+SHARDING_ENABLED = os.getenv("SHARDING_ENABLED", "False").lower() == "true"
+INSTANCE_ID = os.getenv("INSTANCE_ID", "") # Vide : nom d'hôte, PID et suffixe aléatoire
+SHARD_HEARTBEAT_INTERVAL_SECONDS = float(os.getenv("SHARD_HEARTBEAT_INTERVAL_SECONDS", 10))
+SHARD_MEMBER_TTL_SECONDS = float(os.getenv("SHARD_MEMBER_TTL_SECONDS", 30)) # Instance considérée arrêtée sans battement de cœur
+SHARD_LEASE_TTL_SECONDS = float(os.getenv("SHARD_LEASE_TTL_SECONDS", 60)) # Bail repris par une autre instance après expiration
+SHARD_VIRTUAL_NODES = int(os.getenv("SHARD_VIRTUAL_NODES", 64))
+
+# --- Paramètres d'écriture groupée des résultats IA ---
+# Le tampon est envoyé par requête bulk dès que l'un des seuils est atteint
+RESULTS_BULK_MAX_DOCS = int(os.getenv("RESULTS_BULK_MAX_DOCS", 200))
+RESULTS_BULK_MAX_BYTES = int(os.getenv("RESULTS_BULK_MAX_BYTES", 5 * 1024 * 1024))
+RESULTS_BULK_FLUSH_INTERVAL_SECONDS = float(os.getenv("RESULTS_BULK_FLUSH_INTERVAL_SECONDS", 5))
+RESULTS_BULK_MAX_RETRIES = int(os.getenv("RESULTS_BULK_MAX_RETRIES", 3)) # Nouveaux essais des éléments en échec temporaire
+
+# --- Paramètres du journal d'écriture local ---
+# Les résultats IA et les états d'analyse sont ajoutés à un journal sur disque puis rejoués vers Elasticsearch
+# en arrière-plan : rien n'est perdu si Elasticsearch est indisponible. Vide = écriture directe, sans journal
+SPOOL_DIR = os.getenv("SPOOL_DIR", "")
+SPOOL_MAX_BYTES = int(os.getenv("SPOOL_MAX_BYTES", 256 * 1024 * 1024)) # Au-delà, l'analyse attend la relecture
+SPOOL_SEGMENT_BYTES = int(os.getenv("SPOOL_SEGMENT_BYTES", 16 * 1024 * 1024)) # Taille d'un fichier segment
+SPOOL_MAX_BACKOFF_SECONDS = float(os.getenv("SPOOL_MAX_BACKOFF_SECONDS", 60)) # Délai maximal entre deux essais de relecture
+SPOOL_CLOSE_TIMEOUT_SECONDS = float(os.getenv("SPOOL_CLOSE_TIMEOUT_SECONDS", 30)) # Attente de la relecture à l'arrêt
+
+# --- Paramètres des métriques ---
+# Point d'accès HTTP local exposant les métriques par étape au format Prometheus (/metrics)
+ENABLE_METRICS = os.getenv("ENABLE_METRICS", "True").lower() == "true"
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+
 
 # --- Paramètres de notification par e-mail ---
 ENABLE_EMAIL_NOTIFICATIONS = os.getenv("ENABLE_EMAIL_NOTIFICATIONS", "False").lower() == "true"
@@ -55,6 +246,12 @@ SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", None)
 EMAIL_FROM = os.getenv("EMAIL_FROM", "ia-analyzer@yourdomain.com")
 EMAIL_TO = os.getenv("EMAIL_TO", "admin@yourdomain.com").split(',') 
 EMAIL_SUBJECT_PREFIX = os.getenv("EMAIL_SUBJECT_PREFIX", "[IA Log Analyzer Alert]")
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", 30))
+
+# Regroupement des alertes client dans un e-mail de synthèse envoyé au plus tard après cette fenêtre
+ALERT_COALESCE_WINDOW_SECONDS = float(os.getenv("ALERT_COALESCE_WINDOW_SECONDS", 60))
+# Une alerte identique à la précédente pour le même client n'est pas renvoyée pendant cette durée
+ALERT_DEDUP_SECONDS = float(os.getenv("ALERT_DEDUP_SECONDS", 3600))
 
 # Niveaux de gravité qui déclenchent une alerte par e-mail
 ALERT_SEVERITIES = [s.strip().lower() for s in os.getenv("ALERT_SEVERITIES", "critical,high").split(',')]
\ No newline at end of file
@@ -0,0 +1,116 @@
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from config import settings
+from utils.time_utils import parse_timestamp
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+def _utc_iso(moment: datetime) -> str:
+    return moment.replace(tzinfo=None).isoformat(timespec='milliseconds') + "Z"
+
+def default_job_id(client_ids: list, start_timestamp: str, end_timestamp: str) -> str:
+    """
+    Nom par défaut d'un rejeu, déterministe : relancer la même commande reprend le même rejeu.
+    """
+    key = "\n".join([start_timestamp, end_timestamp, *sorted(client_ids)])
+    return "backfill-" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
+def split_slices(start_timestamp: str, end_timestamp: str, slice_seconds: int) -> list:
+    """
+    Découpe [start_timestamp, end_timestamp[ en tranches consécutives [début, fin[ d'au plus slice_seconds secondes.
+    """
+    start = parse_timestamp(start_timestamp)
+    end = parse_timestamp(end_timestamp)
+    step = timedelta(seconds=max(1, slice_seconds))
+    slices = []
+    while start < end:
+        slice_end = min(start + step, end)
+        slices.append((_utc_iso(start), _utc_iso(slice_end)))
+        start = slice_end
+    return slices
+
+class BackfillRunner:
+    """
+    Rejeu historique : analyse une période passée pour une liste de clients, par exemple après une modification
+    du prompt ou pour un nouveau client, sans toucher à l'état d'analyse de la boucle principale.
+
+    La période est découpée en tranches de slice_seconds par client, analysées en parallèle par workers threads
+    (AnalysisPipeline.analyze_window) : les appels IA partagent les limites de débit et de concurrence
+    d'IAApiHandler, et les résultats passent par l'écriture groupée. Chaque tranche terminée est enregistrée
+    (BackfillCheckpoints) une fois ses résultats écrits : un rejeu interrompu reprend aux tranches restantes.
+    """
+    def __init__(self, pipeline, result_writer, checkpoints,
+                 slice_seconds: int = settings.BACKFILL_SLICE_SECONDS,
+                 workers: int = settings.BACKFILL_WORKERS):
+        self.pipeline = pipeline
+        self.result_writer = result_writer
+        self.checkpoints = checkpoints
+        self.slice_seconds = slice_seconds
+        self.workers = max(1, workers)
+
+    def run(self, client_ids: list, start_timestamp: str, end_timestamp: str) -> dict:
+        """
+        Analyse les tranches restantes du rejeu. Renvoie {"slices": tranches du rejeu, "skipped": déjà terminées,
+        "completed": terminées par cette exécution, "failed": en échec (à reprendre), "batches", "logs"}.
+        """
+        slices = [(client_id, slice_start, slice_end)
+                  for client_id in client_ids
+                  for slice_start, slice_end in split_slices(start_timestamp, end_timestamp, self.slice_seconds)]
+        done = self.checkpoints.completed([(client_id, slice_start) for client_id, slice_start, _ in slices])
+        pending = [entry for entry in slices if entry[:2] not in done]
+        summary = {"slices": len(slices), "skipped": len(slices) - len(pending), "completed": 0, "failed": 0, "batches": 0, "logs": 0}
+        logger.info(f"Rejeu '{self.checkpoints.job_id}' : {len(pending)} tranches à analyser sur {len(slices)} "
+                     f"({len(client_ids)} clients, du {start_timestamp} au {end_timestamp}).")
+
+        started = time.monotonic()
+        failed_clients = set() # Clients dont un résultat n'a pas été écrit pendant ce rejeu
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ia-backfill") as executor:
+            futures = {executor.submit(self._run_slice, *entry): entry for entry in pending}
+            for future in as_completed(futures):
+                client_id, slice_start, slice_end = futures[future]
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    logger.error(f"Échec de la tranche {slice_start} -> {slice_end} du client '{client_id}': {e}", exc_info=True)
+                    summary["failed"] += 1
+                    continue
+                summary["batches"] += outcome["batches"]
+                summary["logs"] += outcome["logs"]
+                if outcome["failed"] or not outcome["exhausted"]:
+                    summary["failed"] += 1
+                    continue
+                # Le point de reprise n'est écrit qu'après les résultats de la tranche, et seulement s'ils l'ont tous été.
+                # Un résultat non écrit peut appartenir à n'importe quelle tranche en cours du client (envois
+                # d'arrière-plan) : aucune tranche de ce client n'est plus enregistrée pendant ce rejeu
+                failed_clients |= self.result_writer.flush()
+                if client_id in failed_clients:
+                    logger.error(f"Résultats non écrits pour le client '{client_id}', la tranche {slice_start} sera rejouée.")
+                    summary["failed"] += 1
+                    continue
+                try:
+                    self.checkpoints.mark_done(client_id, slice_start, slice_end, outcome)
+                except Exception as e:
+                    logger.error(f"Impossible d'enregistrer la tranche {slice_start} du client '{client_id}', elle sera rejouée: {e}")
+                    summary["failed"] += 1
+                    continue
+                summary["completed"] += 1
+                logger.info(f"Rejeu : {summary['completed'] + summary['failed']}/{len(pending)} tranches traitées "
+                            f"({time.monotonic() - started:.0f}s).")
+        self.result_writer.flush()
+        logger.info(f"Rejeu '{self.checkpoints.job_id}' terminé : {summary}")
+        return summary
+
+    def _run_slice(self, client_id: str, slice_start: str, slice_end: str) -> dict:
+        logger.info(f"Rejeu de la tranche {slice_start} -> {slice_end} pour le client '{client_id}'.")
+        return self.pipeline.analyze_window(client_id, slice_start, slice_end, datetime.utcnow())
@@ -0,0 +1,189 @@
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+
+from elasticsearch.helpers import streaming_bulk
+
+from config import settings
+from utils import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Codes HTTP d'un élément bulk justifiant un nouvel essai (surcharge ou indisponibilité temporaire)
+RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+class BulkResultWriter:
+    """
+    Tampon d'écriture des documents de résultats IA. Les documents sont envoyés par requêtes bulk
+    dès qu'un seuil (nombre de documents, taille en octets ou ancienneté) est atteint, depuis un
+    thread d'arrière-plan. Seuls les éléments en échec temporaire sont renvoyés; les clients dont un résultat
+    est rejeté ou abandonné sont signalés par flush(), pour que leur état n'avance pas.
+    Avec un journal d'écriture (core.write_spool.WriteSpool), les documents y sont ajoutés avec un _id
+    et c'est le journal qui les écrit dans Elasticsearch.
+    """
+    def __init__(self, es_client, index_name: str = settings.IA_RESULTS_INDEX,
+                 max_docs: int = settings.RESULTS_BULK_MAX_DOCS,
+                 max_bytes: int = settings.RESULTS_BULK_MAX_BYTES,
+                 flush_interval: float = settings.RESULTS_BULK_FLUSH_INTERVAL_SECONDS,
+                 max_retries: int = settings.RESULTS_BULK_MAX_RETRIES,
+                 spool=None):
+        self.es_client = es_client
+        self.spool = spool
+        self.index_name = index_name
+        self.max_docs = max(1, max_docs)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._oldest = None # Instant d'arrivée du plus ancien document en attente
+        self._failed_clients = set() # Clients dont un résultat n'a pas été écrit depuis le dernier flush()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock() # Une seule requête bulk à la fois
+        self._closed = False
+        self._thread = None
+        if spool is None:
+            self._thread = threading.Thread(target=self._run, name="ia-results-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, ia_result_doc: dict):
+        """
+        Ajoute un document de résultat au tampon sans attendre son écriture.
+        """
+        if self.spool is not None:
+            # _id fixé à l'ajout : une relecture répétée du journal ne crée pas de doublon
+            self.spool.append({"_op_type": "create", "_index": self.index_name, "_id": uuid.uuid4().hex, "_source": ia_result_doc})
+            metrics.RESULTS_WRITTEN.inc(outcome="spooled")
+            return
+        doc_bytes = len(json.dumps(ia_result_doc, default=str).encode("utf-8"))
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Le tampon d'écriture des résultats IA est fermé.")
+            self._buffer.append(ia_result_doc)
+            self._buffer_bytes += doc_bytes
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if self._threshold_reached():
+                self._condition.notify()
+
+    def _threshold_reached(self) -> bool:
+        return len(self._buffer) >= self.max_docs or (self.max_bytes and self._buffer_bytes >= self.max_bytes)
+
+    def _run(self):
+        """
+        Boucle du thread d'arrière-plan : vide le tampon dès qu'un seuil est atteint.
+        """
+        while True:
+            with self._condition:
+                while not self._closed:
+                    if self._buffer and (self._threshold_reached() or time.monotonic() - self._oldest >= self.flush_interval):
+                        break
+                    timeout = self.flush_interval - (time.monotonic() - self._oldest) if self._buffer else None
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+            self._flush_buffer()
+
+    def flush(self) -> set:
+        """
+        Envoie immédiatement tous les documents en attente (avec un journal d'écriture : les écrit sur disque).
+        Renvoie les clients dont au moins un résultat a été rejeté par Elasticsearch ou abandonné après
+        RESULTS_BULK_MAX_RETRIES essais depuis le flush() précédent, y compris lors des envois d'arrière-plan.
+        Avec un journal d'écriture, c'est lui qui réessaie : l'ensemble renvoyé est vide.
+        """
+        if self.spool is not None:
+            self.spool.sync()
+            return set()
+        self._flush_buffer()
+        with self._condition:
+            failed_clients, self._failed_clients = self._failed_clients, set()
+        return failed_clients
+
+    def _flush_buffer(self):
+        with self._flush_lock:
+            with self._condition:
+                docs, self._buffer = self._buffer, []
+                self._buffer_bytes = 0
+                self._oldest = None
+            if docs:
+                self._send(docs)
+
+    def _send(self, docs: list):
+        """
+        Écrit les documents par requêtes bulk et renvoie uniquement les éléments en échec temporaire,
+        avec un délai exponentiel entre les essais.
+        """
+        started = time.perf_counter()
+        pending = docs
+        written = 0
+        for attempt in range(self.max_retries + 1):
+            # « create » : seule opération acceptée par un flux de données (identifiant attribué par Elasticsearch)
+            actions = [{"_op_type": "create", "_index": self.index_name, "_source": doc} for doc in pending]
+            retryable = []
+            try:
+                with self.es_client.write_slots:
+                    results = list(streaming_bulk(
+                        self.es_client.es, actions, chunk_size=self.max_docs, max_chunk_bytes=self.max_bytes or 100 * 1024 * 1024,
+                        raise_on_error=False, raise_on_exception=False, yield_ok=True
+                    ))
+                for doc, (ok, item) in zip(pending, results):
+                    if ok:
+                        written += 1
+                        continue
+                    info = next(iter(item.values()), {})
+                    status = info.get("status")
+                    if status is None or status in RETRYABLE_STATUSES:
+                        retryable.append(doc)
+                    else:
+                        self._mark_failed([doc])
+                        metrics.RESULTS_WRITTEN.inc(outcome="rejected")
+                        logger.error(f"Résultat IA rejeté par Elasticsearch pour le client '{doc.get('client_id', 'N/A')}' (statut {status}): {info.get('error')}")
+            except Exception as e:
+                logger.error(f"Erreur lors de l'écriture groupée des résultats IA: {e}", exc_info=True)
+                retryable = pending
+
+            if not retryable:
+                break
+            if attempt < self.max_retries:
+                metrics.RESULTS_WRITTEN.inc(len(retryable), outcome="retried")
+                delay = min(30, 2 ** attempt) * (0.5 + random.random() / 2)
+                logger.warning(f"{len(retryable)} résultats IA en échec temporaire, nouvel essai dans {delay:.1f}s.")
+                time.sleep(delay)
+            pending = retryable
+        else:
+            self._mark_failed(pending)
+            metrics.RESULTS_WRITTEN.inc(len(pending), outcome="dropped")
+            logger.error(f"{len(pending)} résultats IA abandonnés après {self.max_retries + 1} tentatives.")
+
+        metrics.RESULTS_WRITTEN.inc(written, outcome="ok")
+        metrics.STAGE_DURATION.observe(time.perf_counter() - started, stage="results_write")
+
+        logger.info(f"{written} résultats IA envoyés à l'index Elasticsearch '{self.index_name}' par requête bulk.")
+
+    def _mark_failed(self, docs: list):
+        with self._condition:
+            self._failed_clients.update(doc.get("client_id") for doc in docs if doc.get("client_id") is not None)
+
+    def close(self):
+        """
+        Arrête le thread d'arrière-plan et écrit les documents restants.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
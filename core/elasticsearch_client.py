@@ -1,9 +1,15 @@
+import hashlib
+import json
 import logging
-from elasticsearch import Elasticsearch
+import os
+import threading
+from elasticsearch import Elasticsearch, NotFoundError
 from elasticsearch.helpers import bulk
 from datetime import datetime, timedelta
 
 from config import settings
+from processors.log_record import LOG_SOURCE_FIELDS, LogRecord
+from utils.time_utils import parse_timestamp
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -15,9 +21,17 @@ if not logger.handlers:
     ch.setFormatter(formatter)
     logger.addHandler(ch)
 
+# Intervalles possibles de la chronologie de la synthèse (en secondes, format date_histogram)
+TIMELINE_INTERVALS = [(60, "1m"), (300, "5m"), (600, "10m"), (1800, "30m"), (3600, "1h"), (10800, "3h"),
+                      (21600, "6h"), (43200, "12h"), (86400, "1d")]
+
 class ElasticsearchClient:
     def __init__(self):
         self.es = self._connect_elasticsearch()
+        # Borne des requêtes bulk d'écriture simultanées, partagée par tous les composants qui écrivent avec ce client
+        self.write_slots = threading.BoundedSemaphore(max(1, settings.ES_WRITE_CONCURRENCY))
+        # Index déjà vérifiés (nom -> empreinte du mappage), voir create_index_if_not_exists
+        self._verified_indices = self._load_verified_indices() if settings.INDEX_BOOTSTRAP_CACHE_PATH else {}
 
     def _connect_elasticsearch(self):
         """Établit et renvoie une connexion client Elasticsearch."""
@@ -48,33 +62,99 @@ class ElasticsearchClient:
         Récupère une liste d'identifiants clients uniques à partir des journaux
         au cours d'une période spécifiée.
         """
+        return list(self.get_active_clients_with_latest(lookback_time))
+
+    def get_active_clients_with_latest(self, lookback_time: str = settings.ACTIVE_CLIENTS_LOOKBACK_TIME) -> dict:
+        """
+        Récupère tous les clients ayant des journaux pertinents au cours d'une période spécifiée,
+        avec l'horodatage de leur journal pertinent le plus récent (client_id -> horodatage ISO 8601).
+        Les clients sont parcourus page par page avec une agrégation composite, sans limite de nombre.
+        """
+        composite = {
+            "size": settings.CLIENT_DISCOVERY_PAGE_SIZE,
+            "sources": [{"client_id": {"terms": {"field": settings.CLIENT_ID_FIELD}}}]
+        }
         query_body = {
             "aggs": {
                 "unique_clients": {
-                    "terms": {
-                        "field": settings.CLIENT_ID_FIELD,
-                        "size": 1000 # Ajustez la taille en fonction du nombre maximum de clients attendus
+                    "composite": composite,
+                    "aggs": {
+                        "latest": {"max": {"field": "@timestamp", "format": "strict_date_optional_time"}}
                     }
                 }
             },
             "size": 0, # Nous n’avons besoin que d’agrégations, pas de documents réels
             "query": {
-                "range": {
-                    "@timestamp": {
-                        "gte": f"now-{lookback_time}",
-                        "lte": "now"
-                    }
+                "bool": {
+                    "filter": [
+                        {
+                            "range": {
+                                "@timestamp": {
+                                    "gte": f"now-{lookback_time}",
+                                    "lte": "now"
+                                }
+                            }
+                        }
+                    ],
+                    **self._relevance_clauses()
                 }
             }
         }
+        clients = {}
         try:
-            res = self.es.search(index=settings.LOG_INDEX_PATTERN, body=query_body)
-            clients = [bucket['key'] for bucket in res['aggregations']['unique_clients']['buckets']]
+            while True:
+                res = self.es.search(index=settings.LOG_INDEX_PATTERN, body=query_body)
+                aggregation = res['aggregations']['unique_clients']
+                for bucket in aggregation['buckets']:
+                    clients[bucket['key']['client_id']] = bucket['latest'].get('value_as_string')
+                if not aggregation['buckets'] or 'after_key' not in aggregation:
+                    break
+                composite["after"] = aggregation['after_key']
             logger.info(f"{len(clients)} clients actifs dans les journaux au cours des dernières {lookback_time}.")
-            return clients
         except Exception as e:
-            logger.error(f"Nous n’avons besoin que d’agrégations, pas de documents réels {e}", exc_info=True)
-            return []
+            logger.error(f"Erreur lors de la récupération des clients actifs ({len(clients)} récupérés avant l'erreur): {e}", exc_info=True)
+        return clients
+
+    def _relevance_clauses(self) -> dict:
+        """
+        Conditions « devrait » sélectionnant les journaux potentiellement erronés/suspects.
+        """
+        return {
+            "should": [
+                {"match": {"log.level": "error"}},
+                {"match": {"log.level": "warn"}},
+                # Mots-clés entiers (une requête « match » n'interprète pas les jokers comme *fail*)
+                {"match": {"message": " ".join(keyword for keyword in settings.LOG_FILTER_KEYWORDS if " " not in keyword)}},
+                *[{"match_phrase": {"message": keyword}} for keyword in settings.LOG_FILTER_KEYWORDS if " " in keyword],
+                {"range": {"http.response.status_code": {"gte": 500}}}, # Plus de générique pour HTTP 5xx
+                {"match": {"tags": "security"}},
+                {"match": {"tags": "error"}},
+                {"match": {"tags": "performance"}} # Balise de performance ajoutée
+            ],
+            "minimum_should_match": 1 # Au moins une condition « devrait » doit correspondre
+        }
+
+    def _client_logs_query(self, client_id: str, start_timestamp: str, end_timestamp: str = "now/s") -> dict:
+        """
+        Construit la requête des journaux pertinents d'un client sur une fenêtre [start_timestamp, end_timestamp[.
+        """
+        return {
+            "bool": {
+                "must": [
+                    {"term": {settings.CLIENT_ID_FIELD: client_id}}, # Filtrer par ID client spécifique
+                    {
+                        "range": {
+                            "@timestamp": {
+                                "gte": start_timestamp,
+                                "lt": end_timestamp, # Par défaut, obtenir les journaux jusqu'à la seconde actuelle
+                                "format": "strict_date_optional_time"
+                            }
+                        }
+                    }
+                ],
+                **self._relevance_clauses()
+            }
+        }
 
     def fetch_logs_for_client(self, client_id: str, start_timestamp: str) -> list:
         """
@@ -84,44 +164,15 @@ class ElasticsearchClient:
         query_body = {
             "size": settings.MAX_LOGS_PER_BATCH,
             "sort": [{"@timestamp": {"order": "asc"}}], 
-            "query": {
-                "bool": {
-                    "must": [
-                        {"term": {settings.CLIENT_ID_FIELD: client_id}}, # Filtrer par ID client spécifique
-                        {
-                            "range": {
-                                "@timestamp": {
-                                    "gte": start_timestamp,
-                                    "lt": "now/s", # Obtenir les journaux jusqu'à la seconde actuelle
-                                    "format": "strict_date_optional_time"
-                                }
-                            }
-                        }
-                    ],
-                    "should": [
-                        {"match": {"log.level": "error"}},
-                        {"match": {"log.level": "warn"}},
-                        {"match": {"message": "*fail*"}},
-                        {"match": {"message": "*denied*"}},
-                        {"match": {"message": "*refused*"}},
-                        {"match": {"message": "*authentication*"}},
-                        {"match": {"message": "*permission*"}},
-                        {"match": {"message": "*timeout*"}}, # Délai d'attente ajouté
-                        {"range": {"http.response.status_code": {"gte": 500}}}, # Plus de générique pour HTTP 5xx
-                        {"match": {"tags": "security"}},
-                        {"match": {"tags": "error"}},
-                        {"match": {"tags": "performance"}} # Balise de performance ajoutée
-                    ],
-                    "minimum_should_match": 1 # Au moins une condition « devrait » doit correspondre
-                }
-            }
+            "query": self._client_logs_query(client_id, start_timestamp),
+            "_source": LOG_SOURCE_FIELDS # Seuls les champs lus par l'analyseur
         }
 
         try:
-            res = self.es.search(index=settings.LOG_INDEX_PATTERN, body=query_body)
-            logs = [hit['_source'] for hit in res['hits']['hits']]
+            res = self.es.search(index=settings.LOG_INDEX_PATTERN, body=query_body, filter_path=["hits.hits._source"])
+            logs = [LogRecord.from_source(hit['_source']) for hit in res.get('hits', {}).get('hits', [])]
             if logs:
-                logger.info(f"Récupéré {len(logs)} journaux pour le client '{client_id}' depuis {logs[0].get('@timestamp')} à {logs[-1].get('@timestamp')}.")
+                logger.info(f"Récupéré {len(logs)} journaux pour le client '{client_id}' depuis {logs[0].timestamp} à {logs[-1].timestamp}.")
             else:
                 logger.debug(f"Aucun nouveau journal pertinent pour le client '{client_id}' depuis {start_timestamp}.")
             return logs
@@ -129,20 +180,220 @@ class ElasticsearchClient:
             logger.error(f"Erreur lors de la récupération des journaux pour le client '{client_id}' depuis Elasticsearch: {e}", exc_info=True)
             return []
 
+    def iter_logs_for_client(self, client_id: str, start_timestamp: str, end_timestamp: str = "now/s",
+                             page_size: int = settings.MAX_LOGS_PER_BATCH):
+        """
+        Parcourt tous les journaux pertinents d'un client par pages de taille fixe, à l'aide d'un
+        point-in-time et de search_after (départage par _shard_doc). La mémoire reste constante
+        quelle que soit la taille de la fenêtre.
+
+        Seuls les champs de LOG_SOURCE_FIELDS sont demandés, et la réponse est réduite à ces champs
+        et aux valeurs de tri (filter_path).
+
+        Génère des tuples (journaux de la page, sous forme de LogRecord, valeurs de tri du dernier journal de la page).
+        La première valeur de tri est l'horodatage du journal au format ISO 8601.
+        Les erreurs Elasticsearch sont propagées pour que l'appelant ne fasse pas avancer son état.
+        """
+        query = self._client_logs_query(client_id, start_timestamp, end_timestamp)
+        pit_id = self.es.open_point_in_time(index=settings.LOG_INDEX_PATTERN, keep_alive=settings.PIT_KEEP_ALIVE)['id']
+        search_after = None
+        page_count = 0
+        try:
+            while True:
+                query_body = {
+                    "size": page_size,
+                    "query": query,
+                    "pit": {"id": pit_id, "keep_alive": settings.PIT_KEEP_ALIVE},
+                    "sort": [
+                        {"@timestamp": {"order": "asc", "format": "strict_date_optional_time"}},
+                        {"_shard_doc": "asc"} # Départage stable au sein du point-in-time
+                    ],
+                    "track_total_hits": False,
+                    "_source": LOG_SOURCE_FIELDS # Seuls les champs lus par l'analyseur
+                }
+                if search_after:
+                    query_body["search_after"] = search_after
+
+                res = self.es.search(body=query_body, filter_path=["pit_id", "hits.hits._source", "hits.hits.sort"])
+                pit_id = res.get('pit_id', pit_id) # L'identifiant du PIT peut changer entre deux pages
+                hits = res.get('hits', {}).get('hits', []) # filter_path omet « hits » quand la page est vide
+                if not hits:
+                    break
+
+                page_count += 1
+                search_after = hits[-1]['sort']
+                logs = [LogRecord.from_source(hit['_source']) for hit in hits]
+                logger.info(f"Page {page_count}: récupéré {len(logs)} journaux pour le client '{client_id}' depuis {logs[0].timestamp} à {logs[-1].timestamp}.")
+                yield logs, search_after
+
+                if len(hits) < page_size:
+                    break
+        finally:
+            try:
+                self.es.close_point_in_time(id=pit_id)
+            except Exception as e:
+                logger.warning(f"Impossible de fermer le point-in-time pour le client '{client_id}': {e}")
+
+    def fetch_log_digest(self, client_id: str, start_timestamp: str, end_timestamp: str,
+                         sample_size: int = settings.DIGEST_SAMPLE_SIZE) -> dict:
+        """
+        Résume côté serveur les journaux pertinents d'un client sur [start_timestamp, end_timestamp[, en une seule
+        requête : nombre total, chronologie (date_histogram) avec les niveaux, hôtes, niveaux et codes HTTP les plus
+        fréquents, chemins des réponses 5xx, termes significatifs des messages (significant_text), et les
+        sample_size journaux les plus récents.
+        Renvoie un dictionnaire (voir LogProcessor.prepare_digest_for_ia), ou None en cas d'erreur
+        (par exemple un champ agrégé absent du mappage) : l'appelant se replie alors sur les journaux bruts.
+        """
+        top = settings.DIGEST_TOP_TERMS
+        try:
+            window = (parse_timestamp(end_timestamp) - parse_timestamp(start_timestamp)).total_seconds()
+        except ValueError:
+            window = 3600
+        target = window / max(1, settings.DIGEST_TIMELINE_BUCKETS)
+        interval = next((name for seconds, name in TIMELINE_INTERVALS if seconds >= target), TIMELINE_INTERVALS[-1][1])
+
+        query_body = {
+            "size": sample_size,
+            "sort": [{"@timestamp": {"order": "desc"}}], # Échantillon : journaux les plus récents
+            "_source": LOG_SOURCE_FIELDS,
+            "track_total_hits": True,
+            "query": self._client_logs_query(client_id, start_timestamp, end_timestamp),
+            "aggs": {
+                "timeline": {
+                    "date_histogram": {"field": "@timestamp", "fixed_interval": interval, "min_doc_count": 1},
+                    "aggs": {"levels": {"terms": {"field": settings.DIGEST_LEVEL_FIELD, "size": 3}}}
+                },
+                "hosts": {"terms": {"field": settings.DIGEST_HOST_FIELD, "size": top}},
+                "levels": {"terms": {"field": settings.DIGEST_LEVEL_FIELD, "size": top}},
+                "status_codes": {"terms": {"field": settings.DIGEST_STATUS_FIELD, "size": top}},
+                "server_errors": {
+                    "filter": {"range": {settings.DIGEST_STATUS_FIELD: {"gte": 500}}},
+                    "aggs": {"paths": {"terms": {"field": settings.DIGEST_URL_FIELD, "size": top}}}
+                },
+                # significant_text analyse le texte à la volée : limité à un échantillon par shard
+                "messages": {
+                    "sampler": {"shard_size": 200},
+                    "aggs": {"keywords": {"significant_text": {"field": "message", "size": top, "filter_duplicate_text": True}}}
+                }
+            }
+        }
+        try:
+            res = self.es.search(index=settings.LOG_INDEX_PATTERN, body=query_body,
+                                 filter_path=["hits.total", "hits.hits._source", "aggregations"])
+        except Exception as e:
+            logger.warning(f"Synthèse des journaux impossible pour le client '{client_id}', repli sur les journaux bruts: {e}")
+            return None
+
+        aggregations = res.get('aggregations', {})
+        def buckets(aggregation: dict) -> list:
+            return [(str(bucket.get('key_as_string', bucket['key'])), bucket['doc_count']) for bucket in aggregation.get('buckets', [])]
+
+        digest = {
+            "total": res['hits']['total']['value'],
+            "start": start_timestamp,
+            "end": end_timestamp,
+            "interval": interval,
+            "timeline": [
+                (bucket['key_as_string'], bucket['doc_count'], buckets(bucket.get('levels', {})))
+                for bucket in aggregations.get('timeline', {}).get('buckets', [])
+            ],
+            "hosts": buckets(aggregations.get('hosts', {})),
+            "levels": buckets(aggregations.get('levels', {})),
+            "status_codes": buckets(aggregations.get('status_codes', {})),
+            "error_paths": buckets(aggregations.get('server_errors', {}).get('paths', {})),
+            "keywords": [bucket['key'] for bucket in aggregations.get('messages', {}).get('keywords', {}).get('buckets', [])],
+            "sample": [LogRecord.from_source(hit['_source']) for hit in reversed(res['hits']['hits'])], # Ordre chronologique
+        }
+        logger.info(f"Synthèse de {digest['total']} journaux pertinents pour le client '{client_id}' depuis {start_timestamp} "
+                    f"({len(digest['sample'])} journaux d'échantillon).")
+        return digest
+
     def send_ia_results(self, ia_result_doc: dict):
         """
         Envoie le document de résultat d'analyse AI à un index Elasticsearch dédié.
         """
         try:
-            self.es.index(index=settings.IA_RESULTS_INDEX, document=ia_result_doc)
+            self.es.index(index=settings.IA_RESULTS_INDEX, document=ia_result_doc, op_type="create") # « create » : requis par les flux de données
             logger.info(f"Résultat de l'analyse IA envoyé à l'index Elasticsearch '{settings.IA_RESULTS_INDEX}' pour le client '{ia_result_doc.get('client_id', 'N/A')}'.")
         except Exception as e:
             logger.error(f"Erreur lors de l'envoi du résultat de l'analyse AI à Elasticsearch: {e}", exc_info=True)
 
+    def bootstrap_indices(self):
+        """
+        Prépare les index de l'analyseur au démarrage : flux de données des résultats IA
+        (ou index ordinaire si ENABLE_RESULTS_DATA_STREAM est désactivé) et index d'état.
+        """
+        if settings.ENABLE_RESULTS_DATA_STREAM:
+            self.create_data_stream_if_not_exists(settings.IA_RESULTS_INDEX, IA_RESULTS_MAPPING, results_lifecycle_policy())
+        else:
+            self.create_index_if_not_exists(settings.IA_RESULTS_INDEX, IA_RESULTS_MAPPING)
+        self.create_index_if_not_exists(settings.ANALYSIS_STATE_INDEX, ANALYSIS_STATE_MAPPING)
+
+    def create_data_stream_if_not_exists(self, name: str, mappings: dict, lifecycle_policy: dict = None):
+        """
+        Prépare un flux de données : politique ILM « <name>-policy » (lifecycle_policy), modèle d'index
+        « <name>-template » construit à partir du mappage, dont les index de support sont triés par client_id
+        puis @timestamp (les requêtes Kibana filtrées par client lisent des blocs contigus), puis création du flux.
+        La politique et le modèle sont mis à jour à chaque vérification : un flux existant les applique
+        à son prochain index de support. Comme pour create_index_if_not_exists, un flux déjà vérifié
+        avec la même configuration n'est pas revérifié.
+        Si name est un index ordinaire (créé par une version précédente), il est conservé tel quel;
+        si le cluster refuse ces opérations (droits, ILM indisponible), un index ordinaire est utilisé.
+        """
+        spec = {"mappings": mappings, "lifecycle": lifecycle_policy, "data_stream": True}
+        fingerprint = hashlib.sha1(json.dumps(spec, sort_keys=True).encode("utf-8")).hexdigest()
+        if self._verified_indices.get(name) == fingerprint:
+            logger.debug(f"Flux de données '{name}' déjà vérifié.")
+            return
+        index_settings = {"index.sort.field": ["client_id", "@timestamp"], "index.sort.order": ["asc", "desc"]}
+        complete = True
+        if lifecycle_policy:
+            try:
+                self.es.ilm.put_lifecycle(name=f"{name}-policy", policy=lifecycle_policy)
+                index_settings["index.lifecycle.name"] = f"{name}-policy"
+            except Exception as e:
+                complete = False # Nouvel essai au prochain démarrage
+                logger.warning(f"Impossible de créer la politique de cycle de vie '{name}-policy', pas de rollover ni de suppression automatique: {e}")
+        try:
+            self.es.indices.put_index_template(name=f"{name}-template", index_patterns=[name], data_stream={}, priority=200,
+                                               template={"settings": index_settings, "mappings": mappings})
+            try:
+                self.es.indices.get_data_stream(name=name)
+                logger.debug(f"Flux de données '{name}' existe déjà.")
+            except NotFoundError:
+                if self.es.indices.exists(index=name):
+                    logger.warning(f"'{name}' est un index ordinaire : il continue d'être utilisé, sans rollover. "
+                                   f"Pour passer au flux de données, réindexez-le (op_type create) dans un autre nom puis supprimez-le.")
+                else:
+                    self.es.indices.create_data_stream(name=name)
+                    logger.info(f"Flux de données '{name}' créé avec succès.")
+        except Exception as e:
+            logger.error(f"Erreur lors de la création du flux de données '{name}', repli sur un index ordinaire: {e}", exc_info=True)
+            self.create_index_if_not_exists(name, mappings)
+            return
+        if not complete:
+            return
+        self._verified_indices[name] = fingerprint
+        if settings.INDEX_BOOTSTRAP_CACHE_PATH:
+            self._save_verified_indices()
+
     def create_index_if_not_exists(self, index_name: str, mappings: dict = None):
         """
         Crée un index Elasticsearch avec des mappages facultatifs s'il n'existe pas déjà.
+        Un modèle d'index « <index_name>-template » porte aussi le mappage, pour qu'un index recréé
+        automatiquement par une écriture (par exemple relue depuis le journal d'écriture local) soit correct.
+        Un index déjà vérifié avec le même mappage (dans ce processus, ou lors d'une exécution précédente
+        si INDEX_BOOTSTRAP_CACHE_PATH est configuré) n'est pas revérifié.
         """
+        fingerprint = hashlib.sha1(json.dumps(mappings or {}, sort_keys=True).encode("utf-8")).hexdigest()
+        if self._verified_indices.get(index_name) == fingerprint:
+            logger.debug(f"Index '{index_name}' déjà vérifié.")
+            return
+        try:
+            self.es.indices.put_index_template(name=f"{index_name}-template", index_patterns=[index_name], priority=200,
+                                               template={"mappings": mappings or {}})
+        except Exception as e:
+            logger.warning(f"Impossible de créer le modèle d'index '{index_name}-template': {e}")
         try:
             if not self.es.indices.exists(index=index_name):
                 self.es.indices.create(index=index_name, mappings=mappings if mappings else {})
@@ -151,6 +402,43 @@ class ElasticsearchClient:
                 logger.debug(f"Index '{index_name}' existe déjà.")
         except Exception as e:
             logger.error(f"Erreur lors de la création de l'index '{index_name}': {e}", exc_info=True)
+            return
+        self._verified_indices[index_name] = fingerprint
+        if settings.INDEX_BOOTSTRAP_CACHE_PATH:
+            self._save_verified_indices()
+
+    @staticmethod
+    def _load_verified_indices() -> dict:
+        try:
+            with open(settings.INDEX_BOOTSTRAP_CACHE_PATH, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Impossible de lire les index déjà vérifiés depuis '{settings.INDEX_BOOTSTRAP_CACHE_PATH}': {e}")
+            return {}
+
+    def _save_verified_indices(self):
+        path = settings.INDEX_BOOTSTRAP_CACHE_PATH
+        try:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(self._verified_indices, f)
+            os.replace(path + ".tmp", path) # Remplacement atomique
+        except OSError as e:
+            logger.warning(f"Impossible d'enregistrer les index vérifiés dans '{path}': {e}")
+
+def results_lifecycle_policy() -> dict:
+    """
+    Politique ILM des résultats IA : rollover de l'index de support actif selon RESULTS_ROLLOVER_MAX_AGE
+    et RESULTS_ROLLOVER_MAX_PRIMARY_SHARD_SIZE, suppression RESULTS_RETENTION après le rollover.
+    """
+    phases = {"hot": {"actions": {"rollover": {
+        "max_age": settings.RESULTS_ROLLOVER_MAX_AGE,
+        "max_primary_shard_size": settings.RESULTS_ROLLOVER_MAX_PRIMARY_SHARD_SIZE,
+    }}}}
+    if settings.RESULTS_RETENTION:
+        phases["delete"] = {"min_age": settings.RESULTS_RETENTION, "actions": {"delete": {}}}
+    return {"phases": phases}
 
 # Exemple de mappage pour l'index des résultats d'analyse d'IA (ia-analysis-results)
 # Ce mappage améliore les performances d'indexation et de recherche pour des champs spécifiques
@@ -162,10 +450,25 @@ IA_RESULTS_MAPPING = {
         "client_id": {"type": "keyword"}, # Utilisez un mot-clé pour une correspondance exacte et des agrégations
         "ia_analysis_summary": {"type": "text"},
         "analyzed_log_count": {"type": "integer"},
+        "ia_log_count": {"type": "integer"},
         "source_hosts": {"type": "keyword"},
         "source_log_types": {"type": "keyword"},
         "script_name": {"type": "keyword"},
         "status": {"type": "keyword"},
+        "cached": {"type": "boolean"},
+        # Analyse hiérarchique d'un arriéré : morceaux analysés séparément puis fusionnés
+        "chunk_count": {"type": "integer"},
+        "log_digest": {"type": "boolean"}, # Analyse d'une synthèse côté serveur et d'un échantillon (client très actif)
+        "backfill_job": {"type": "keyword"}, # Nom du rejeu historique qui a produit le résultat
+        "chunks": {
+            "properties": {
+                "analysis_start_time": {"type": "date"},
+                "analysis_end_time": {"type": "date"},
+                "log_count": {"type": "integer"},
+                "ia_log_count": {"type": "integer"},
+                "cached": {"type": "boolean"}
+            }
+        },
         # Ajoutez ici tous les autres champs que vous attendez de la sortie de l'analyse IA
         "severity": {"type": "keyword"}, 
         "suggested_action": {"type": "text"}
@@ -178,6 +481,20 @@ ANALYSIS_STATE_MAPPING = {
         "analysis_timestamp": {"type": "date"},
         "client_id": {"type": "keyword"},
         "last_processed_timestamp": {"type": "date"},
-        "status": {"type": "keyword"}
+        "status": {"type": "keyword"},
+        # Battements de cœur des instances et baux des clients (répartition entre instances)
+        "doc_type": {"type": "keyword"},
+        "instance_id": {"type": "keyword"},
+        "holder": {"type": "keyword"},
+        "lease_client_id": {"type": "keyword"},
+        "heartbeat": {"type": "date"},
+        "renewed_at": {"type": "date"},
+        "expires_at": {"type": "date"},
+        # Points de reprise des rejeux historiques
+        "backfill_job": {"type": "keyword"},
+        "slice_start": {"type": "date"},
+        "slice_end": {"type": "date"},
+        "batches": {"type": "integer"},
+        "logs": {"type": "integer"}
     }
 }
\ No newline at end of file
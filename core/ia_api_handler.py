@@ -1,53 +1,305 @@
 import logging
-import google.generativeai as genai
-import json 
+import random
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 
 from config import settings
+from core.ia_backends import IABackendError, create_backend
+from core.ia_result_cache import IAResultCache
+from core.rate_limiter import TokenBucket
+from processors.log_processor import estimate_tokens
+from utils import metrics
 
 # Configure logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO) 
+logger.setLevel(logging.INFO)
 if not logger.handlers:
     ch = logging.StreamHandler()
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     ch.setFormatter(formatter)
     logger.addHandler(ch)
 
+class IAAnalysisError(Exception):
+    """
+    L'analyse IA a échoué définitivement (erreur non temporaire ou nouveaux essais épuisés).
+    """
+
+# En-tête d'une section client dans une requête regroupée et dans sa réponse : « ### <nonce>-S<n> », où le nonce
+# aléatoire est propre à la requête, pour qu'aucune ligne de journal ne puisse passer pour un en-tête
+PACK_SECTION_HEADER = re.compile(r"^\s*#{2,4}\s*([0-9a-f]{8})-S(\d+)\s*$", re.MULTILINE)
+# Ligne de journal ressemblant à un en-tête de section (avec ou sans nonce) : échappée avant l'envoi
+_HEADER_LIKE_LINE = re.compile(r"^(\s*)(#{2,4}\s*(?:\w+-)?S\d+\s*)$", re.MULTILINE)
+
+def _escape_headers(logs_data: str) -> str:
+    """
+    Échappe (« \\### S2 ») les lignes de journal qui ressemblent à un en-tête de section de requête regroupée.
+    """
+    return _HEADER_LIKE_LINE.sub(r"\1\\\2", logs_data)
+
+class _PackedRequest:
+    """
+    Requête IA d'un client en attente de regroupement avec celles d'autres clients.
+    """
+    __slots__ = ("logs_data", "prompt", "tokens", "queued_at", "future")
+
+    def __init__(self, logs_data: str, prompt: str, tokens: int):
+        self.logs_data = logs_data
+        self.prompt = prompt
+        self.tokens = tokens
+        self.queued_at = time.monotonic()
+        self.future = Future()
+
 class IAApiHandler:
-    def __init__(self):
-        self.ia_service = self._initialize_ia_service()
+    def __init__(self, backend=None, packing: bool = None, workers: int = None):
+        # Backend interchangeable : Gemini par défaut, ou un serveur de modèle local pour les tests de débit
+        self.ia_service = backend if backend is not None else self._initialize_ia_service()
+        self.result_cache = IAResultCache(
+            ttl_seconds=settings.IA_CACHE_TTL_SECONDS,
+            max_entries=settings.IA_CACHE_MAX_ENTRIES,
+            path=settings.IA_CACHE_PATH or None
+        ) if settings.ENABLE_IA_CACHE else None
+
+        # Limitation du débit (requêtes et jetons par minute) et du nombre d'appels simultanés
+        self.request_bucket = TokenBucket(settings.IA_REQUESTS_PER_MINUTE)
+        self.token_bucket = TokenBucket(settings.IA_TOKENS_PER_MINUTE)
+        self.in_flight = threading.BoundedSemaphore(max(1, settings.IA_CONCURRENCY))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, settings.IA_CONCURRENCY), thread_name_prefix="ia-call")
+
+        # Regroupement des petites requêtes de plusieurs clients (voir _analyze_packed)
+        self.packing = settings.ENABLE_IA_PACKING if packing is None else packing
+        # Threads appelants (workers du pipeline ou du rejeu historique) : chacun attend au plus une requête regroupée
+        self.workers = max(1, settings.ANALYSIS_WORKERS if workers is None else workers)
+        self._pack_condition = threading.Condition()
+        self._pack_queue = []
+        if self.packing:
+            if self.workers <= 1:
+                logger.warning("Regroupement des requêtes IA activé avec un seul worker : un seul client à la fois, aucune requête ne sera regroupée.")
+            threading.Thread(target=self._run_packer, name="ia-packer", daemon=True).start()
 
     def _initialize_ia_service(self):
-        """Initialise le client API AI sélectionné."""
-        if settings.GEMINI_API_KEY:
+        """Initialise le client API AI sélectionné (IA_BACKEND)."""
+        return create_backend(settings.IA_BACKEND)
+
+    def analyze_logs(self, logs_data: list, prompt: str, pack: bool = True) -> str:
+        """
+        Envoie les journaux formatés à l'IA pour analyse et renvoie le résumé.
+        Les petites requêtes sont regroupées avec celles d'autres clients si le regroupement est activé
+        (pack=False pour un appel depuis le pool d'appels IA, qui ne doit pas attendre le regroupement).
+        Lève IAAnalysisError si l'analyse échoue après les nouveaux essais.
+        """
+        if self.packing and pack:
+            tokens = estimate_tokens(logs_data)
+            if tokens <= settings.IA_PACK_CLIENT_MAX_TOKENS:
+                return self._analyze_packed(logs_data, prompt, tokens)
+        return self._run_analysis(logs_data, prompt)
+
+    def analyze_logs_cached(self, client_id: str, logs_data: list, prompt: str, templates: list, pack: bool = True) -> tuple:
+        """
+        Comme analyze_logs, mais réutilise le résumé d'un lot du même client déjà analysé avec les mêmes modèles
+        et le même prompt.
+        Renvoie un tuple (résumé, True si le résumé provient du cache).
+        Seules les analyses réussies sont mises en cache.
+        """
+        if self.result_cache is None:
+            return self.analyze_logs(logs_data, prompt, pack), False
+
+        fingerprint = self.result_cache.fingerprint(client_id, templates, prompt)
+        cached_summary = self.result_cache.get(fingerprint)
+        if cached_summary is not None:
+            logger.info(f"Résultat IA réutilisé depuis le cache (empreinte {fingerprint[:12]}).")
+            return cached_summary, True
+
+        summary = self.analyze_logs(logs_data, prompt, pack)
+        self.result_cache.put(fingerprint, summary)
+        return summary, False
+
+    def analyze_map_reduce(self, client_id: str, chunks: list, prompt: str, reduce_prompt: str = settings.MAP_REDUCE_REDUCE_PROMPT) -> tuple:
+        """
+        Analyse hiérarchique d'un arriéré. chunks est une liste de tuples (libellé, journaux formatés, modèles) :
+        les morceaux sont analysés en parallèle (phase map, bornée par IA_CONCURRENCY et les limites de débit),
+        puis leurs analyses partielles, précédées de leur libellé, sont fusionnées (phase reduce).
+        Si les analyses partielles dépassent le budget du prompt (LOG_PROMPT_MAX_TOKENS), elles sont fusionnées
+        par groupes, en parallèle, jusqu'à n'en garder qu'une.
+        Renvoie un tuple (résumé final, [(résumé partiel, True si repris du cache)] dans l'ordre des morceaux).
+        Lève IAAnalysisError si un appel échoue.
+        """
+        futures = [self._executor.submit(self.analyze_logs_cached, client_id, logs_data, prompt, templates, False) for _, logs_data, templates in chunks]
+        try:
+            partials = [future.result() for future in futures]
+        except IAAnalysisError:
+            for future in futures:
+                future.cancel()
+            raise
+
+        sections = [f"[{label}]\n{summary.strip()}" for (label, _, _), (summary, _) in zip(chunks, partials)]
+        level = 0
+        while len(sections) > 1:
+            groups = self._pack_sections(sections, settings.LOG_PROMPT_MAX_TOKENS)
+            level += 1
+            logger.info(f"Synthèse de {len(sections)} analyses partielles en {len(groups)} appel(s) (niveau {level}).")
+            futures = [self._executor.submit(self.analyze_logs_cached, client_id, "\n\n".join(group), reduce_prompt, group, False) for group in groups]
             try:
-                genai.configure(api_key=settings.GEMINI_API_KEY)
-                model = genai.GenerativeModel('gemini-2.0-flash')
-                logger.info("API Google Gemini initialisée.")
-                return model
-            except Exception as e:
-                logger.critical(f"Échec de l'initialisation de l'API Google Gemini: {e}")
+                merged = [future.result()[0] for future in futures]
+            except IAAnalysisError:
+                for future in futures:
+                    future.cancel()
                 raise
-        else:
-            logger.critical("Aucune clé API IA trouvée (GEMINI_API_KEY). Veuillez en configurer une.")
-            raise ValueError("Aucune clé API AI configurée.")
+            if len(merged) == 1:
+                return merged[0], partials
+            sections = [f"[Synthèse {index + 1}/{len(merged)}]\n{summary.strip()}" for index, summary in enumerate(merged)]
+        return partials[0][0] if partials else "", partials
 
-    def analyze_logs(self, logs_data: list, prompt: str) -> str:
+    @staticmethod
+    def _pack_sections(sections: list, max_tokens: int) -> list:
         """
-        Envoie les journaux formatés à l'IA pour analyse et renvoie le résumé..
+        Répartit des sections consécutives en groupes respectant max_tokens (0 = un seul groupe).
+        Chaque groupe en contient au moins deux, pour que chaque niveau de synthèse réduise leur nombre.
         """
-        if not self.ia_service:
-            logger.error("Service d'IA non initialisé. Impossible d'analyser les journaux.")
-            return "Échec de l'analyse de l'IA: service non initialisé."
-        full_prompt_content = f"{prompt}\n\n```logs\n{logs_data}\n```"
+        groups = []
+        current = []
+        current_tokens = 0
+        for section in sections:
+            section_tokens = estimate_tokens(section)
+            if len(current) >= 2 and max_tokens and current_tokens + section_tokens > max_tokens:
+                groups.append(current)
+                current, current_tokens = [], 0
+            current.append(section)
+            current_tokens += section_tokens
+        if len(current) == 1 and groups:
+            groups[-1].append(current[0])
+        elif current:
+            groups.append(current)
+        return groups
 
+    def _analyze_packed(self, logs_data: str, prompt: str, tokens: int) -> str:
+        """
+        Met la requête en file pour le regroupement et attend son résultat.
+        """
+        request = _PackedRequest(logs_data, prompt, tokens)
+        with self._pack_condition:
+            self._pack_queue.append(request)
+            self._pack_condition.notify()
+        return request.future.result()
+
+    def _run_packer(self):
+        """
+        Boucle du thread de regroupement : forme une requête dès que le budget (jetons ou clients) est atteint
+        (ou que tous les workers appelants attendent) ou que la plus ancienne requête a attendu IA_PACK_LINGER_SECONDS,
+        puis la confie au pool d'appels IA.
+        """
+        while True:
+            with self._pack_condition:
+                while True:
+                    if self._pack_queue:
+                        waited = time.monotonic() - self._pack_queue[0].queued_at
+                        queued_tokens = sum(request.tokens for request in self._pack_queue)
+                        # Chaque worker appelant attend au plus une requête : si tous attendent, aucune autre n'arrivera
+                        if (waited >= settings.IA_PACK_LINGER_SECONDS or queued_tokens >= settings.IA_PACK_MAX_TOKENS
+                                or len(self._pack_queue) >= min(settings.IA_PACK_MAX_CLIENTS, self.workers)):
+                            break
+                        self._pack_condition.wait(settings.IA_PACK_LINGER_SECONDS - waited)
+                    else:
+                        self._pack_condition.wait()
+                # Requêtes de même prompt, dans l'ordre d'arrivée et dans la limite du budget
+                pack = []
+                pack_tokens = 0
+                for request in list(self._pack_queue):
+                    if request.prompt != self._pack_queue[0].prompt or len(pack) >= settings.IA_PACK_MAX_CLIENTS:
+                        continue
+                    if pack and pack_tokens + request.tokens > settings.IA_PACK_MAX_TOKENS:
+                        continue
+                    pack.append(request)
+                    pack_tokens += request.tokens
+                self._pack_queue = [request for request in self._pack_queue if request not in pack]
+            self._executor.submit(self._run_pack, pack)
+
+    def _run_pack(self, pack: list):
+        """
+        Envoie une requête regroupée et répartit la réponse entre les clients. Un client dont la section
+        est absente ou vide est analysé de nouveau seul.
+        """
+        metrics.IA_PACK_SIZE.observe(len(pack))
+        if len(pack) == 1:
+            self._run_single(pack[0])
+            return
+
+        nonce = secrets.token_hex(4)
+        sections = "\n\n".join(f"### {nonce}-S{index}\n{_escape_headers(request.logs_data)}" for index, request in enumerate(pack, start=1))
         try:
-            if isinstance(self.ia_service, genai.GenerativeModel): 
-                response = self.ia_service.generate_content(full_prompt_content)
-                return response.text 
+            response = self._run_analysis(sections, f"{pack[0].prompt.rstrip()}\n{settings.IA_PACK_INSTRUCTIONS.format(nonce=nonce)}")
+        except Exception as e:
+            for request in pack:
+                request.future.set_exception(e)
+            return
+
+        parsed = self._split_sections(response, nonce)
+        retried = 0
+        for index, request in enumerate(pack, start=1):
+            summary = parsed.get(index)
+            if summary:
+                request.future.set_result(summary)
             else:
-                logger.error("Type de service IA inconnu.")
-                return "Échec de l'analyse de l'IA: type de service inconnu."
+                retried += 1
+                self._executor.submit(self._run_single, request)
+        metrics.IA_PACKED_SECTIONS.inc(len(pack) - retried, outcome="parsed")
+        if retried:
+            metrics.IA_PACKED_SECTIONS.inc(retried, outcome="retried")
+            logger.warning(f"{retried} sections sur {len(pack)} absentes de la réponse IA regroupée, clients analysés de nouveau séparément.")
+        logger.info(f"Requête IA regroupée pour {len(pack)} clients.")
+
+    def _run_single(self, request: _PackedRequest):
+        try:
+            request.future.set_result(self._run_analysis(request.logs_data, request.prompt))
         except Exception as e:
-            logger.error(f"Erreur lors de l'analyse de l'IA: {e}", exc_info=True)
-            return f"L'analyse de l'IA a échoué: {e}"
\ No newline at end of file
+            request.future.set_exception(e)
+
+    @staticmethod
+    def _split_sections(response: str, nonce: str) -> dict:
+        """
+        Découpe la réponse d'une requête regroupée selon les en-têtes « ### <nonce>-S<n> » de cette requête.
+        Renvoie {n: texte non vide}. Une section dont l'en-tête apparaît plusieurs fois est écartée :
+        son attribution est douteuse, le client est analysé de nouveau seul.
+        """
+        headers = [header for header in PACK_SECTION_HEADER.finditer(response) if header.group(1) == nonce]
+        sections = {}
+        duplicated = set()
+        for position, header in enumerate(headers):
+            index = int(header.group(2))
+            if index in sections:
+                duplicated.add(index)
+            end = headers[position + 1].start() if position + 1 < len(headers) else len(response)
+            sections[index] = response[header.end():end].strip()
+        return {index: text for index, text in sections.items() if text and index not in duplicated}
+
+    def _run_analysis(self, logs_data: list, prompt: str) -> str:
+        """
+        Appelle le modèle IA en respectant les limites de débit, avec délai d'expiration par appel
+        et nouveaux essais à délai exponentiel aléatoire sur les erreurs temporaires.
+        """
+        if not self.ia_service:
+            logger.error("Service d'IA non initialisé. Impossible d'analyser les journaux.")
+            raise IAAnalysisError("Échec de l'analyse de l'IA: service non initialisé.")
+        full_prompt_content = f"{prompt}\n\n```logs\n{logs_data}\n```"
+        prompt_tokens = estimate_tokens(full_prompt_content)
+
+        for attempt in range(settings.IA_MAX_RETRIES + 1):
+            waited = self.request_bucket.acquire(1) + self.token_bucket.acquire(prompt_tokens)
+            if waited:
+                metrics.IA_RATE_LIMIT_WAIT.inc(waited)
+            try:
+                with self.in_flight:
+                    summary = self.ia_service.generate(full_prompt_content, timeout=settings.IA_REQUEST_TIMEOUT_SECONDS)
+                metrics.IA_CALLS.inc(outcome="success")
+                return summary
+            except IABackendError as e:
+                metrics.IA_CALLS.inc(outcome="retryable_error" if e.retryable else "error")
+                if not e.retryable or attempt == settings.IA_MAX_RETRIES:
+                    logger.error(f"Erreur lors de l'analyse de l'IA (tentative {attempt + 1}): {e}")
+                    raise IAAnalysisError(f"L'analyse de l'IA a échoué: {e}") from e
+                delay = min(settings.IA_RETRY_MAX_DELAY_SECONDS, settings.IA_RETRY_BASE_DELAY_SECONDS * 2 ** attempt)
+                delay = random.uniform(0, delay) # Délai aléatoire (« full jitter ») pour étaler les nouveaux essais
+                logger.warning(f"Erreur temporaire de l'IA (tentative {attempt + 1}/{settings.IA_MAX_RETRIES + 1}), nouvel essai dans {delay:.1f}s: {e}")
+                time.sleep(delay)
@@ -0,0 +1,117 @@
+import json
+import logging
+import threading
+import urllib.error
+import urllib.request
+
+from config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+class IABackendError(Exception):
+    """
+    Erreur d'un backend IA. retryable indique si un nouvel essai a des chances de réussir
+    (quota dépassé, indisponibilité temporaire, délai d'expiration).
+    """
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+class GeminiBackend:
+    """
+    Backend Google Gemini (google.generativeai).
+    Le SDK (et sa pile grpc/protobuf) n'est importé qu'au premier appel, pour que le démarrage
+    du service (ou d'une exécution unique --once) ne paie pas son coût avant la première requête Elasticsearch.
+    """
+    def __init__(self, api_key: str = settings.GEMINI_API_KEY, model_name: str = settings.GEMINI_MODEL):
+        if not api_key:
+            logger.critical("Aucune clé API IA trouvée (GEMINI_API_KEY). Veuillez en configurer une.")
+            raise ValueError("Aucune clé API AI configurée.")
+        self.api_key = api_key
+        self.model_name = model_name
+        self.model = None
+        self.retryable_errors = (TimeoutError, ConnectionError)
+        self._init_lock = threading.Lock()
+
+    def _get_model(self):
+        """
+        Importe le SDK et initialise le modèle au premier appel (une seule fois, même depuis plusieurs threads).
+        """
+        with self._init_lock:
+            if self.model is not None:
+                return self.model
+            try:
+                import google.generativeai as genai
+                from google.api_core import exceptions as google_exceptions
+
+                genai.configure(api_key=self.api_key)
+                self.model = genai.GenerativeModel(self.model_name)
+            except Exception as e:
+                logger.critical(f"Échec de l'initialisation de l'API Google Gemini: {e}")
+                raise IABackendError(f"Échec de l'initialisation de l'API Gemini: {e}") from e
+            self.retryable_errors = (
+                google_exceptions.TooManyRequests,
+                google_exceptions.ResourceExhausted,
+                google_exceptions.ServiceUnavailable,
+                google_exceptions.InternalServerError,
+                google_exceptions.DeadlineExceeded,
+                TimeoutError,
+                ConnectionError,
+            )
+            logger.info("API Google Gemini initialisée.")
+            return self.model
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        model = self._get_model()
+        try:
+            response = model.generate_content(prompt, request_options={"timeout": timeout})
+            return response.text
+        except self.retryable_errors as e:
+            raise IABackendError(f"Erreur temporaire de l'API Gemini: {e}", retryable=True) from e
+        except Exception as e:
+            raise IABackendError(f"Erreur de l'API Gemini: {e}") from e
+
+class HttpBackend:
+    """
+    Backend HTTP générique : POST {"prompt": ...} vers IA_BACKEND_URL, réponse {"text": ...}.
+    Permet de brancher un serveur de modèle local (par exemple benchmarks/fake_ia_server.py)
+    pour les tests de débit.
+    """
+    def __init__(self, url: str = settings.IA_BACKEND_URL):
+        if not url:
+            raise ValueError("IA_BACKEND_URL doit être configurée pour le backend IA « http ».")
+        self.url = url
+        logger.info(f"Backend IA HTTP initialisé: {url}")
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({"prompt": prompt}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                return json.loads(response.read().decode("utf-8"))["text"]
+        except urllib.error.HTTPError as e:
+            raise IABackendError(f"Erreur HTTP {e.code} du backend IA", retryable=e.code == 429 or e.code >= 500) from e
+        except (urllib.error.URLError, TimeoutError, ConnectionError) as e:
+            raise IABackendError(f"Backend IA injoignable: {e}", retryable=True) from e
+        except (KeyError, ValueError) as e:
+            raise IABackendError(f"Réponse invalide du backend IA: {e}") from e
+
+def create_backend(name: str = settings.IA_BACKEND):
+    """
+    Instancie le backend IA configuré (IA_BACKEND).
+    """
+    backends = {"gemini": GeminiBackend, "http": HttpBackend}
+    if name not in backends:
+        raise ValueError(f"Backend IA inconnu: '{name}' (valeurs possibles: {', '.join(backends)}).")
+    return backends[name]()
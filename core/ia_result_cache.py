@@ -0,0 +1,126 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+class IAResultCache:
+    """
+    Cache des résumés IA indexé par l'empreinte normalisée d'un lot (client, ensemble trié des modèles + hash du prompt).
+    Éviction LRU au-delà de max_entries, expiration après ttl_seconds, et stockage SQLite facultatif
+    pour survivre aux redémarrages.
+    """
+    def __init__(self, ttl_seconds: int, max_entries: int, path: str = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # empreinte -> (résumé, horodatage de création), du moins au plus récemment utilisé
+        self._lock = threading.Lock()
+        self._db = self._open_store(path) if path else None
+
+    @staticmethod
+    def fingerprint(client_id: str, templates: list, prompt: str) -> str:
+        """
+        Calcule l'empreinte d'un lot : indépendante de l'ordre et du nombre d'occurrences des modèles.
+        Le client en fait partie : un résumé cite les valeurs réelles des journaux (adresses IP, utilisateurs...)
+        et ne doit jamais être réutilisé pour un autre client dont les journaux donnent les mêmes modèles.
+        """
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        client_hash = hashlib.sha256(client_id.encode("utf-8")).hexdigest()
+        normalized = "\n".join(sorted(set(templates)))
+        return hashlib.sha256(f"{client_hash}\n{prompt_hash}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _open_store(self, path: str):
+        """
+        Ouvre le stockage SQLite et recharge en mémoire les entrées non expirées les plus récentes.
+        """
+        try:
+            db = sqlite3.connect(path, check_same_thread=False)
+            db.execute("CREATE TABLE IF NOT EXISTS ia_results (fingerprint TEXT PRIMARY KEY, summary TEXT NOT NULL, created_at REAL NOT NULL)")
+            db.execute("DELETE FROM ia_results WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            rows = db.execute(
+                "SELECT fingerprint, summary, created_at FROM ia_results ORDER BY created_at DESC LIMIT ?",
+                (self.max_entries,)
+            ).fetchall()
+            db.commit()
+            for fingerprint, summary, created_at in reversed(rows):
+                self._entries[fingerprint] = (summary, created_at)
+            logger.info(f"Cache des résultats IA chargé depuis '{path}': {len(rows)} entrées.")
+            return db
+        except Exception as e:
+            logger.error(f"Impossible d'ouvrir le cache des résultats IA '{path}', cache en mémoire uniquement: {e}", exc_info=True)
+            return None
+
+    def get(self, fingerprint: str):
+        """
+        Renvoie le résumé en cache pour une empreinte, ou None (absent ou expiré).
+        """
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+                self._remove(fingerprint)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(fingerprint)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, fingerprint: str, summary: str):
+        """
+        Enregistre le résumé d'un lot, en évinçant les entrées les moins récemment utilisées si besoin.
+        """
+        created_at = time.time()
+        with self._lock:
+            self._entries[fingerprint] = (summary, created_at)
+            self._entries.move_to_end(fingerprint)
+            self._store("INSERT OR REPLACE INTO ia_results (fingerprint, summary, created_at) VALUES (?, ?, ?)",
+                        (fingerprint, summary, created_at))
+            while len(self._entries) > self.max_entries:
+                oldest, _ = self._entries.popitem(last=False)
+                self._store("DELETE FROM ia_results WHERE fingerprint = ?", (oldest,))
+                self.evictions += 1
+
+    def _remove(self, fingerprint: str):
+        self._entries.pop(fingerprint, None)
+        self._store("DELETE FROM ia_results WHERE fingerprint = ?", (fingerprint,))
+
+    def _store(self, statement: str, params: tuple):
+        """
+        Répercute une modification sur le stockage SQLite (appelé sous verrou).
+        """
+        if self._db is None:
+            return
+        try:
+            self._db.execute(statement, params)
+            self._db.commit()
+        except Exception as e:
+            logger.warning(f"Échec de l'écriture dans le cache des résultats IA '{self.path}': {e}")
+
+    def stats(self) -> dict:
+        """
+        Renvoie les compteurs du cache pour mesurer les appels IA économisés.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "evictions": self.evictions
+            }
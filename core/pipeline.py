@@ -0,0 +1,454 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from datetime import datetime
+
+from config import settings
+from core.ia_api_handler import IAAnalysisError
+from processors.anomaly_gate import AnomalyGate
+from processors.log_filter import LogRelevanceScorer
+from processors.log_processor import estimate_tokens
+from utils import metrics
+from utils.time_utils import parse_timestamp
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+class AnalysisPipeline:
+    """
+    Enchaîne les étapes d'analyse d'un client (récupération ES, appel IA, écriture ES, état)
+    et exécute un cycle complet, séquentiellement ou via un pool de workers.
+    """
+    def __init__(self, es_client, ia_handler, log_processor, state_manager, notifier, result_writer, backfill_job: str = None):
+        self.es_client = es_client
+        self.ia_handler = ia_handler
+        self.log_processor = log_processor
+        self.state_manager = state_manager
+        self.notifier = notifier
+        self.result_writer = result_writer
+        self.log_filter = LogRelevanceScorer() if settings.ENABLE_LOG_FILTER else None
+        # Rejeu historique (voir core/backfill.py) : résultats marqués avec le nom du rejeu, sans filtre statistique
+        # (qui fausserait la ligne de base des clients) ni alerte sur des journaux passés
+        self.backfill_job = backfill_job
+        self.anomaly_gate = AnomalyGate() if settings.ENABLE_ANOMALY_GATE and backfill_job is None else None
+        self.workers = max(1, settings.ANALYSIS_WORKERS)
+
+        # Concurrence bornée par étape, indépendamment de la taille du pool
+        self.fetch_slots = threading.BoundedSemaphore(max(1, settings.ES_FETCH_CONCURRENCY))
+        # Les appels IA sont bornés par IAApiHandler (IA_CONCURRENCY, limites de débit)
+        # Les écritures par requêtes bulk (résultats, états, journal d'écriture) sont bornées par es_client.write_slots
+        # (ES_WRITE_CONCURRENCY)
+
+    def run_cycle(self, client_ids, cycle_time: datetime, outcomes: dict = None) -> dict:
+        """
+        Traite tous les clients actifs pour un cycle. Avec ANALYSIS_WORKERS > 1, les clients
+        sont traités en parallèle; les étapes d'un même client restent ordonnées.
+        client_ids peut être un dictionnaire client_id -> horodatage du dernier journal pertinent
+        (voir ElasticsearchClient.get_active_clients_with_latest) : les clients sans journal plus
+        récent que leur état sont alors ignorés pour ce cycle.
+        Renvoie le résultat de chaque client traité (voir process_client), dans outcomes s'il est fourni :
+        ce dictionnaire est rempli même si le cycle lève une exception.
+        """
+        outcomes = {} if outcomes is None else outcomes
+        global_analysis_end_time = cycle_time.isoformat(timespec='milliseconds') + "Z"
+
+        # Chargement de l'état de tous les clients en une requête, écriture groupée en fin de cycle
+        with metrics.stage_timer("state_load"):
+            self.state_manager.load_states(list(client_ids))
+        if isinstance(client_ids, dict):
+            due_clients = self._clients_with_new_logs(client_ids)
+            idle_clients = set(client_ids) - set(due_clients)
+            for client_id in idle_clients:
+                outcomes[client_id] = {"batches": 0, "logs": 0, "exhausted": True, "failed": False}
+            self._evaluate_silence(idle_clients, global_analysis_end_time)
+            client_ids = due_clients
+        try:
+            self._run_clients(client_ids, cycle_time, global_analysis_end_time, outcomes)
+        finally:
+            # Les résultats sont écrits avant l'état pour ne pas faire avancer l'état sur des résultats non écrits
+            failed_clients = self.result_writer.flush()
+            if failed_clients:
+                logger.error(f"Résultats IA non écrits pour {len(failed_clients)} clients : leur état n'avance pas pour ce cycle.")
+                self.state_manager.discard_updates(failed_clients)
+                for client_id in failed_clients:
+                    if client_id in outcomes:
+                        outcomes[client_id]["failed"] = True
+            with metrics.stage_timer("state_write"):
+                self.state_manager.flush()
+            if self.anomaly_gate is not None:
+                self.anomaly_gate.save()
+            if self.ia_handler.result_cache is not None:
+                logger.info(f"Cache des résultats IA: {self.ia_handler.result_cache.stats()}")
+        return outcomes
+
+    def _clients_with_new_logs(self, latest_timestamps: dict) -> list:
+        """
+        Filtre les clients dont le dernier journal pertinent est plus récent que leur état d'analyse.
+        """
+        due_clients = []
+        for client_id, latest_timestamp in latest_timestamps.items():
+            checkpoint = self.state_manager.peek_last_analysis_timestamp(client_id)
+            if checkpoint and latest_timestamp:
+                try:
+                    if parse_timestamp(latest_timestamp) <= parse_timestamp(checkpoint):
+                        continue
+                except ValueError:
+                    logger.warning(f"Horodatage illisible pour le client '{client_id}' ({latest_timestamp} / {checkpoint}), client traité.")
+            due_clients.append(client_id)
+        logger.info(f"{len(due_clients)} clients avec de nouveaux journaux pertinents, {len(latest_timestamps) - len(due_clients)} clients inactifs ignorés.")
+        return due_clients
+
+    def _run_clients(self, client_ids: list, cycle_time: datetime, global_analysis_end_time: str, outcomes: dict):
+        if self.workers == 1:
+            for client_id in client_ids:
+                outcomes[client_id] = self.process_client(client_id, cycle_time, global_analysis_end_time)
+            return
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ia-client") as executor:
+            futures = {
+                executor.submit(self.process_client, client_id, cycle_time, global_analysis_end_time): client_id
+                for client_id in client_ids
+            }
+            for future in as_completed(futures):
+                try:
+                    outcomes[futures[future]] = future.result()
+                except Exception as e:
+                    logger.error(f"Échec du traitement du client '{futures[future]}': {e}", exc_info=True)
+                    errors.append(e)
+
+        if errors:
+            logger.error(f"{len(errors)} client(s) sur {len(client_ids)} en échec pour ce cycle.")
+            raise errors[0]
+
+    def process_client(self, client_id: str, cycle_time: datetime, global_analysis_end_time: str) -> dict:
+        """
+        Exécute les étapes 2 à 8 de l'analyse pour un seul client : analyse de la fenêtre qui suit son état
+        (voir analyze_window), puis mise à jour de l'état.
+        L'état n'avance que jusqu'au dernier lot effectivement traité.
+        Renvoie {"batches": lots analysés, "logs": journaux récupérés, "exhausted": fenêtre entièrement parcourue,
+        "failed": analyse IA en échec}.
+        """
+        logger.info(f"\n--- Traitement des journaux pour le client: '{client_id}' ---")
+
+        # Étape 2 : Obtenir l’horodatage du dernier traitement pour ce client (depuis le cache d'état)
+        analysis_start_time_client = self.state_manager.get_last_analysis_timestamp(client_id)
+
+        progress = {"batches": 0, "logs": 0, "exhausted": False, "failed": False, "checkpoint": analysis_start_time_client}
+        try:
+            self.analyze_window(client_id, analysis_start_time_client, global_analysis_end_time, cycle_time,
+                                settings.MAX_BATCHES_PER_CLIENT_CYCLE, progress)
+        finally:
+            # Étape 8 : Mettre à jour l’horodatage du dernier journal traité pour ce client
+            # Fenêtre entièrement parcourue : l'état avance jusqu'à la fin du cycle, même sans journaux pertinents.
+            # Sinon (limite atteinte ou erreur), il avance seulement jusqu'au dernier lot traité.
+            if progress["exhausted"]:
+                self.state_manager.update_last_analysis_timestamp(client_id, global_analysis_end_time)
+            elif progress["batches"]:
+                self.state_manager.update_last_analysis_timestamp(client_id, progress["checkpoint"])
+        checkpoint = progress.pop("checkpoint")
+        if progress["batches"] and not progress["exhausted"] and not progress["failed"]:
+            logger.info(f"Limite de {progress['batches']} lots atteinte pour le client '{client_id}'. Les journaux restants seront analysés au prochain cycle à partir de {checkpoint}.")
+        return progress
+
+    def analyze_window(self, client_id: str, start_timestamp: str, end_timestamp: str, cycle_time: datetime,
+                       max_batches: int = 0, progress: dict = None) -> dict:
+        """
+        Étapes 3 à 7 pour une fenêtre [start_timestamp, end_timestamp[ d'un client, sans lire ni écrire son état
+        (utilisé aussi par le rejeu historique, voir core/backfill.py).
+        Les journaux de la fenêtre sont parcourus page par page; chaque page est analysée comme un lot.
+        Quand la fenêtre contient plus d'une page (arriéré), jusqu'à MAP_REDUCE_MAX_LOGS journaux forment
+        un seul lot, analysé de façon hiérarchique (voir _analyze_backlog). Si ENABLE_LOG_DIGEST est activé et que
+        la fenêtre contient au moins DIGEST_MIN_LOGS journaux, toute la fenêtre est analysée à partir d'une synthèse
+        calculée par Elasticsearch (voir _analyze_digest) sans récupérer les pages suivantes.
+        Au plus max_batches lots sont analysés (0 = pas de limite).
+        progress est mis à jour au fil des lots, y compris en cas d'exception : "batches", "logs", "exhausted",
+        "failed" (voir process_client) et "checkpoint", fin du dernier lot traité.
+        """
+        if progress is None:
+            progress = {"batches": 0, "logs": 0, "exhausted": False, "failed": False, "checkpoint": start_timestamp}
+        batch_start_time = start_timestamp
+        # Étape 3 : Récupérer les journaux pertinents pour ce client, page par page
+        pages = self.es_client.iter_logs_for_client(client_id, start_timestamp, end_timestamp)
+        with closing(pages):
+            while True:
+                with self.fetch_slots, metrics.stage_timer("fetch", client_id):
+                    page = next(pages, None)
+                if page is None:
+                    progress["exhausted"] = True
+                    break
+
+                logs_to_analyze, last_sort_values = page
+                metrics.LOGS_FETCHED.inc(len(logs_to_analyze), client_id=client_id)
+                progress["logs"] += len(logs_to_analyze)
+                last_page = len(logs_to_analyze) < settings.MAX_LOGS_PER_BATCH
+                digest = None
+                if not last_page and settings.ENABLE_LOG_DIGEST:
+                    with self.fetch_slots, metrics.stage_timer("fetch", client_id):
+                        digest = self.es_client.fetch_log_digest(client_id, batch_start_time, end_timestamp)
+                    if digest is not None and digest["total"] < settings.DIGEST_MIN_LOGS:
+                        digest = None # Fenêtre trop petite : les journaux bruts sont analysés
+                    last_page = digest is not None
+                if not last_page and settings.MAP_REDUCE_MAX_LOGS > settings.MAX_LOGS_PER_BATCH:
+                    # Arriéré : les pages suivantes sont regroupées pour une analyse hiérarchique
+                    logs_to_analyze = list(logs_to_analyze)
+                    while not last_page and len(logs_to_analyze) < settings.MAP_REDUCE_MAX_LOGS:
+                        with self.fetch_slots, metrics.stage_timer("fetch", client_id):
+                            page = next(pages, None)
+                        if page is None:
+                            last_page = True
+                            break
+                        metrics.LOGS_FETCHED.inc(len(page[0]), client_id=client_id)
+                        progress["logs"] += len(page[0])
+                        logs_to_analyze.extend(page[0])
+                        last_sort_values = page[1]
+                        last_page = len(page[0]) < settings.MAX_LOGS_PER_BATCH
+                batch_end_time = end_timestamp if last_page else last_sort_values[0]
+                try:
+                    if digest is not None:
+                        self._analyze_digest(client_id, digest, batch_start_time, batch_end_time, cycle_time)
+                    else:
+                        self._analyze_batch(client_id, logs_to_analyze, batch_start_time, batch_end_time, cycle_time)
+                except IAAnalysisError as e:
+                    # Ni résultat ni alerte pour ce lot : il sera analysé de nouveau au prochain cycle
+                    metrics.BATCHES.inc(client_id=client_id, outcome="failed")
+                    logger.error(f"Analyse IA impossible pour le client '{client_id}', état conservé à {batch_start_time}: {e}")
+                    progress["failed"] = True
+                    break
+                batch_start_time = batch_end_time
+                progress["checkpoint"] = batch_end_time
+                progress["batches"] += 1
+
+                if last_page:
+                    progress["exhausted"] = True
+                    break
+                if max_batches and progress["batches"] >= max_batches:
+                    break
+
+        if progress["batches"] == 0:
+            logger.info(f"Aucun nouveau journal pertinent à analyser pour le client '{client_id}' pour cette période.")
+        return progress
+
+    def _analyze_batch(self, client_id: str, logs_to_analyze: list, batch_start_time: str, batch_end_time: str, cycle_time: datetime):
+        """
+        Exécute les étapes 4 à 7 pour un lot de journaux d'un client.
+        """
+        if settings.MAP_REDUCE_MAX_LOGS and len(logs_to_analyze) > settings.MAP_REDUCE_CHUNK_LOGS:
+            self._analyze_backlog(client_id, logs_to_analyze, batch_start_time, batch_end_time, cycle_time)
+            return
+        logger.info(f"Préparation de {len(logs_to_analyze)} journaux pour l'analyse IA pour le client '{client_id}'.")
+
+        # Étape 4 : Filtrer et classer localement les journaux, puis les préparer pour l’IA
+        # (concaténer et extraire les métadonnées)
+        with metrics.stage_timer("filter", client_id):
+            logs_for_ia = self.log_filter.select(logs_to_analyze) if self.log_filter else logs_to_analyze
+        if not logs_for_ia:
+            logger.info(f"Aucun des {len(logs_to_analyze)} journaux du lot n'est assez pertinent pour l'IA pour le client '{client_id}'.")
+            metrics.BATCHES.inc(client_id=client_id, outcome="filtered_out")
+            return
+        with metrics.stage_timer("prepare", client_id):
+            formatted_logs_for_ia, batch_templates = self.log_processor.prepare_logs_for_ia(logs_for_ia)
+            extracted_metadata = self.log_processor.extract_metadata_from_logs(logs_to_analyze)
+        extracted_metadata["ia_log_count"] = len(logs_for_ia) # Journaux effectivement envoyés à l'IA
+
+        analyze, observation = self._evaluate_gate(client_id, logs_to_analyze, batch_templates, batch_start_time, batch_end_time)
+        if not analyze:
+            return
+
+        # Étape 5 : Analyser les journaux avec l’API AI (ou réutiliser le résultat d'un lot identique)
+        with metrics.stage_timer("ia", client_id):
+            ia_analysis_summary, from_cache = self.ia_handler.analyze_logs_cached(
+                client_id, formatted_logs_for_ia, settings.DEFAULT_IA_PROMPT, batch_templates)
+        metrics.BATCHES.inc(client_id=client_id, outcome="cached" if from_cache else "analyzed")
+        if not from_cache:
+            metrics.LOGS_SENT_TO_IA.inc(len(logs_for_ia), client_id=client_id)
+            metrics.IA_INPUT_BYTES.inc(len(formatted_logs_for_ia.encode("utf-8")), client_id=client_id)
+            metrics.IA_INPUT_TOKENS.inc(estimate_tokens(formatted_logs_for_ia), client_id=client_id)
+
+        logger.info(f"Analyse de l'IA pour le client '{client_id}' terminé. Résultat (aperçu): {ia_analysis_summary[:200]}...")
+        if observation is not None:
+            self.anomaly_gate.observe(client_id, observation)
+
+        self._submit_result(client_id, ia_analysis_summary, from_cache, extracted_metadata, batch_start_time, batch_end_time, cycle_time)
+
+    def _analyze_backlog(self, client_id: str, logs_to_analyze: list, batch_start_time: str, batch_end_time: str, cycle_time: datetime):
+        """
+        Analyse hiérarchique (map-reduce) d'un arriéré : les journaux sont découpés en morceaux chronologiques
+        de MAP_REDUCE_CHUNK_LOGS journaux, chacun filtré et préparé dans le budget du prompt, analysés en parallèle,
+        puis les analyses partielles sont fusionnées en un seul résultat. La durée dépend du nombre d'appels
+        IA simultanés (IA_CONCURRENCY) plutôt que de la taille de l'arriéré.
+        """
+        chunk_size = max(1, settings.MAP_REDUCE_CHUNK_LOGS)
+        chunk_logs = [logs_to_analyze[index:index + chunk_size] for index in range(0, len(logs_to_analyze), chunk_size)]
+        logger.info(f"Analyse hiérarchique de {len(logs_to_analyze)} journaux en {len(chunk_logs)} morceaux pour le client '{client_id}'.")
+
+        chunks = [] # Morceaux retenus : (journaux du morceau, journaux envoyés à l'IA)
+        with metrics.stage_timer("filter", client_id):
+            for logs in chunk_logs:
+                logs_for_ia = self.log_filter.select(logs) if self.log_filter else logs
+                if logs_for_ia:
+                    chunks.append((logs, logs_for_ia))
+        if not chunks:
+            logger.info(f"Aucun des {len(logs_to_analyze)} journaux de l'arriéré n'est assez pertinent pour l'IA pour le client '{client_id}'.")
+            metrics.BATCHES.inc(client_id=client_id, outcome="filtered_out")
+            return
+
+        ia_chunks = []
+        chunk_docs = []
+        with metrics.stage_timer("prepare", client_id):
+            for index, (logs, logs_for_ia) in enumerate(chunks):
+                formatted_logs_for_ia, templates = self.log_processor.prepare_logs_for_ia(logs_for_ia)
+                label = f"Partie {index + 1}/{len(chunks)} : {len(logs)} journaux du {logs[0].timestamp} au {logs[-1].timestamp}"
+                ia_chunks.append((label, formatted_logs_for_ia, templates))
+                chunk_docs.append({
+                    "analysis_start_time": logs[0].timestamp,
+                    "analysis_end_time": logs[-1].timestamp,
+                    "log_count": len(logs),
+                    "ia_log_count": len(logs_for_ia),
+                })
+            extracted_metadata = self.log_processor.extract_metadata_from_logs(logs_to_analyze)
+        extracted_metadata["ia_log_count"] = sum(chunk["ia_log_count"] for chunk in chunk_docs)
+
+        analyze, observation = self._evaluate_gate(client_id, logs_to_analyze, [template for _, _, templates in ia_chunks for template in templates],
+                                                   batch_start_time, batch_end_time)
+        if not analyze:
+            return
+
+        with metrics.stage_timer("ia", client_id):
+            ia_analysis_summary, partials = self.ia_handler.analyze_map_reduce(client_id, ia_chunks, settings.DEFAULT_IA_PROMPT)
+        from_cache = all(cached for _, cached in partials)
+        metrics.BATCHES.inc(client_id=client_id, outcome="cached" if from_cache else "analyzed")
+        for (_, formatted_logs_for_ia, _), chunk, (_, cached) in zip(ia_chunks, chunk_docs, partials):
+            chunk["cached"] = cached
+            if not cached:
+                metrics.LOGS_SENT_TO_IA.inc(chunk["ia_log_count"], client_id=client_id)
+                metrics.IA_INPUT_BYTES.inc(len(formatted_logs_for_ia.encode("utf-8")), client_id=client_id)
+                metrics.IA_INPUT_TOKENS.inc(estimate_tokens(formatted_logs_for_ia), client_id=client_id)
+
+        logger.info(f"Analyse hiérarchique de l'IA pour le client '{client_id}' terminée ({len(chunks)} morceaux). Résultat (aperçu): {ia_analysis_summary[:200]}...")
+        if observation is not None:
+            self.anomaly_gate.observe(client_id, observation)
+        self._submit_result(client_id, ia_analysis_summary, from_cache, extracted_metadata, batch_start_time, batch_end_time, cycle_time,
+                            chunk_count=len(chunks), chunks=chunk_docs)
+
+    def _evaluate_gate(self, client_id: str, logs: list, templates: list, batch_start_time: str, batch_end_time: str,
+                       digest: dict = None) -> tuple:
+        """
+        Filtre statistique (ENABLE_ANOMALY_GATE) : renvoie (analyser le lot, observation à enregistrer après l'analyse).
+        Un lot conforme à la ligne de base du client est enregistré tout de suite et n'est pas envoyé à l'IA.
+        Pour une synthèse côté serveur (digest), les débits viennent de ses agrégations et non des journaux
+        de l'échantillon. Sans extraction de modèles, les messages bruts ne sont pas comparés aux modèles connus.
+        """
+        if self.anomaly_gate is None:
+            return True, None
+        templates = templates if self.log_processor.template_miner else None
+        if digest is not None:
+            anomalous, observation = self.anomaly_gate.evaluate_digest(client_id, digest, templates)
+        else:
+            anomalous, observation = self.anomaly_gate.evaluate(client_id, logs, templates, batch_start_time, batch_end_time)
+        if not anomalous:
+            self.anomaly_gate.observe(client_id, observation)
+            metrics.BATCHES.inc(client_id=client_id, outcome="gated")
+        return anomalous, observation
+
+    def _evaluate_silence(self, client_ids, end_timestamp: str):
+        """
+        Filtre statistique : un client sans nouveau journal depuis son état est observé avec un débit nul,
+        et une alerte est envoyée si ce silence est anormal au vu de sa ligne de base (voir AnomalyGate.evaluate_silence).
+        """
+        if self.anomaly_gate is None:
+            return
+        for client_id in client_ids:
+            checkpoint = self.state_manager.peek_last_analysis_timestamp(client_id)
+            if not checkpoint:
+                continue
+            silent, observation = self.anomaly_gate.evaluate_silence(client_id, checkpoint, end_timestamp)
+            if observation is not None:
+                self.anomaly_gate.observe(client_id, observation)
+            if silent and self.notifier is not None:
+                metrics.BATCHES.inc(client_id=client_id, outcome="silent")
+                self.notifier.queue_client_alert(
+                    client_id, settings.ALERT_SEVERITIES[0],
+                    f"Aucun journal pertinent reçu depuis {checkpoint}, alors que le débit habituel du client en prévoyait : "
+                    "vérifiez la collecte des journaux (agent, réseau) et l'état des services du client.")
+
+    def _analyze_digest(self, client_id: str, digest: dict, batch_start_time: str, batch_end_time: str, cycle_time: datetime):
+        """
+        Analyse d'un client très actif à partir de la synthèse de sa fenêtre calculée par Elasticsearch
+        (agrégations et échantillon de journaux récents) : un seul appel IA, quel que soit le volume de journaux,
+        et seul l'échantillon transite par le réseau.
+        """
+        logger.info(f"Analyse de la synthèse de {digest['total']} journaux pour le client '{client_id}'.")
+        with metrics.stage_timer("filter", client_id):
+            sample = self.log_filter.select(digest["sample"]) if self.log_filter else digest["sample"]
+        with metrics.stage_timer("prepare", client_id):
+            formatted_logs_for_ia, batch_templates, sample_templates = self.log_processor.prepare_digest_for_ia({**digest, "sample": sample})
+            extracted_metadata = self.log_processor.extract_metadata_from_logs(digest["sample"])
+        extracted_metadata["source_hosts"] = sorted(set(extracted_metadata["source_hosts"]) | {host for host, _ in digest["hosts"]})
+        extracted_metadata["analyzed_log_count"] = digest["total"]
+        extracted_metadata["ia_log_count"] = len(sample)
+
+        analyze, observation = self._evaluate_gate(client_id, sample, sample_templates, batch_start_time, batch_end_time, digest=digest)
+        if not analyze:
+            return
+
+        with metrics.stage_timer("ia", client_id):
+            ia_analysis_summary, from_cache = self.ia_handler.analyze_logs_cached(
+                client_id, formatted_logs_for_ia, settings.DEFAULT_IA_PROMPT, batch_templates)
+        metrics.BATCHES.inc(client_id=client_id, outcome="cached" if from_cache else "analyzed")
+        if not from_cache:
+            metrics.LOGS_SENT_TO_IA.inc(len(sample), client_id=client_id)
+            metrics.IA_INPUT_BYTES.inc(len(formatted_logs_for_ia.encode("utf-8")), client_id=client_id)
+            metrics.IA_INPUT_TOKENS.inc(estimate_tokens(formatted_logs_for_ia), client_id=client_id)
+
+        logger.info(f"Analyse de la synthèse pour le client '{client_id}' terminée. Résultat (aperçu): {ia_analysis_summary[:200]}...")
+        if observation is not None:
+            self.anomaly_gate.observe(client_id, observation)
+        self._submit_result(client_id, ia_analysis_summary, from_cache, extracted_metadata, batch_start_time, batch_end_time, cycle_time,
+                            log_digest=True)
+
+    def _submit_result(self, client_id: str, ia_analysis_summary: str, from_cache: bool, extracted_metadata: dict,
+                       batch_start_time: str, batch_end_time: str, cycle_time: datetime, **extra_fields):
+        """
+        Étapes 6 et 7 : écrit le document de résultat et envoie une alerte si besoin.
+        """
+        # Étape 6 : Confier les résultats de l’analyse IA au tampon d'écriture bulk vers Elasticsearch
+        ia_result_doc = {
+            "@timestamp": cycle_time.isoformat(timespec='milliseconds') + "Z", # Horodatage du moment où l'analyse a été effectuée
+            "analysis_start_time": batch_start_time,
+            "analysis_end_time": batch_end_time,
+            "client_id": client_id, # **CRITIQUE : Associer les résultats au client**
+            "ia_analysis_summary": ia_analysis_summary,
+            "script_name": "ia_log_analyzer_main",
+            "status": "completed",
+            "cached": from_cache, # Résumé réutilisé depuis le cache des résultats IA
+            **extracted_metadata, # Inclure des métadonnées telles que source_hosts, log_types, analyzed_log_count
+            **extra_fields, # Analyse hiérarchique (morceaux) ou synthèse côté serveur (log_digest)
+        }
+        if self.backfill_job is not None:
+            ia_result_doc["backfill_job"] = self.backfill_job
+            self.result_writer.submit(ia_result_doc)
+            return
+        self.result_writer.submit(ia_result_doc)
+
+        # Étape 7 (facultative) : envoyer des alertes par e-mail si des problèmes critiques sont détectés
+        with metrics.stage_timer("alert", client_id):
+            self._alert_if_needed(client_id, ia_analysis_summary)
+
+    def _alert_if_needed(self, client_id: str, ia_analysis_summary: str):
+        """
+        Analyse le résumé de l'IA pour trouver la gravité et met en file une alerte par e-mail si besoin
+        (envoyée en arrière-plan, regroupée avec les alertes des autres clients).
+        """
+        for severity_level in settings.ALERT_SEVERITIES:
+            if severity_level in ia_analysis_summary.lower():
+                logger.warning(f"'{severity_level.upper()}' problème détecté par l'IA pour le client '{client_id}'. Envoi d'alerte par e-mail.")
+                self.notifier.queue_client_alert(client_id, severity_level, ia_analysis_summary)
+                break # Envoyer une seule alerte par lot pour la gravité détectée la plus élevée
\ No newline at end of file
@@ -0,0 +1,36 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    Seau à jetons partagé entre threads : au plus rate_per_minute unités par minute,
+    avec une rafale maximale de capacity unités (par défaut, une minute de débit).
+    Un débit de 0 désactive la limitation.
+    """
+    def __init__(self, rate_per_minute: float, capacity: float = None):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Attend que amount unités soient disponibles puis les consomme.
+        Renvoie le temps d'attente en secondes.
+        """
+        if self.rate_per_second <= 0:
+            return 0.0
+        amount = min(amount, self.capacity) # Une demande plus grande que le seau ne serait jamais servie
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate_per_second
+            time.sleep(delay)
+            waited += delay
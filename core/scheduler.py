@@ -0,0 +1,127 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+from config import settings
+from utils import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+class ClientScheduler:
+    """
+    Planificateur par client : chaque client a sa propre échéance, rangée dans une file de priorité.
+
+    L'intervalle d'un client s'adapte au résultat de sa dernière analyse, entre min_interval et max_interval :
+    - journaux restants (limite de lots atteinte) : nouvelle analyse dès que possible (min_interval);
+    - nouveaux journaux pertinents : intervalle divisé par deux;
+    - aucun nouveau journal : intervalle multiplié par growth;
+    - échec : intervalle inchangé.
+    Les clients échus sont servis par ordre d'échéance (les plus en retard d'abord), au plus max_per_round
+    par tour : aucun client n'attend donc indéfiniment, et un client silencieux est revu au plus tard
+    après max_interval.
+    """
+    def __init__(self, initial_interval: float = settings.ANALYSIS_INTERVAL_SECONDS,
+                 min_interval: float = settings.SCHEDULER_MIN_INTERVAL_SECONDS,
+                 max_interval: float = settings.SCHEDULER_MAX_INTERVAL_SECONDS,
+                 growth: float = settings.SCHEDULER_INTERVAL_GROWTH,
+                 max_per_round: int = settings.SCHEDULER_MAX_CLIENTS_PER_ROUND):
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.initial_interval = min(self.max_interval, max(self.min_interval, initial_interval))
+        self.growth = growth
+        self.max_per_round = max_per_round
+        # Les clients échus dans cette marge sont servis dans le même tour, pour regrouper les tours
+        # (et la découverte des clients qui les précède) : au plus un tour toutes les min_interval / 2 secondes
+        self.coalesce = self.min_interval / 2
+        self._lock = threading.Lock()
+        self._heap = [] # (échéance monotone, ordre d'insertion, client_id)
+        self._due = {} # client_id -> échéance courante (les entrées du tas qui ne correspondent plus sont ignorées)
+        self._intervals = {} # client_id -> intervalle courant
+        self._counter = itertools.count()
+
+    def _push(self, client_id: str, due: float):
+        self._due[client_id] = due
+        heapq.heappush(self._heap, (due, next(self._counter), client_id))
+
+    def sync(self, client_ids, now: float = None):
+        """
+        Met à jour l'ensemble des clients planifiés : les nouveaux clients sont échus immédiatement,
+        ceux qui ont disparu de la découverte ne sont plus planifiés.
+        """
+        now = time.monotonic() if now is None else now
+        client_ids = set(client_ids)
+        with self._lock:
+            for client_id in sorted(client_ids - set(self._due)):
+                self._intervals[client_id] = self.initial_interval
+                self._push(client_id, now)
+            for client_id in set(self._due) - client_ids:
+                del self._due[client_id]
+                self._intervals.pop(client_id, None)
+            if len(self._heap) > 4 * len(self._due) + 64:
+                # Compacte le tas des entrées obsolètes
+                self._heap = [(due, order, client_id) for due, order, client_id in self._heap if self._due.get(client_id) == due]
+                heapq.heapify(self._heap)
+        metrics.SCHEDULED_CLIENTS.set(len(client_ids))
+
+    def pop_due(self, now: float = None) -> list:
+        """
+        Renvoie les clients échus (à la marge de regroupement près), par ordre d'échéance,
+        et les retire de la file jusqu'à complete().
+        """
+        now = time.monotonic() if now is None else now
+        due_clients = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now + self.coalesce:
+                if self.max_per_round and len(due_clients) >= self.max_per_round:
+                    break
+                due, _, client_id = heapq.heappop(self._heap)
+                if self._due.get(client_id) != due:
+                    continue # Entrée obsolète (client replanifié ou retiré)
+                self._due[client_id] = None # En cours de traitement
+                due_clients.append(client_id)
+        return due_clients
+
+    def complete(self, client_ids: list, outcomes: dict, now: float = None):
+        """
+        Replanifie les clients traités selon leur résultat (voir AnalysisPipeline.process_client).
+        Un client sans résultat (exception) ou dont l'analyse IA a échoué garde son intervalle.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            for client_id in client_ids:
+                if client_id not in self._due:
+                    continue # Client retiré pendant son traitement
+                interval = self._intervals.get(client_id, self.initial_interval)
+                outcome = outcomes.get(client_id)
+                if outcome is not None and not outcome.get("failed"):
+                    if not outcome["exhausted"]:
+                        interval = self.min_interval
+                    elif outcome["logs"]:
+                        interval = interval / 2
+                    else:
+                        interval = interval * self.growth
+                interval = min(self.max_interval, max(self.min_interval, interval))
+                self._intervals[client_id] = interval
+                self._push(client_id, now + interval)
+                metrics.CLIENT_INTERVAL.set(interval, client_id=client_id)
+
+    def seconds_until_next_due(self, now: float = None):
+        """
+        Délai avant la prochaine échéance, ou None si aucun client n'est planifié.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            while self._heap and self._due.get(self._heap[0][2]) != self._heap[0][0]:
+                heapq.heappop(self._heap) # Entrée obsolète
+            if not self._heap:
+                return None
+            return max(0.0, self._heap[0][0] - now)
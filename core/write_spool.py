@@ -0,0 +1,400 @@
+import json
+import logging
+import mmap
+import os
+import random
+import struct
+import threading
+import time
+
+from elasticsearch.helpers import streaming_bulk
+
+from config import settings
+from core.bulk_writer import RETRYABLE_STATUSES
+from utils import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Fichier d'index d'un segment : en-tête (enregistrements écrits, enregistrements acquittés) puis position de chaque enregistrement
+INDEX_HEADER = struct.Struct("<II")
+INDEX_ENTRY = struct.Struct("<Q")
+# Fichier de données : chaque enregistrement est précédé de sa longueur et de son instant d'ajout (horodatage Unix)
+RECORD_HEADER = struct.Struct("<Id")
+SEGMENT_MAX_RECORDS = 65536
+# Écritures rejetées définitivement par Elasticsearch, une par ligne (voir WriteSpool.replay_dead_letters)
+DEAD_LETTER_FILE = "dead-letter.jsonl"
+
+class _Segment:
+    """
+    Segment du journal d'écriture : fichier de données en ajout seul et fichier d'index projeté en mémoire (mmap).
+    L'index donne la position de chaque enregistrement et le nombre d'enregistrements acquittés par Elasticsearch,
+    ce qui permet de reprendre la relecture au bon endroit après un redémarrage sans parcourir les données.
+    """
+    def __init__(self, directory: str, sequence: int):
+        self.sequence = sequence
+        self.data_path = os.path.join(directory, f"segment-{sequence:010d}.log")
+        self.index_path = os.path.join(directory, f"segment-{sequence:010d}.idx")
+        index_size = INDEX_HEADER.size + SEGMENT_MAX_RECORDS * INDEX_ENTRY.size
+        with open(self.index_path, "ab") as index_file:
+            if index_file.tell() < index_size:
+                index_file.truncate(index_size) # Nouveau segment : index rempli de zéros
+        self._index_file = open(self.index_path, "r+b")
+        self._index = mmap.mmap(self._index_file.fileno(), index_size)
+
+        self.write_position = self._recover()
+        with open(self.data_path, "ab") as data_file:
+            data_file.truncate(self.write_position)
+        self._writer = open(self.data_path, "ab")
+        self._reader = open(self.data_path, "rb")
+
+    def _recover(self) -> int:
+        """
+        Renvoie la fin du dernier enregistrement indexé complet : une fin de fichier écrite partiellement (arrêt brutal)
+        est ignorée. Si le fichier de données est plus court que l'index ne l'indique (disque plein, copie incomplète),
+        l'index est ramené au dernier enregistrement complet.
+        """
+        try:
+            data_size = os.path.getsize(self.data_path)
+        except FileNotFoundError:
+            data_size = 0
+        indexed = min(self.count, SEGMENT_MAX_RECORDS)
+        count = indexed
+        end = 0
+        with open(self.data_path, "ab+") as data_file:
+            while count:
+                offset = self.offset(count - 1)
+                if offset + RECORD_HEADER.size <= data_size:
+                    data_file.seek(offset)
+                    length, _ = RECORD_HEADER.unpack(data_file.read(RECORD_HEADER.size))
+                    end = offset + RECORD_HEADER.size + length
+                    if end <= data_size:
+                        break
+                count -= 1
+                end = 0
+        if count != self.count:
+            logger.warning(f"Segment '{self.data_path}' tronqué : {self.count - count} enregistrements indexés "
+                           f"absents du fichier de données sont ignorés.")
+            INDEX_HEADER.pack_into(self._index, 0, count, min(self.acked, count))
+            self._index.flush()
+        return end
+
+    @property
+    def count(self) -> int:
+        return INDEX_HEADER.unpack_from(self._index, 0)[0]
+
+    @property
+    def acked(self) -> int:
+        return INDEX_HEADER.unpack_from(self._index, 0)[1]
+
+    def offset(self, position: int) -> int:
+        return INDEX_ENTRY.unpack_from(self._index, INDEX_HEADER.size + position * INDEX_ENTRY.size)[0]
+
+    def pending_bytes(self) -> int:
+        return self.write_position - self.offset(self.acked) if self.acked < self.count else 0
+
+    def is_full(self, segment_bytes: int) -> bool:
+        return self.count >= SEGMENT_MAX_RECORDS or self.write_position >= segment_bytes
+
+    def append(self, payload: bytes, appended_at: float) -> int:
+        """
+        Ajoute un enregistrement. L'index n'est mis à jour qu'une fois les données écrites.
+        """
+        record = RECORD_HEADER.pack(len(payload), appended_at) + payload
+        self._writer.write(record)
+        self._writer.flush()
+        count = self.count
+        INDEX_ENTRY.pack_into(self._index, INDEX_HEADER.size + count * INDEX_ENTRY.size, self.write_position)
+        INDEX_HEADER.pack_into(self._index, 0, count + 1, self.acked)
+        self.write_position += len(record)
+        return len(record)
+
+    def read(self, position: int) -> tuple:
+        """
+        Renvoie (instant d'ajout, contenu, taille sur disque) de l'enregistrement à la position donnée.
+        """
+        self._reader.seek(self.offset(position))
+        length, appended_at = RECORD_HEADER.unpack(self._reader.read(RECORD_HEADER.size))
+        return appended_at, self._reader.read(length), RECORD_HEADER.size + length
+
+    def ack(self, acked: int):
+        INDEX_HEADER.pack_into(self._index, 0, self.count, acked)
+
+    def sync(self):
+        self._writer.flush()
+        os.fsync(self._writer.fileno())
+        self._index.flush()
+
+    def close(self):
+        self._writer.close()
+        self._reader.close()
+        self._index.close()
+        self._index_file.close()
+
+    def delete(self):
+        self.close()
+        for path in (self.data_path, self.index_path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logger.warning(f"Impossible de supprimer le segment '{path}': {e}")
+
+class WriteSpool:
+    """
+    Journal d'écriture local (append-only) des documents envoyés à Elasticsearch : résultats IA et états d'analyse.
+
+    Chaque écriture est d'abord ajoutée sur disque, puis rejouée dans l'ordre par un thread d'arrière-plan,
+    par requêtes bulk. Un élément en échec temporaire (ou une erreur de connexion) arrête la relecture,
+    qui reprend au même endroit après un délai exponentiel : un état n'est donc jamais écrit avant les
+    résultats qui le précèdent, et rien n'est perdu si Elasticsearch est indisponible ou si le processus s'arrête.
+    Chaque action porte un _id fixé à l'ajout : une relecture répétée est sans effet. Les résultats IA sont écrits
+    avec op_type create (flux de données) et un conflit 409 à la relecture compte comme une écriture réussie
+    (document déjà écrit); les états d'analyse sont écrits avec op_type index, qui remplace le document.
+    Quand le volume en attente dépasse max_bytes, les ajouts attendent que la relecture libère de la place,
+    ce qui ralentit l'analyse au lieu d'abandonner des résultats.
+    Une écriture rejetée définitivement (erreur de mappage, etc.) est déplacée dans le fichier dead-letter.jsonl
+    du répertoire, avec le statut et l'erreur renvoyés, pour être rejouée une fois la cause corrigée
+    (python main.py --replay-dead-letters).
+    """
+    def __init__(self, es_client, directory: str = settings.SPOOL_DIR,
+                 max_bytes: int = settings.SPOOL_MAX_BYTES,
+                 segment_bytes: int = settings.SPOOL_SEGMENT_BYTES,
+                 batch_docs: int = settings.RESULTS_BULK_MAX_DOCS,
+                 batch_bytes: int = settings.RESULTS_BULK_MAX_BYTES,
+                 max_backoff: float = settings.SPOOL_MAX_BACKOFF_SECONDS):
+        self.es_client = es_client
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.batch_docs = max(1, batch_docs)
+        self.batch_bytes = batch_bytes or 100 * 1024 * 1024
+        self.max_backoff = max_backoff
+        self.dead_letter_path = os.path.join(directory, DEAD_LETTER_FILE)
+        self._dead_letter_lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+        sequences = sorted(int(name[8:-4]) for name in os.listdir(directory) if name.startswith("segment-") and name.endswith(".log"))
+        self._segments = [_Segment(directory, sequence) for sequence in sequences]
+        for segment in self._segments[:-1]:
+            if segment.acked >= segment.count:
+                segment.delete()
+        self._segments = [segment for segment in self._segments[:-1] if segment.acked < segment.count] + self._segments[-1:]
+        if not self._segments:
+            self._segments.append(_Segment(directory, 1))
+        self._pending_records = sum(segment.count - segment.acked for segment in self._segments)
+        self._pending_bytes = sum(segment.pending_bytes() for segment in self._segments)
+        if self._pending_records:
+            logger.info(f"Journal d'écriture '{directory}': {self._pending_records} écritures en attente reprises ({self._pending_bytes} octets).")
+
+        self._condition = threading.Condition()
+        self._closing = False
+        self._closed = False
+        self._failures = 0 # Échecs consécutifs de la relecture (délai exponentiel)
+        self._update_metrics()
+        self._thread = threading.Thread(target=self._run, name="write-spool-drainer", daemon=True)
+        self._thread.start()
+
+    def append(self, action: dict):
+        """
+        Ajoute une action bulk (_op_type, _index, _id, _source) au journal. Attend si le journal est plein.
+        """
+        payload = json.dumps(action, default=str).encode("utf-8")
+        with self._condition:
+            if self._pending_bytes and self._pending_bytes + len(payload) > self.max_bytes and not self._closing:
+                waited_since = time.monotonic()
+                logger.warning(f"Journal d'écriture plein ({self._pending_bytes} octets en attente), analyse ralentie jusqu'à la relecture vers Elasticsearch.")
+                while self._pending_bytes and self._pending_bytes + len(payload) > self.max_bytes and not self._closing:
+                    self._condition.wait()
+                metrics.SPOOL_THROTTLE_SECONDS.inc(time.monotonic() - waited_since)
+            if self._closed:
+                raise RuntimeError("Le journal d'écriture est fermé.")
+
+            segment = self._segments[-1]
+            if segment.is_full(self.segment_bytes):
+                segment = _Segment(self.directory, segment.sequence + 1)
+                self._segments.append(segment)
+            self._pending_bytes += segment.append(payload, time.time())
+            self._pending_records += 1
+            self._condition.notify_all()
+
+    @property
+    def pending_records(self) -> int:
+        return self._pending_records
+
+    def sync(self):
+        """
+        Force l'écriture sur disque des enregistrements ajoutés (appelé en fin de cycle).
+        """
+        with self._condition:
+            if not self._closed:
+                self._segments[-1].sync()
+
+    def pending_actions(self):
+        """
+        Parcourt les actions pas encore acquittées par Elasticsearch, dans l'ordre d'ajout.
+        """
+        with self._condition:
+            for segment in self._segments:
+                for position in range(segment.acked, segment.count):
+                    _, payload, _ = segment.read(position)
+                    yield json.loads(payload)
+
+    def _run(self):
+        """
+        Boucle du thread de relecture : envoie les enregistrements en attente, du plus ancien au plus récent.
+        """
+        while True:
+            with self._condition:
+                while not self._pending_records and not self._closing:
+                    self._condition.wait(1)
+                    self._update_metrics()
+                if not self._pending_records or self._closed:
+                    return
+                while self._segments[0].acked >= self._segments[0].count and len(self._segments) > 1:
+                    self._segments.pop(0).delete() # Segment entièrement relu avant la création du suivant
+                segment = self._segments[0]
+                start = segment.acked
+                batch = []
+                batch_bytes = 0
+                for position in range(start, segment.count):
+                    _, payload, size = segment.read(position)
+                    if batch and (len(batch) >= self.batch_docs or batch_bytes + size > self.batch_bytes):
+                        break
+                    batch.append((json.loads(payload), size))
+                    batch_bytes += size
+
+            drained = self._send([action for action, _ in batch])
+
+            with self._condition:
+                if drained:
+                    segment.ack(start + drained)
+                    self._pending_records -= drained
+                    self._pending_bytes -= sum(size for _, size in batch[:drained])
+                    if segment.acked >= segment.count and len(self._segments) > 1:
+                        self._segments.pop(0).delete()
+                    self._condition.notify_all()
+                self._update_metrics()
+                if drained == len(batch):
+                    self._failures = 0
+                    continue
+                self._failures += 1
+                if self._closed or (self._closing and self._failures > 1):
+                    return # Arrêt : les écritures restantes seront rejouées au prochain démarrage
+                delay = min(self.max_backoff, 2 ** (self._failures - 1)) * (0.5 + random.random() / 2)
+                logger.warning(f"Relecture du journal d'écriture interrompue ({self._pending_records} écritures en attente), nouvel essai dans {delay:.1f}s.")
+                # Les ajouts réveillent le thread : le délai est attendu jusqu'au bout, sauf à l'arrêt
+                deadline = time.monotonic() + delay
+                while not self._closing and time.monotonic() < deadline:
+                    self._condition.wait(deadline - time.monotonic())
+
+    def _send(self, actions: list) -> int:
+        """
+        Envoie les actions par requête bulk. Renvoie le nombre d'actions traitées dans l'ordre avant le premier
+        échec temporaire. Les éléments rejetés définitivement (erreur de mappage, etc.) sont déplacés dans le fichier
+        des écritures rejetées; si ce fichier ne peut pas être écrit, l'élément est traité comme un échec temporaire.
+        """
+        drained = 0
+        try:
+            with self.es_client.write_slots:
+                results = list(streaming_bulk(
+                    self.es_client.es, actions, chunk_size=len(actions), max_chunk_bytes=self.batch_bytes,
+                    raise_on_error=False, raise_on_exception=False, yield_ok=True
+                ))
+            for action, (ok, item) in zip(actions, results):
+                if not ok:
+                    info = next(iter(item.values()), {})
+                    status = info.get("status")
+                    if status == 409 and action.get("_op_type") == "create":
+                        # Déjà écrit lors d'une relecture précédente interrompue avant l'acquittement
+                        metrics.SPOOL_REPLAYED.inc(outcome="ok")
+                        drained += 1
+                        continue
+                    if status is None or status in RETRYABLE_STATUSES:
+                        metrics.SPOOL_REPLAYED.inc(len(actions) - drained, outcome="retried")
+                        break
+                    try:
+                        self._dead_letter(action, status, info.get("error"))
+                    except OSError as e:
+                        logger.error(f"Impossible d'enregistrer l'écriture rejetée dans '{self.dead_letter_path}', elle sera relue: {e}")
+                        metrics.SPOOL_REPLAYED.inc(len(actions) - drained, outcome="retried")
+                        break
+                    metrics.SPOOL_REPLAYED.inc(outcome="rejected")
+                    logger.error(f"Écriture rejetée par Elasticsearch dans l'index '{action['_index']}' (statut {status}), "
+                                 f"conservée dans '{self.dead_letter_path}': {info.get('error')}")
+                else:
+                    metrics.SPOOL_REPLAYED.inc(outcome="ok")
+                drained += 1
+        except Exception as e:
+            metrics.SPOOL_REPLAYED.inc(len(actions) - drained, outcome="retried")
+            logger.error(f"Erreur lors de la relecture du journal d'écriture vers Elasticsearch: {e}")
+        return drained
+
+    def _dead_letter(self, action: dict, status: int, error):
+        """
+        Ajoute une écriture rejetée au fichier des écritures rejetées (écrit sur disque avant l'acquittement).
+        """
+        entry = {"rejected_at": time.time(), "status": status, "error": error, "action": action}
+        with self._dead_letter_lock, open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def replay_dead_letters(self) -> int:
+        """
+        Remet les écritures rejetées dans le journal, à la suite des écritures en attente, et vide le fichier
+        des écritures rejetées. À appeler une fois la cause du rejet corrigée (mappage, modèle d'index).
+        Renvoie le nombre d'écritures remises en file; celles rejetées de nouveau retournent dans le fichier.
+        """
+        replaying_path = self.dead_letter_path + ".replaying"
+        with self._dead_letter_lock:
+            if not os.path.exists(replaying_path): # Sinon : rejeu précédent interrompu, repris tel quel
+                try:
+                    os.replace(self.dead_letter_path, replaying_path)
+                except FileNotFoundError:
+                    return 0
+        with open(replaying_path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        for entry in entries:
+            self.append(entry["action"])
+        self.sync()
+        os.remove(replaying_path)
+        logger.info(f"{len(entries)} écritures rejetées remises dans le journal d'écriture '{self.directory}'.")
+        return len(entries)
+
+    def _update_metrics(self):
+        metrics.SPOOL_PENDING_RECORDS.set(self._pending_records)
+        metrics.SPOOL_PENDING_BYTES.set(self._pending_bytes)
+        oldest_age = 0.0
+        if self._pending_records:
+            segment = self._segments[0]
+            appended_at, _, _ = segment.read(segment.acked)
+            oldest_age = max(0.0, time.time() - appended_at)
+        metrics.SPOOL_OLDEST_AGE.set(oldest_age)
+
+    def close(self, timeout: float = settings.SPOOL_CLOSE_TIMEOUT_SECONDS):
+        """
+        Attend la relecture des écritures en attente (au plus timeout secondes), puis ferme le journal.
+        Les écritures non relues sont conservées sur disque et rejouées au prochain démarrage.
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._closing = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            if self._pending_records:
+                logger.warning(f"{self._pending_records} écritures en attente conservées dans le journal d'écriture '{self.directory}'.")
+        self._thread.join()
+        with self._condition:
+            for segment in self._segments:
+                segment.sync()
+                segment.close()
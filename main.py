@@ -1,12 +1,24 @@
+import argparse
 import time
 import logging
+import os
+import signal
+import sys
 from datetime import datetime, timedelta
 
 from config import settings
-from core.elasticsearch_client import ElasticsearchClient, IA_RESULTS_MAPPING, ANALYSIS_STATE_MAPPING
+from core.backfill import BackfillRunner, default_job_id
+from core.bulk_writer import BulkResultWriter
+from core.elasticsearch_client import ElasticsearchClient
 from core.ia_api_handler import IAApiHandler
+from core.pipeline import AnalysisPipeline
+from core.scheduler import ClientScheduler
+from core.write_spool import WriteSpool
 from processors.log_processor import LogProcessor
 from state_manager.analysis_state import AnalysisStateManager
+from state_manager.backfill_checkpoints import BackfillCheckpoints
+from state_manager.shard_coordinator import ShardCoordinator
+from utils import metrics
 from utils.notifier import Notifier
 
 # Configure root logger
@@ -18,99 +30,192 @@ logging.basicConfig(level=logging.INFO, # Global log level
                     ])
 logger = logging.getLogger(__name__)
 
-def main_analysis_loop():
-    logger.info("Démarrage du script IA Log Analyzer...")
+def main_analysis_loop(once: bool = False) -> int:
+    """
+    Démarre l'analyseur. En mode --once, un seul tour est exécuté pour tous les clients actifs
+    et le code de sortie indique son résultat (voir run_once); sinon le service tourne indéfiniment.
+    """
+    logger.info("Démarrage du script IA Log Analyzer..." + (" (exécution unique)" if once else ""))
+    # Une exécution unique se termine avant d'être collectée : pas de point d'accès des métriques
+    if settings.ENABLE_METRICS and not once:
+        metrics.start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT)
 
     es_client = ElasticsearchClient()
-    ia_handler = IAApiHandler()
+    ia_handler = IAApiHandler(workers=settings.ANALYSIS_WORKERS)
     log_processor = LogProcessor()
-    state_manager = AnalysisStateManager(es_client)
+    # Journal d'écriture local : résultats et états sont rejoués vers Elasticsearch en arrière-plan
+    spool = WriteSpool(es_client) if settings.SPOOL_DIR else None
+    state_manager = AnalysisStateManager(es_client, spool=spool)
     notifier = Notifier()
 
     # Assurez-vous que les index Elasticsearch nécessaires existent
-    es_client.create_index_if_not_exists(settings.IA_RESULTS_INDEX, IA_RESULTS_MAPPING)
-    es_client.create_index_if_not_exists(settings.ANALYSIS_STATE_INDEX, ANALYSIS_STATE_MAPPING)
-
-
+    es_client.bootstrap_indices()
+
+
+    result_writer = BulkResultWriter(es_client, spool=spool)
+    pipeline = AnalysisPipeline(es_client, ia_handler, log_processor, state_manager, notifier, result_writer)
+
+    # Plusieurs instances : chacune ne traite que les clients dont elle détient le bail
+    coordinator = ShardCoordinator(es_client) if settings.SHARDING_ENABLED else None
+    if coordinator:
+        coordinator.start()
+
+    try:
+        if once:
+            return run_once(es_client, pipeline, notifier, coordinator)
+        run_forever(es_client, pipeline, notifier, coordinator)
+    finally:
+        # Écrire les résultats et envoyer les alertes encore en attente avant l'arrêt
+        if coordinator:
+            coordinator.stop()
+        result_writer.close()
+        if spool:
+            spool.close()
+        notifier.close()
+
+def main_replay_dead_letters() -> int:
+    """
+    Remet les écritures rejetées par Elasticsearch (fichier dead-letter.jsonl du journal d'écriture) dans le journal,
+    puis attend leur relecture. Renvoie le code de sortie : 0 si elles ont toutes été écrites, 1 sinon.
+    """
+    if not settings.SPOOL_DIR:
+        logger.error("SPOOL_DIR n'est pas configuré : aucun journal d'écriture à rejouer.")
+        return 1
+    spool = WriteSpool(ElasticsearchClient())
+    try:
+        spool.replay_dead_letters()
+    finally:
+        spool.close()
+    return 0 if spool.pending_records == 0 and not os.path.exists(spool.dead_letter_path) else 1
+
+def main_backfill(client_ids: list, start_timestamp: str, end_timestamp: str, job_id: str = None) -> int:
+    """
+    Rejeu historique d'une période pour une liste de clients (voir core/backfill.py), indépendant de l'état
+    de la boucle principale. Renvoie le code de sortie : 0 si toutes les tranches ont été analysées, 1 sinon
+    (relancer la même commande reprend les tranches restantes).
+    """
+    job_id = job_id or default_job_id(client_ids, start_timestamp, end_timestamp)
+    logger.info(f"Démarrage du rejeu historique '{job_id}'...")
+    es_client = ElasticsearchClient()
+    ia_handler = IAApiHandler(workers=settings.BACKFILL_WORKERS) # Les tranches sont analysées par les workers du rejeu
+    log_processor = LogProcessor()
+    es_client.bootstrap_indices()
+
+    # Écriture groupée directe : le journal d'écriture local (SPOOL_DIR) appartient au service principal
+    result_writer = BulkResultWriter(es_client)
+    pipeline = AnalysisPipeline(es_client, ia_handler, log_processor, None, None, result_writer, backfill_job=job_id)
+    runner = BackfillRunner(pipeline, result_writer, BackfillCheckpoints(es_client, job_id))
+    try:
+        summary = runner.run(client_ids, start_timestamp, end_timestamp)
+    finally:
+        result_writer.close()
+    return 0 if summary["failed"] == 0 else 1
+
+def run_round(es_client, pipeline, notifier, scheduler: ClientScheduler, coordinator=None) -> bool:
+    """
+    Exécute un tour d'analyse : découverte des clients actifs, puis analyse des clients échus.
+    Renvoie False si le tour a échoué ou si l'analyse d'au moins un client a échoué.
+    """
+    cycle_started = time.monotonic()
+    due_clients = []
+    succeeded = True
+    try:
+        current_time_utc = datetime.utcnow()
+        global_analysis_end_time = current_time_utc.isoformat(timespec='milliseconds') + "Z"
+
+        # Étape 1 : Obtenir la liste des clients actifs
+        # (avec l'horodatage de leur dernier journal pertinent pour ignorer les clients inactifs)
+        with metrics.stage_timer("discover"):
+            active_clients = es_client.get_active_clients_with_latest(lookback_time=settings.ACTIVE_CLIENTS_LOOKBACK_TIME)
+        metrics.ACTIVE_CLIENTS.set(len(active_clients))
+        if coordinator:
+            active_clients = coordinator.claim(active_clients)
+        scheduler.sync(active_clients)
+
+        due_clients = scheduler.pop_due()
+        if not due_clients:
+            logger.info("Aucun client échu pour ce tour. En attente de la prochaine échéance.")
+        else:
+            logger.info(f"\n--- Démarrage d'un tour d'analyse pour {len(due_clients)} clients échus sur {len(active_clients)} actifs jusqu'à {global_analysis_end_time} ---")
+            # Étapes 2 à 8 : traitement de chaque client échu (en parallèle si ANALYSIS_WORKERS > 1)
+            outcomes = {}
+            try:
+                pipeline.run_cycle({client_id: active_clients[client_id] for client_id in due_clients}, current_time_utc, outcomes)
+            finally:
+                scheduler.complete(due_clients, outcomes)
+            failed_clients = [client_id for client_id in due_clients if outcomes.get(client_id, {"failed": True})["failed"]]
+            if failed_clients:
+                succeeded = False
+                logger.warning(f"Analyse en échec pour {len(failed_clients)} clients sur {len(due_clients)}.")
+            logger.info("Tous les clients échus traités pour ce tour.")
+
+    except Exception as e:
+        succeeded = False
+        logger.critical(f"Une erreur inattendue s'est produite dans la boucle d'analyse principale : {e}", exc_info=True)
+        notifier.send_email_alert(
+            subject="ERREUR CRITIQUE - Analyseur de journaux IA",
+            body=f"Le script IA Log Analyzer a rencontré une erreur critique : {e}\n"
+                 "Veuillez consulter les journaux de script pour plus de détails."
+        )
+
+    # Rapport de la durée du tour par rapport à l'intervalle configuré
+    cycle_duration = time.monotonic() - cycle_started
+    metrics.CYCLE_DURATION.observe(cycle_duration)
+    metrics.LAST_CYCLE_END.set(time.time())
+    if cycle_duration > settings.ANALYSIS_INTERVAL_SECONDS:
+        metrics.CYCLE_OVERRUNS.inc()
+        logger.warning(f"Tour d'analyse terminé en {cycle_duration:.1f}s pour {len(due_clients)} clients, "
+                       f"dépassement de l'intervalle de {settings.ANALYSIS_INTERVAL_SECONDS}s.")
+    else:
+        logger.info(f"Tour d'analyse terminé en {cycle_duration:.1f}s pour {len(due_clients)} clients.")
+    return succeeded
+
+def run_once(es_client, pipeline, notifier, coordinator=None) -> int:
+    """
+    Exécute un seul tour pour tous les clients actifs (déploiement en tâche planifiée : cron, CronJob Kubernetes).
+    Renvoie le code de sortie : 0 si tous les clients ont été analysés, 1 sinon.
+    L'état de chaque client étant enregistré dans Elasticsearch, l'exécution suivante reprend où celle-ci s'est arrêtée.
+    """
+    # Aucune limite par tour : tous les clients actifs sont échus dès leur découverte
+    scheduler = ClientScheduler(max_per_round=0)
+    return 0 if run_round(es_client, pipeline, notifier, scheduler, coordinator) else 1
+
+def run_forever(es_client, pipeline, notifier, coordinator=None):
+    """
+    Exécute les tours d'analyse indéfiniment. Chaque client a sa propre échéance (ClientScheduler) :
+    le service dort jusqu'à la prochaine échéance, et seuls les clients échus sont analysés à chaque tour.
+    La découverte des clients actifs est refaite à chaque tour, et au moins toutes les ANALYSIS_INTERVAL_SECONDS.
+    Avec un ShardCoordinator, seuls les clients attribués à cette instance sont traités.
+    """
+    scheduler = ClientScheduler()
     while True:
-        try:
-            current_time_utc = datetime.utcnow()
-            global_analysis_end_time = current_time_utc.isoformat(timespec='milliseconds') + "Z"
-            
-            logger.info(f"\n--- Démarrage d'un nouveau cycle d'analyse pour tous les clients actifs jusqu'à {global_analysis_end_time} ---")
-
-            # Étape 1 : Obtenir la liste des clients actifs
-            active_clients = es_client.get_active_clients(lookback_time=settings.ACTIVE_CLIENTS_LOOKBACK_TIME)
-
-            if not active_clients:
-                logger.info("Aucun client actif trouvé dans les journaux récents. En attente du prochain cycle.")
-                time.sleep(settings.ANALYSIS_INTERVAL_SECONDS)
-                continue # Passer à l'itération suivante de la boucle principale
-
-            for client_id in active_clients:
-                logger.info(f"\n--- Traitement des journaux pour le client: '{client_id}' ---")
-                
-                # Étape 2 : Obtenir l’horodatage du dernier traitement pour ce client
-                analysis_start_time_client = state_manager.get_last_analysis_timestamp(client_id)
-
-                # Étape 3 : Récupérer les journaux pertinents pour ce client
-                logs_to_analyze = es_client.fetch_logs_for_client(client_id, analysis_start_time_client)
-
-                if logs_to_analyze:
-                    logger.info(f"Préparation de {len(logs_to_analyze)} journaux pour l'analyse IA pour le client '{client_id}'.")
-                    
-                    # Étape 4 : Préparer les journaux pour l’IA (concaténer et extraire les métadonnées)
-                    formatted_logs_for_ia = log_processor.format_logs_for_ia(logs_to_analyze)
-                    extracted_metadata = log_processor.extract_metadata_from_logs(logs_to_analyze)
-
-                    # Étape 5 : Analyser les journaux avec l’API AI
-                    ia_analysis_summary = ia_handler.analyze_logs(formatted_logs_for_ia, settings.DEFAULT_IA_PROMPT)
-                    
-                    logger.info(f"Analyse de l'IA pour le client '{client_id}' terminé. Résultat (aperçu): {ia_analysis_summary[:200]}...")
-
-                    # Étape 6 : Envoyer les résultats de l’analyse IA à Elasticsearch
-                    ia_result_doc = {
-                        "@timestamp": current_time_utc.isoformat(timespec='milliseconds') + "Z", # Horodatage du moment où l'analyse a été effectuée
-                        "analysis_start_time": analysis_start_time_client,
-                        "analysis_end_time": global_analysis_end_time,
-                        "client_id": client_id, # **CRITIQUE : Associer les résultats au client**
-                        "ia_analysis_summary": ia_analysis_summary,
-                        "script_name": "ia_log_analyzer_main",
-                        "status": "completed",
-                        **extracted_metadata, # Inclure des métadonnées telles que source_hosts, log_types, analyzed_log_count
-                    }
-                    es_client.send_ia_results(ia_result_doc)
-
-                    # # Étape 7 (facultative) : envoyer des alertes par e-mail si des problèmes critiques sont détectés
-                    # Cela nécessite d'analyser le résumé de l'IA pour trouver la gravité
-                    for severity_level in settings.ALERT_SEVERITIES:
-                        if severity_level in ia_analysis_summary.lower():
-                            logger.warning(f"'{severity_level.upper()}' problème détecté par l'IA pour le client '{client_id}'. Envoi d'alerte par e-mail.")
-                            notifier.send_email_alert(
-                                subject=f"ALERTE IA - Client {client_id}: {severity_level.upper()} Problème détecté !",
-                                body=f"L'IA a détecté un {severity_level} problème pour le client '{client_id}' dans les journaux récents.\n\nRésumé de l'IA:\n{ia_analysis_summary}\n\nConsultez Kibana pour plus de détails, filtrez par client_id: '{client_id}'."
-                            )
-                            break # Envoyer une seule alerte par lot pour la gravité détectée la plus élevée
-                else:
-                    logger.info(f"Aucun nouveau journal pertinent à analyser pour le client '{client_id}' pour cette période.")
-                
-                # Étape 8 : Mettre à jour l’horodatage du dernier journal traité pour ce client
-                # Cela garantit la continuité même si un client n’a pas de nouveaux journaux pertinents pour un cycle.
-                state_manager.update_last_analysis_timestamp(client_id, global_analysis_end_time)
-
-            logger.info("Tous les clients actifs traités pour ce cycle.")
-
-        except Exception as e:
-            logger.critical(f"Une erreur inattendue s'est produite dans la boucle d'analyse principale : {e}", exc_info=True)
-            notifier.send_email_alert(
-                subject="ERREUR CRITIQUE - Analyseur de journaux IA",
-                body=f"Le script IA Log Analyzer a rencontré une erreur critique : {e}\n"
-                     "Veuillez consulter les journaux de script pour plus de détails."
-            )
-        
-        logger.info(f"En attente de {settings.ANALYSIS_INTERVAL_SECONDS} secondes avant le prochain cycle d'analyse globale...")
-        time.sleep(settings.ANALYSIS_INTERVAL_SECONDS)
+        run_round(es_client, pipeline, notifier, scheduler, coordinator)
+
+        # Attente jusqu'à la prochaine échéance, bornée pour découvrir régulièrement les nouveaux clients
+        next_due = scheduler.seconds_until_next_due()
+        sleep_seconds = settings.ANALYSIS_INTERVAL_SECONDS if next_due is None else min(next_due, settings.ANALYSIS_INTERVAL_SECONDS)
+        logger.info(f"En attente de {sleep_seconds:.0f} secondes avant la prochaine échéance...")
+        time.sleep(sleep_seconds)
 
 # Point d'entrée du script
 if __name__ == "__main__":
-    main_analysis_loop()
\ No newline at end of file
+    # SIGTERM (systemd, Kubernetes) déclenche un arrêt propre pour écrire les résultats en attente
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    parser = argparse.ArgumentParser(description="IA Log Analyzer : analyse par IA des journaux Elasticsearch de chaque client.")
+    parser.add_argument("--once", action="store_true",
+                        help="Exécute un seul tour d'analyse puis se termine (code de sortie 0 si tous les clients ont été analysés, 1 sinon)")
+    parser.add_argument("--backfill-start", help="Rejeu historique : début de la période (ISO 8601, ex. 2025-06-01T00:00:00Z)")
+    parser.add_argument("--backfill-end", help="Rejeu historique : fin de la période (exclue)")
+    parser.add_argument("--clients", help="Rejeu historique : clients à analyser, séparés par des virgules")
+    parser.add_argument("--replay-dead-letters", action="store_true",
+                        help="Remet les écritures rejetées par Elasticsearch (dead-letter.jsonl du journal d'écriture) dans le journal, puis se termine")
+    parser.add_argument("--backfill-job", help="Rejeu historique : nom du rejeu (par défaut, déduit des clients et de la période)")
+    args = parser.parse_args()
+    if args.replay_dead_letters:
+        sys.exit(main_replay_dead_letters())
+    if args.backfill_start or args.backfill_end:
+        client_ids = [c.strip() for c in (args.clients or "").split(',') if c.strip()]
+        if not (args.backfill_start and args.backfill_end and client_ids):
+            parser.error("--backfill-start, --backfill-end et --clients sont requis pour un rejeu historique")
+        sys.exit(main_backfill(client_ids, args.backfill_start, args.backfill_end, args.backfill_job))
+    sys.exit(main_analysis_loop(once=args.once))
\ No newline at end of file
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+from collections import Counter
+
+from config import settings
+from utils.time_utils import parse_timestamp
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+class AnomalyGate:
+    """
+    Filtre statistique avant l'appel IA : chaque client a une ligne de base du débit (journaux par minute)
+    de ses journaux pertinents, et de ses journaux d'erreur et d'avertissement par niveau, type de journal et hôte,
+    sous forme de moyenne et de variance à pondération exponentielle (EWMA).
+    Un lot est envoyé à l'IA si l'un de ses débits dépasse la moyenne de plus de z_threshold écarts types,
+    s'il contient un modèle de journal jamais vu pour ce client, ou pendant l'apprentissage (min_observations lots).
+    La ligne de base (quelques dizaines de nombres et les empreintes courtes des modèles connus par client)
+    est conservée dans un fichier JSON entre les cycles et les redémarrages.
+    Un client connu sans aucun nouveau journal est évalué avec evaluate_silence : sa ligne de base décroît,
+    et un silence improbable au vu de son débit habituel est signalé (panne, collecte interrompue).
+    """
+    def __init__(self, alpha: float = settings.ANOMALY_EWMA_ALPHA,
+                 z_threshold: float = settings.ANOMALY_Z_THRESHOLD,
+                 min_observations: int = settings.ANOMALY_MIN_OBSERVATIONS,
+                 min_stddev: float = settings.ANOMALY_MIN_STDDEV,
+                 levels: list = settings.ANOMALY_LEVELS,
+                 max_dimensions: int = settings.ANOMALY_MAX_DIMENSIONS,
+                 max_templates: int = settings.ANOMALY_MAX_TEMPLATES,
+                 path: str = settings.ANOMALY_BASELINE_PATH):
+        self.alpha = min(1.0, max(0.0, alpha))
+        self.z_threshold = z_threshold
+        self.min_observations = min_observations
+        self.min_stddev = max(1e-6, min_stddev)
+        self.levels = frozenset(level.lower() for level in levels)
+        self.max_dimensions = max(1, max_dimensions)
+        self.max_templates = max(0, max_templates)
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        # client_id -> {"n": lots observés, "dims": {dimension: [moyenne, variance]}, "templates": {empreinte: None}}
+        self._baselines = self._load() if path else {}
+
+    def _counts(self, logs: list) -> Counter:
+        counts = Counter({"all": len(logs)})
+        for log in logs:
+            level = (log.level or "").lower()
+            if level not in self.levels:
+                continue
+            counts["level:" + level] += 1
+            if log.log_type is not None:
+                counts["type:" + log.log_type] += 1
+            if log.host_name is not None:
+                counts["host:" + log.host_name] += 1
+        return counts
+
+    @staticmethod
+    def _template_fingerprint(template: str) -> str:
+        return hashlib.blake2b(template.encode("utf-8"), digest_size=8).hexdigest()
+
+    def evaluate(self, client_id: str, logs: list, templates: list, start_timestamp: str, end_timestamp: str) -> tuple:
+        """
+        Compare un lot à la ligne de base du client. templates vaut None si les modèles ne sont pas comparables
+        (extraction de modèles désactivée). Renvoie (lot anormal, observation) : l'observation est à enregistrer
+        avec observe() une fois le lot traité, pour qu'un lot dont l'analyse IA échoue soit évalué de nouveau.
+        """
+        return self._evaluate(client_id, self._counts(logs), templates, start_timestamp, end_timestamp, partial=False)
+
+    def evaluate_digest(self, client_id: str, digest: dict, templates: list) -> tuple:
+        """
+        Comme evaluate, pour la synthèse côté serveur d'une fenêtre (voir ElasticsearchClient.fetch_log_digest) :
+        les débits viennent de ses agrégations (nombre total et niveaux les plus fréquents) et templates
+        sont les modèles de son échantillon. Les débits par type de journal et par hôte n'y sont pas mesurés :
+        observe() ne les met pas à jour.
+        """
+        counts = Counter({"all": digest["total"]})
+        for level, count in digest["levels"]:
+            level = level.lower()
+            if level in self.levels:
+                counts["level:" + level] += count
+        return self._evaluate(client_id, counts, templates, digest["start"], digest["end"], partial=True)
+
+    def evaluate_silence(self, client_id: str, start_timestamp: str, end_timestamp: str) -> tuple:
+        """
+        Évalue une fenêtre sans aucun journal pertinent pour un client qui a une ligne de base (débit nul pour
+        toutes ses dimensions). Le silence est anormal si le débit moyen du client est à plus de z_threshold écarts
+        types de zéro et si, pour un débit de type Poisson, au moins z_threshold² journaux étaient attendus
+        sur la fenêtre (une fenêtre courte sans journal reste plausible pour un client peu actif).
+        Renvoie (silence anormal, observation à enregistrer avec observe(), ou None pour un client inconnu).
+        """
+        with self._lock:
+            baseline = self._baselines.get(client_id)
+            if baseline is None:
+                return False, None
+            observations = baseline["n"]
+            mean, variance = baseline["dims"].get("all", (0.0, 0.0))
+        observation = ({"all": 0.0}, [], False)
+        if observations < self.min_observations:
+            return False, observation
+        try:
+            minutes = (parse_timestamp(end_timestamp) - parse_timestamp(start_timestamp)).total_seconds() / 60
+        except ValueError:
+            minutes = 0
+        expected = mean * max(minutes, 0)
+        z_score = mean / max(math.sqrt(variance), self.min_stddev)
+        if z_score >= self.z_threshold and expected >= self.z_threshold ** 2:
+            logger.warning(f"Silence anormal pour le client '{client_id}' : aucun journal depuis {start_timestamp} "
+                           f"(moyenne {mean:.1f}/min, {expected:.0f} journaux attendus, z={z_score:.1f}).")
+            return True, observation
+        return False, observation
+
+    def _evaluate(self, client_id: str, counts: Counter, templates: list, start_timestamp: str, end_timestamp: str, partial: bool) -> tuple:
+        try:
+            minutes = (parse_timestamp(end_timestamp) - parse_timestamp(start_timestamp)).total_seconds() / 60
+        except ValueError:
+            minutes = 0
+        minutes = max(minutes, 1 / 60)
+        rates = {dimension: count / minutes for dimension, count in counts.items()}
+        fingerprints = [self._template_fingerprint(template) for template in set(templates)] if templates is not None else []
+
+        reasons = []
+        with self._lock:
+            baseline = self._baselines.get(client_id, {"n": 0, "dims": {}, "templates": {}})
+            if baseline["n"] < self.min_observations:
+                reasons.append(f"apprentissage ({baseline['n']}/{self.min_observations} lots)")
+            else:
+                for dimension, rate in rates.items():
+                    mean, variance = baseline["dims"].get(dimension, (0.0, 0.0))
+                    z_score = (rate - mean) / max(math.sqrt(variance), self.min_stddev)
+                    if z_score >= self.z_threshold:
+                        reasons.append(f"{dimension} {rate:.1f}/min (moyenne {mean:.1f}, z={z_score:.1f})")
+                new_templates = sum(1 for fingerprint in fingerprints if fingerprint not in baseline["templates"])
+                if new_templates:
+                    reasons.append(f"{new_templates} nouveaux modèles")
+        if reasons:
+            logger.info(f"Lot anormal pour le client '{client_id}' : {'; '.join(reasons[:5])}.")
+        else:
+            logger.info(f"Lot conforme à la ligne de base pour le client '{client_id}' ({counts['all']} journaux), pas d'analyse IA.")
+        return bool(reasons), (rates, fingerprints, partial)
+
+    def observe(self, client_id: str, observation: tuple):
+        """
+        Met à jour la ligne de base du client avec un lot traité (voir evaluate).
+        Les dimensions absentes du lot sont mises à jour avec un débit nul, sauf pour une synthèse
+        (evaluate_digest), qui ne les mesure pas; au-delà de max_dimensions, les dimensions de plus faible
+        moyenne sont oubliées.
+        """
+        rates, fingerprints, partial = observation
+        alpha = self.alpha
+        with self._lock:
+            baseline = self._baselines.setdefault(client_id, {"n": 0, "dims": {}, "templates": {}})
+            dims = baseline["dims"]
+            for dimension in (set(rates) if partial else set(dims) | set(rates)):
+                rate = rates.get(dimension, 0.0)
+                if baseline["n"] == 0 or dimension not in dims:
+                    # Première observation : la moyenne part du débit observé (variance nulle)
+                    mean, variance = (rate, 0.0) if baseline["n"] == 0 else (0.0, 0.0)
+                else:
+                    mean, variance = dims[dimension]
+                diff = rate - mean
+                mean += alpha * diff
+                variance = (1 - alpha) * (variance + alpha * diff * diff)
+                dims[dimension] = [round(mean, 4), round(variance, 4)]
+            if len(dims) > self.max_dimensions:
+                kept = sorted(dims, key=lambda dimension: dims[dimension][0], reverse=True)[:self.max_dimensions]
+                baseline["dims"] = {dimension: dims[dimension] for dimension in kept}
+
+            templates = baseline["templates"]
+            for fingerprint in fingerprints:
+                templates.pop(fingerprint, None) # Réinsertion : les modèles les plus récemment vus sont conservés
+                templates[fingerprint] = None
+            while len(templates) > self.max_templates:
+                del templates[next(iter(templates))]
+            baseline["n"] += 1
+            self._dirty = True
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            baselines = {
+                client_id: {"n": baseline["n"], "dims": baseline["dims"], "templates": dict.fromkeys(baseline["templates"])}
+                for client_id, baseline in data.get("clients", {}).items()
+            }
+            logger.info(f"Lignes de base chargées depuis '{self.path}' : {len(baselines)} clients.")
+            return baselines
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Impossible de lire les lignes de base depuis '{self.path}', apprentissage repris de zéro: {e}")
+            return {}
+
+    def save(self):
+        """
+        Enregistre les lignes de base si elles ont changé (remplacement atomique du fichier).
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"clients": {
+                client_id: {"n": baseline["n"], "dims": baseline["dims"], "templates": list(baseline["templates"])}
+                for client_id, baseline in self._baselines.items()
+            }}
+            self._dirty = False
+        try:
+            with open(self.path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            logger.warning(f"Impossible d'enregistrer les lignes de base dans '{self.path}': {e}")
@@ -0,0 +1,198 @@
+import heapq
+import logging
+import re
+from itertools import compress
+from operator import add, attrgetter
+
+from config import settings
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+# Poids des signaux de gravité
+LEVEL_WEIGHTS = {
+    "emergency": 6, "emerg": 6, "fatal": 6, "panic": 6, "critical": 6, "crit": 6, "alert": 5,
+    "error": 5, "err": 5,
+    "warning": 2, "warn": 2,
+}
+TAG_WEIGHTS = {"security": 4, "error": 3, "performance": 2}
+KEYWORD_WEIGHT = 2
+REGEX_WEIGHT = 3
+
+def _http_status_weight(status) -> int:
+    try:
+        status = int(status)
+    except (TypeError, ValueError):
+        return 0
+    if status >= 500:
+        return 4
+    if status in (401, 403):
+        return 3
+    if status >= 400:
+        return 1
+    return 0
+
+def _trie_regex(keywords: list) -> str:
+    """
+    Construit une expression régulière factorisée en arbre de préfixes à partir d'une liste de mots-clés :
+    comme avec un automate Aho-Corasick, les préfixes communs ne sont testés qu'une seule fois.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {} # Fin de mot-clé
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            # Le préfixe est lui-même un mot-clé : la suite est facultative (correspondance la plus longue d'abord)
+            body = f"(?:{body})?"
+        return body
+
+    return build(trie)
+
+class _WeightCache(dict):
+    """
+    Poids d'un signal par valeur brute du champ (niveau, statut HTTP) : une seule recherche par journal,
+    le poids d'une valeur inconnue est calculé à la première rencontre.
+    """
+    def __init__(self, weight):
+        super().__init__()
+        self.weight = weight
+
+    def __missing__(self, value):
+        weight = self.weight(value)
+        if len(self) < 4096: # Borne les valeurs fantaisistes
+            self[value] = weight
+        return weight
+
+def _level_weight(level) -> int:
+    return LEVEL_WEIGHTS.get(level.lower(), 0) if type(level) is str else 0
+
+def _tag_weight(tag) -> int:
+    return TAG_WEIGHTS.get(str(tag).lower(), 0)
+
+_get_level = attrgetter("level")
+_get_status = attrgetter("status_code")
+_get_tags = attrgetter("tags")
+_get_message = attrgetter("message")
+
+class LogRelevanceScorer:
+    """
+    Filtre local et classement des journaux candidats avant l'appel IA.
+    Les mots-clés configurés sont compilés en arbre de préfixes, avec les expressions régulières configurées,
+    en une seule expression, appliquée en une passe à chaque message du lot;
+    le score ajoute les signaux de niveau de journal, de statut HTTP et de balises.
+    """
+    def __init__(self, keywords: list = settings.LOG_FILTER_KEYWORDS, regexes: list = settings.LOG_FILTER_REGEXES,
+                 min_score: float = settings.LOG_FILTER_MIN_SCORE, max_lines: int = settings.LOG_FILTER_MAX_LINES):
+        self.min_score = min_score
+        self.max_lines = max_lines
+        self._level_weights = _WeightCache(_level_weight)
+        self._status_weights = _WeightCache(_http_status_weight)
+        self._tag_weights = _WeightCache(_tag_weight)
+        alternatives = []
+        keywords = sorted({keyword.lower() for keyword in keywords if keyword})
+        if keywords:
+            alternatives.append("(?P<kw>" + _trie_regex(keywords) + ")")
+        for index, regex in enumerate(regex for regex in regexes if regex):
+            alternatives.append(f"(?P<rx{index}>{regex})")
+        # Appliquée aux messages en minuscules : bien plus rapide que re.IGNORECASE
+        self.pattern = re.compile("|".join(alternatives)) if alternatives else None
+        # Position, dans les tuples de findall, du groupe de chaque expression configurée (None : mots-clés seuls,
+        # findall renvoie alors directement les mots-clés trouvés)
+        groups = self.pattern.groupindex if self.pattern and self.pattern.groups > 1 else {}
+        self._keyword_group = groups["kw"] - 1 if "kw" in groups else None
+        self._rule_groups = [(number - 1, name) for name, number in groups.items() if name != "kw"] or None
+        # Une seule expression configurée, sans mots-clés : chaque message trouvé compte une règle
+        self._single_rule = self.pattern is not None and not keywords and self.pattern.groups == 1
+
+    def score_batch(self, logs_data: list) -> list:
+        """
+        Calcule le score de pertinence de chaque journal du lot (même ordre que logs_data).
+        Chaque signal est calculé par colonne sur tout le lot, une colonne entièrement vide étant ignorée.
+        L'expression combinée est appliquée en une seule passe à chaque message en minuscules (findall, appelé
+        sans boucle Python entre les messages); seuls les messages avec au moins une correspondance sont parcourus.
+        """
+        if not logs_data:
+            return []
+        size = len(logs_data)
+
+        # Signaux structurés : niveau de journal et statut HTTP (voir LogRecord), une recherche par journal
+        levels = list(map(_get_level, logs_data))
+        if levels.count(None) == size:
+            scores = [0] * size
+        else:
+            try:
+                scores = list(map(self._level_weights.__getitem__, levels))
+            except TypeError: # Valeur non hachable
+                scores = list(map(_level_weight, levels))
+
+        statuses = list(map(_get_status, logs_data))
+        if statuses.count(None) != size:
+            try:
+                scores = list(map(add, scores, map(self._status_weights.__getitem__, statuses)))
+            except TypeError:
+                scores = list(map(add, scores, map(_http_status_weight, statuses)))
+
+        tags_column = list(map(_get_tags, logs_data))
+        tag_weights = self._tag_weights
+        for index in compress(range(size), tags_column):
+            tags = tags_column[index]
+            try:
+                scores[index] += sum(map(tag_weights.__getitem__, tags)) if isinstance(tags, list) else tag_weights[tags]
+            except TypeError:
+                scores[index] += sum(map(_tag_weight, tags if isinstance(tags, list) else [tags]))
+
+        if self.pattern is None:
+            return scores
+        messages = list(map(_get_message, logs_data))
+        if messages.count(None):
+            messages = [message or '' for message in messages]
+        try:
+            lines = list(map(str.lower, messages))
+        except TypeError: # Message qui n'est pas une chaîne
+            lines = [str(message).lower() for message in messages]
+
+        found = list(map(self.pattern.findall, lines))
+        rules = self._rule_groups
+        if self._single_rule:
+            for index in compress(range(size), found):
+                scores[index] += REGEX_WEIGHT
+            return scores
+        if rules is None:
+            for index in compress(range(size), found):
+                scores[index] += KEYWORD_WEIGHT * len(set(found[index]))
+            return scores
+        keyword_group = self._keyword_group
+        for index in compress(range(size), found):
+            # Plusieurs groupes : chaque correspondance est un tuple d'un élément par groupe
+            matches = found[index]
+            keywords = len({match[keyword_group] for match in matches} - {""}) if keyword_group is not None else 0
+            rules_matched = len({name for match in matches for position, name in rules if match[position]})
+            scores[index] += KEYWORD_WEIGHT * keywords + REGEX_WEIGHT * rules_matched
+        return scores
+
+    def select(self, logs_data: list) -> list:
+        """
+        Renvoie les journaux dont le score atteint min_score, limités aux max_lines mieux classés,
+        dans leur ordre chronologique d'origine.
+        """
+        scores = self.score_batch(logs_data)
+        candidates = [index for index, score in enumerate(scores) if score >= self.min_score]
+        if self.max_lines and len(candidates) > self.max_lines:
+            candidates = sorted(heapq.nlargest(self.max_lines, candidates, key=scores.__getitem__))
+        if len(candidates) != len(logs_data):
+            logger.info(f"Filtre local: {len(candidates)} journaux retenus sur {len(logs_data)} pour l'analyse IA.")
+        return [logs_data[index] for index in candidates]
@@ -1,5 +1,8 @@
 import logging
 
+from config import settings
+from processors.template_miner import TemplateMiner
+
 # Configure logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO) 
@@ -9,16 +12,83 @@ if not logger.handlers:
     ch.setFormatter(formatter)
     logger.addHandler(ch)
 
+def estimate_tokens(text: str) -> int:
+    """
+    Estimation grossière du nombre de jetons d'un texte pour le modèle IA (environ 4 caractères par jeton).
+    """
+    return (len(text) + 3) // 4
+
 class LogProcessor:
+    def __init__(self):
+        # L'arbre des modèles est conservé entre les cycles pour rester peu coûteux
+        self.template_miner = TemplateMiner(
+            depth=settings.TEMPLATE_TREE_DEPTH,
+            similarity_threshold=settings.TEMPLATE_SIMILARITY_THRESHOLD,
+            max_children=settings.TEMPLATE_MAX_CHILDREN,
+            max_clusters=settings.TEMPLATE_MAX_CLUSTERS
+        ) if settings.ENABLE_TEMPLATE_MINING else None
+
     def format_logs_for_ia(self, logs_data: list) -> str:
         """
-        Formate une liste de dictionnaires de journaux bruts en une seule chaîne adaptée à l'analyse par IA.
-        Chaque message de journal est préfixé par son horodatage pour une meilleure contextualisation.
+        Formate une liste de journaux (LogRecord) en une seule chaîne adaptée à l'analyse par IA.
+        Si l'extraction de modèles est activée, les messages identiques à des valeurs près sont regroupés
+        en une seule ligne et le résultat respecte le budget de taille du prompt.
+        """
+        if self.template_miner:
+            return self.render_templates(self.mine_templates(logs_data))
+        return self.format_raw_logs(logs_data)
+
+    def prepare_logs_for_ia(self, logs_data: list) -> tuple:
+        """
+        Formate un lot pour l'IA et renvoie aussi la liste des modèles qu'il contient,
+        utilisée pour calculer l'empreinte du lot (cache des résultats IA).
+        Sans extraction de modèles, les messages bruts tiennent lieu de modèles.
+        """
+        if self.template_miner:
+            template_groups = self.mine_templates(logs_data)
+            return self.render_templates(template_groups), [group["template"] for group in template_groups]
+        return self.format_raw_logs(logs_data), [(log.message or '').strip() for log in logs_data]
+
+    def prepare_digest_for_ia(self, digest: dict) -> tuple:
+        """
+        Rend la synthèse côté serveur d'une fenêtre (voir ElasticsearchClient.fetch_log_digest) en quelques lignes
+        compactes, suivies de l'échantillon de journaux récents préparé comme un lot ordinaire.
+        Renvoie le texte, la liste des modèles (lignes de synthèse et modèles de l'échantillon) pour le cache IA,
+        et les modèles de l'échantillon seul (filtre statistique).
+        """
+        def top(values: list) -> str:
+            return ", ".join(f"{key} ({count})" for key, count in values) or "aucun"
+
+        lines = [
+            f"Synthèse de {digest['total']} journaux du {digest['start']} au {digest['end']}.",
+            f"Hôtes les plus actifs : {top(digest['hosts'])}",
+            f"Niveaux : {top(digest['levels'])}",
+            f"Codes HTTP : {top(digest['status_codes'])}",
+        ]
+        if digest["error_paths"]:
+            lines.append(f"Chemins en erreur 5xx : {top(digest['error_paths'])}")
+        if digest["keywords"]:
+            lines.append(f"Termes inhabituels des messages : {', '.join(digest['keywords'])}")
+        if digest["timeline"]:
+            lines.append(f"Chronologie (intervalles de {digest['interval']}) :")
+            for timestamp, count, levels in digest["timeline"]:
+                line = f"  {timestamp} : {count}"
+                if levels:
+                    line += f" ({top(levels)})"
+                lines.append(line)
+
+        sample_text, sample_templates = self.prepare_logs_for_ia(digest["sample"]) if digest["sample"] else ("", [])
+        lines.append(f"Échantillon des {len(digest['sample'])} journaux les plus récents :")
+        return "\n".join(lines) + "\n" + sample_text, lines + sample_templates, sample_templates
+
+    def format_raw_logs(self, logs_data: list) -> str:
+        """
+        Concatène les messages bruts, chacun préfixé par son horodatage pour une meilleure contextualisation.
         """
         formatted_logs = []
         for log in logs_data:
-            timestamp = log.get('@timestamp', 'N/A')
-            message = log.get('message', 'No message found').strip()
+            timestamp = log.timestamp or 'N/A'
+            message = (log.message if log.message is not None else 'No message found').strip()
             if message:
                 formatted_logs.append(f"[{timestamp}] {message}")
         
@@ -27,6 +97,83 @@ class LogProcessor:
             
         return "\n".join(formatted_logs)
 
+    def mine_templates(self, logs_data: list) -> list:
+        """
+        Regroupe les journaux d'un lot par modèle (jetons variables masqués).
+        Renvoie une liste de groupes triée par nombre d'occurrences décroissant, chaque groupe contenant
+        le modèle, le nombre d'occurrences, les premier et dernier horodatages, un message d'exemple
+        et quelques valeurs variables observées.
+        """
+        groups = {}
+        clusters = {}
+        for log in logs_data:
+            message = (log.message if log.message is not None else 'No message found').strip()
+            if not message:
+                continue
+            timestamp = log.timestamp or 'N/A'
+            cluster, _ = self.template_miner.add_log_message(message)
+            clusters[cluster.cluster_id] = cluster
+
+            group = groups.get(cluster.cluster_id)
+            if group is None:
+                group = groups[cluster.cluster_id] = {
+                    "count": 0,
+                    "first_timestamp": timestamp,
+                    "last_timestamp": timestamp,
+                    "sample_message": message,
+                    "samples": []
+                }
+            group["count"] += 1
+            group["last_timestamp"] = timestamp
+            if len(group["samples"]) < settings.TEMPLATE_EXAMPLES_PER_GROUP and message not in group["samples"]:
+                group["samples"].append(message)
+
+        for cluster_id, group in groups.items():
+            # Le modèle a pu être généralisé au cours du lot : on retient sa forme finale
+            cluster = clusters[cluster_id]
+            group["template"] = cluster.template
+            examples = [", ".join(self.template_miner.extract_params(cluster, sample)) for sample in group.pop("samples")]
+            group["examples"] = [example for example in examples if example]
+
+        return sorted(groups.values(), key=lambda group: group["count"], reverse=True)
+
+    def render_templates(self, template_groups: list) -> str:
+        """
+        Rend les groupes de modèles sous forme de lignes compactes pour l'IA, dans la limite de
+        LOG_PROMPT_MAX_BYTES octets et LOG_PROMPT_MAX_TOKENS jetons (0 = pas de limite).
+        Les groupes les plus fréquents sont conservés en priorité.
+        """
+        if not template_groups:
+            return "No log messages provided."
+
+        max_bytes = settings.LOG_PROMPT_MAX_BYTES
+        max_tokens = settings.LOG_PROMPT_MAX_TOKENS
+        lines = []
+        used_bytes = used_tokens = 0
+        omitted_groups = omitted_logs = 0
+        for group in template_groups:
+            if group["count"] == 1:
+                line = f"[{group['first_timestamp']}] {group['sample_message']}"
+            else:
+                line = f"[{group['count']}x {group['first_timestamp']} -> {group['last_timestamp']}] {group['template']}"
+                if group["examples"]:
+                    line += f" (exemples: {' | '.join(group['examples'])})"
+
+            line_bytes = len(line.encode("utf-8")) + 1
+            line_tokens = estimate_tokens(line)
+            if (max_bytes and used_bytes + line_bytes > max_bytes) or (max_tokens and used_tokens + line_tokens > max_tokens):
+                omitted_groups += 1
+                omitted_logs += group["count"]
+                continue
+            lines.append(line)
+            used_bytes += line_bytes
+            used_tokens += line_tokens
+
+        if omitted_groups:
+            logger.info(f"Budget du prompt atteint : {omitted_groups} modèles omis ({omitted_logs} journaux).")
+            lines.append(f"... {omitted_groups} autres modèles omis ({omitted_logs} journaux) pour respecter le budget du prompt.")
+        return "\n".join(lines)
+
     def extract_metadata_from_logs(self, logs_data: list) -> dict:
         """
         Extrait les métadonnées pertinentes d'un lot de journaux pour enrichir les résultats d'analyse de l'IA.
@@ -38,21 +185,17 @@ class LogProcessor:
 
         for log in logs_data:
             # Extraire les noms d'hôtes
-            if 'host' in log and 'name' in log['host']:
-                source_hosts.add(log['host']['name'])
+            if log.host_name is not None:
+                source_hosts.add(log.host_name)
             
-            # Extraire les types de journaux (par exemple, à partir de « event.module » ou « fileset.name »)
-            if 'event' in log and 'module' in log['event']:
-                source_log_types.add(log['event']['module'])
-            elif 'fileset' in log and 'name' in log['fileset']:
-                source_log_types.add(log['fileset']['name'])
-            elif 'agent' in log and 'type' in log['agent']: # par exemple, pour les journaux système
-                source_log_types.add(log['agent']['type'])
+            # Extraire les types de journaux (« event.module », sinon « fileset.name », sinon « agent.type »)
+            if log.log_type is not None:
+                source_log_types.add(log.log_type)
 
 
             # Ajoutez un petit échantillon de messages bruts pour le contexte dans Kibana
             if len(raw_logs_sample) < 5:# Limiter la taille de l'échantillon pour éviter les documents volumineux
-                raw_logs_sample.append(log.get('message', ''))
+                raw_logs_sample.append(log.message or '')
         
         return {
             "source_hosts": list(source_hosts),
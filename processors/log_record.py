@@ -0,0 +1,78 @@
+"""
+Représentation compacte des journaux récupérés depuis Elasticsearch.
+"""
+
+# Seuls champs du document filebeat lus par l'analyseur (projection _source de la recherche)
+LOG_SOURCE_FIELDS = [
+    "@timestamp",
+    "message",
+    "host.name",
+    "event.module",
+    "fileset.name",
+    "agent.type",
+    "log.level",
+    "http.response.status_code",
+    "tags",
+]
+
+def _field(source: dict, path: str):
+    """
+    Lit un champ ECS, imbriqué (« host": {"name": ...}) ou aplati (« host.name »).
+    """
+    if path in source:
+        return source[path]
+    value = source
+    for part in path.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+        if value is None:
+            return None
+    return value
+
+class LogRecord:
+    """
+    Journal réduit aux champs utilisés par le filtre local, l'extraction de modèles et les métadonnées.
+    Avec __slots__, un enregistrement occupe une centaine d'octets, contre plusieurs kilo-octets
+    pour le _source complet décodé en dictionnaires imbriqués.
+    """
+    __slots__ = ("timestamp", "message", "host_name", "event_module", "fileset_name", "agent_type", "level", "status_code", "tags")
+
+    def __init__(self, timestamp: str = None, message: str = None, host_name: str = None, event_module: str = None,
+                 fileset_name: str = None, agent_type: str = None, level: str = None, status_code=None, tags=None):
+        self.timestamp = timestamp
+        self.message = message
+        self.host_name = host_name
+        self.event_module = event_module
+        self.fileset_name = fileset_name
+        self.agent_type = agent_type
+        self.level = level
+        self.status_code = status_code
+        self.tags = tags
+
+    @classmethod
+    def from_source(cls, source: dict) -> "LogRecord":
+        """
+        Construit un enregistrement à partir du _source (projeté ou complet) d'un document de journal.
+        """
+        return cls(
+            _field(source, "@timestamp"),
+            _field(source, "message"),
+            _field(source, "host.name"),
+            _field(source, "event.module"),
+            _field(source, "fileset.name"),
+            _field(source, "agent.type"),
+            _field(source, "log.level"),
+            _field(source, "http.response.status_code"),
+            source.get("tags"),
+        )
+
+    @property
+    def log_type(self):
+        """
+        Type de journal : event.module, sinon fileset.name, sinon agent.type (par exemple pour les journaux système).
+        """
+        return self.event_module or self.fileset_name or self.agent_type
+
+    def __repr__(self):
+        return f"LogRecord({self.timestamp!r}, {self.message!r})"
@@ -0,0 +1,159 @@
+import logging
+import re
+import threading
+from collections import OrderedDict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+PARAM_TOKEN = "<*>"
+
+# Masquage des jetons variables, appliqué jeton par jeton pour conserver l'alignement avec le message d'origine.
+# L'ordre compte : les motifs les plus spécifiques d'abord.
+MASKING_RULES = [
+    (re.compile(r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"), "<UUID>"),
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<TS>"),
+    (re.compile(r"(?<![\w.])\d{1,3}(?:\.\d{1,3}){3}(?::\d{1,5})?(?![\w.])"), "<IP>"),
+    (re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"), "<EMAIL>"),
+    (re.compile(r"\b0x[0-9a-fA-F]+\b|\b(?=[0-9a-fA-F]*\d)[0-9a-fA-F]{12,}\b"), "<HEX>"),
+    (re.compile(r"(?<![\w.])[-+]?\d+(?:\.\d+)?(?:ms|s|kb|mb|gb|%)?(?![\w.])", re.IGNORECASE), "<NUM>"),
+]
+
+def mask_token(token: str) -> str:
+    """
+    Remplace les parties variables d'un jeton (identifiants, adresses IP, nombres...) par un marqueur.
+    """
+    for pattern, replacement in MASKING_RULES:
+        token = pattern.sub(replacement, token)
+    return token
+
+class LogCluster:
+    """
+    Groupe de messages partageant le même modèle (template).
+    """
+    __slots__ = ("cluster_id", "template_tokens", "size")
+
+    def __init__(self, cluster_id: int, template_tokens: list):
+        self.cluster_id = cluster_id
+        self.template_tokens = template_tokens
+        self.size = 0
+
+    @property
+    def template(self) -> str:
+        return " ".join(self.template_tokens)
+
+class TemplateMiner:
+    """
+    Extraction incrémentale de modèles de journaux inspirée de l'algorithme Drain :
+    les messages sont rangés dans un arbre de préfixes (longueur, puis premiers jetons) et
+    rattachés au groupe le plus similaire de la feuille, dont le modèle est généralisé si besoin.
+    L'arbre est conservé d'un cycle à l'autre pour que l'extraction reste peu coûteuse.
+    """
+    def __init__(self, depth: int = 4, similarity_threshold: float = 0.4,
+                 max_children: int = 100, max_clusters: int = 5000):
+        self.depth = max(3, depth)
+        self.similarity_threshold = similarity_threshold
+        self.max_children = max_children
+        self.max_clusters = max_clusters
+        self.root = {}
+        self.clusters = OrderedDict() # cluster_id -> LogCluster, du moins au plus récemment utilisé
+        self._next_cluster_id = 1
+        self._lock = threading.Lock()
+
+    def add_log_message(self, message: str):
+        """
+        Rattache un message à son modèle (en créant ou généralisant le modèle si besoin).
+        Renvoie le groupe et la liste des valeurs variables du message.
+        """
+        tokens = message.split()
+        masked_tokens = [mask_token(token) for token in tokens]
+
+        with self._lock:
+            leaf = self._get_leaf(masked_tokens)
+            cluster = self._best_match(leaf, masked_tokens)
+            if cluster is None:
+                cluster = LogCluster(self._next_cluster_id, list(masked_tokens))
+                self._next_cluster_id += 1
+                leaf.append(cluster.cluster_id)
+                self.clusters[cluster.cluster_id] = cluster
+                self._evict_if_needed()
+            else:
+                cluster.template_tokens = [
+                    template_token if template_token == token else PARAM_TOKEN
+                    for template_token, token in zip(cluster.template_tokens, masked_tokens)
+                ]
+                self.clusters.move_to_end(cluster.cluster_id)
+            cluster.size += 1
+            template_tokens = list(cluster.template_tokens)
+
+        return cluster, self._params(template_tokens, tokens, masked_tokens)
+
+    def extract_params(self, cluster: LogCluster, message: str) -> list:
+        """
+        Renvoie les valeurs variables d'un message par rapport au modèle actuel d'un groupe.
+        """
+        tokens = message.split()
+        return self._params(list(cluster.template_tokens), tokens, [mask_token(token) for token in tokens])
+
+    @staticmethod
+    def _params(template_tokens: list, tokens: list, masked_tokens: list) -> list:
+        return [
+            token for token, masked, template_token in zip(tokens, masked_tokens, template_tokens)
+            if token != masked or template_token == PARAM_TOKEN
+        ]
+
+    def _get_leaf(self, tokens: list) -> list:
+        """
+        Descend dans l'arbre (longueur du message, puis premiers jetons) et renvoie la liste des groupes de la feuille.
+        """
+        node = self.root.setdefault(len(tokens), {})
+        for token in tokens[:self.depth - 2]:
+            if any(char.isdigit() for char in token) or token.startswith("<"):
+                token = PARAM_TOKEN
+            if token not in node:
+                if len(node) >= self.max_children:
+                    token = PARAM_TOKEN
+                node = node.setdefault(token, {})
+            else:
+                node = node[token]
+        return node.setdefault(None, [])
+
+    def _best_match(self, leaf: list, tokens: list):
+        """
+        Renvoie le groupe de la feuille le plus similaire au message, ou None sous le seuil de similarité.
+        """
+        best_cluster, best_similarity, best_params = None, -1.0, -1
+        alive_ids = []
+        for cluster_id in leaf:
+            cluster = self.clusters.get(cluster_id)
+            if cluster is None:
+                continue # Groupe évincé
+            alive_ids.append(cluster_id)
+            same = params = 0
+            for template_token, token in zip(cluster.template_tokens, tokens):
+                if template_token == PARAM_TOKEN:
+                    params += 1
+                elif template_token == token:
+                    same += 1
+            similarity = same / len(tokens) if tokens else 1.0
+            if similarity > best_similarity or (similarity == best_similarity and params > best_params):
+                best_cluster, best_similarity, best_params = cluster, similarity, params
+        if len(alive_ids) != len(leaf):
+            leaf[:] = alive_ids
+        if best_cluster is not None and best_similarity >= self.similarity_threshold:
+            return best_cluster
+        return None
+
+    def _evict_if_needed(self):
+        """
+        Évince les groupes les moins récemment utilisés au-delà de max_clusters (borne la mémoire).
+        Les identifiants évincés sont retirés paresseusement des feuilles de l'arbre.
+        """
+        while len(self.clusters) > self.max_clusters:
+            self.clusters.popitem(last=False)
@@ -1,8 +1,13 @@
+import hashlib
 import logging
+import threading
 from datetime import datetime, timedelta
 
+from elasticsearch.helpers import bulk
+
 from config import settings
-from core.elasticsearch_client import ElasticsearchClient 
+from core.elasticsearch_client import ANALYSIS_STATE_MAPPING, ElasticsearchClient
+from utils import metrics
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -14,58 +19,208 @@ if not logger.handlers:
     logger.addHandler(ch)
 
 class AnalysisStateManager:
-    def __init__(self, es_client: ElasticsearchClient):
+    def __init__(self, es_client: ElasticsearchClient, spool=None):
         self.es_client = es_client
+        self.spool = spool # Journal d'écriture (core.write_spool.WriteSpool) : les états y sont ajoutés au lieu d'être écrits directement
+        self._lock = threading.Lock()
+        self._cache = {} # client_id -> dernier horodatage traité
+        self._loaded = set() # clients dont l'état a déjà été chargé depuis ES
+        self._pending = {} # client_id -> document d'état en attente d'écriture
+        # Derniers états ajoutés au journal d'écriture, qui peuvent ne pas encore avoir été relus vers ES
+        self._spooled = self._load_spooled_states() if spool is not None else {}
         # Assurez-vous que l'index d'état existe avec le mappage correct
-        self.es_client.create_index_if_not_exists(settings.ANALYSIS_STATE_INDEX, {
-            "properties": {
-                "analysis_timestamp": {"type": "date"},
-                "client_id": {"type": "keyword"},
-                "last_processed_timestamp": {"type": "date"},
-                "status": {"type": "keyword"}
-            }
-        })
+        self.es_client.create_index_if_not_exists(settings.ANALYSIS_STATE_INDEX, ANALYSIS_STATE_MAPPING)
 
 
-    def get_last_analysis_timestamp(self, client_id: str) -> str:
+    def _load_spooled_states(self) -> dict:
         """
-        Récupère l'horodatage du dernier journal traité avec succès pour un client spécifique.
-        Si aucun état n'est trouvé, renvoie un horodatage légèrement antérieur à l'heure actuelle, basé sur INITIAL_LOOKBACK_SECONDS.
+        Relit les états encore en attente dans le journal d'écriture (par exemple après un redémarrage
+        alors qu'Elasticsearch était indisponible), pour ne pas reprendre l'analyse depuis un état plus ancien.
+        """
+        spooled = {}
+        for action in self.spool.pending_actions():
+            if action["_index"] == settings.ANALYSIS_STATE_INDEX and "last_processed_timestamp" in action.get("_source", {}):
+                spooled[action["_source"]["client_id"]] = action["_source"]["last_processed_timestamp"]
+        if spooled:
+            logger.info(f"{len(spooled)} états d'analyse en attente repris depuis le journal d'écriture.")
+        return spooled
+
+    @staticmethod
+    def _state_doc_id(client_id: str) -> str:
+        """
+        Renvoie l'identifiant déterministe du document d'état d'un client (un seul document par client).
+        Les identifiants trop longs pour Elasticsearch (> 512 octets) sont remplacés par leur empreinte SHA-1.
+        """
+        if len(client_id.encode("utf-8")) <= 512:
+            return client_id
+        return hashlib.sha1(client_id.encode("utf-8")).hexdigest()
+
+    def load_states(self, client_ids: list):
         """
+        Charge en une seule requête mget l'état de tous les clients du cycle dans le cache local.
+        Les clients sans document déterministe sont recherchés en une seule requête msearch
+        parmi les anciens documents d'état (migration depuis le format un-document-par-cycle).
+        """
+        if not client_ids:
+            return
+        ids_to_clients = {self._state_doc_id(client_id): client_id for client_id in client_ids}
+        found = {}
         try:
-            res = self.es_client.es.search(index=settings.ANALYSIS_STATE_INDEX, body={
+            res = self.es_client.es.mget(index=settings.ANALYSIS_STATE_INDEX, ids=list(ids_to_clients))
+            for doc in res['docs']:
+                if doc.get('found'):
+                    found[ids_to_clients[doc['_id']]] = doc['_source']['last_processed_timestamp']
+        except Exception as e:
+            logger.warning(f"Échec du chargement groupé de l'état d'analyse depuis ES: {e}")
+            return
+
+        missing = [client_id for client_id in client_ids if client_id not in found]
+        if missing:
+            found.update(self._load_legacy_states(missing))
+        # Un état du journal d'écriture pas encore relu vers ES est plus récent que celui d'ES
+        # (horodatages ISO 8601 au même format : l'ordre lexicographique est l'ordre chronologique)
+        with self._lock:
+            for client_id in client_ids:
+                if client_id in self._spooled:
+                    found[client_id] = max(found.get(client_id) or "", self._spooled[client_id])
+
+        with self._lock:
+            self._cache.update(found)
+            self._loaded.update(client_ids)
+        logger.info(f"État d'analyse chargé pour {len(found)} clients sur {len(client_ids)}.")
+
+    def _load_legacy_states(self, client_ids: list) -> dict:
+        """
+        Recherche le dernier document d'état non déterministe de chaque client en une seule requête msearch.
+        """
+        searches = []
+        for client_id in client_ids:
+            searches.append({"index": settings.ANALYSIS_STATE_INDEX})
+            searches.append({
                 "size": 1,
                 "sort": [{"last_processed_timestamp": {"order": "desc"}}],
-                "query": {
-                    "term": {"client_id.keyword": client_id} # Filter by client_id
-                }
+                # Seuls les documents d'état : l'index contient aussi les baux et les points de reprise
+                # des rejeux historiques (doc_type), qui portent un client_id sans last_processed_timestamp
+                "query": {"bool": {"filter": [
+                    {"term": {"client_id": client_id}},
+                    {"exists": {"field": "last_processed_timestamp"}},
+                ]}}
             })
-            if res['hits']['hits']:
-                timestamp = res['hits']['hits'][0]['_source']['last_processed_timestamp']
-                logger.debug(f"Last processed timestamp for client '{client_id}': {timestamp}")
-                return timestamp
+        legacy_states = {}
+        try:
+            res = self.es_client.es.msearch(searches=searches)
+            for client_id, response in zip(client_ids, res['responses']):
+                hits = response.get('hits', {}).get('hits', [])
+                if hits and hits[0]['_source'].get('last_processed_timestamp'):
+                    legacy_states[client_id] = hits[0]['_source']['last_processed_timestamp']
         except Exception as e:
-            logger.warning(f"Failed to retrieve last timestamp for client '{client_id}' from ES: {e}")
-        
+            logger.warning(f"Échec de la recherche des anciens états d'analyse: {e}")
+        return legacy_states
+
+    def get_last_analysis_timestamp(self, client_id: str) -> str:
+        """
+        Récupère l'horodatage du dernier journal traité avec succès pour un client spécifique.
+        L'état est lu depuis le cache local, chargé par load_states() au début du cycle.
+        Si aucun état n'est trouvé, renvoie un horodatage légèrement antérieur à l'heure actuelle, basé sur INITIAL_LOOKBACK_SECONDS.
+        """
+        with self._lock:
+            loaded = client_id in self._loaded
+        if not loaded:
+            # Client absent du chargement groupé : chargement individuel
+            self.load_states([client_id])
+
+        with self._lock:
+            timestamp = self._cache.get(client_id)
+        if timestamp:
+            logger.debug(f"Last processed timestamp for client '{client_id}': {timestamp}")
+            return timestamp
+
         # Solution de secours pour les nouveaux clients ou les erreurs
         fallback_timestamp = (datetime.utcnow() - timedelta(seconds=settings.INITIAL_LOOKBACK_SECONDS)).isoformat(timespec='milliseconds') + "Z"
         logger.info(f"Aucun état précédent trouvé pour le client '{client_id}' ou une erreur s'est produite. Démarrage de l'analyse à partir de: {fallback_timestamp}")
         return fallback_timestamp
 
+    def peek_last_analysis_timestamp(self, client_id: str):
+        """
+        Renvoie l'horodatage en cache du dernier journal traité pour un client, ou None si le client n'a pas d'état.
+        """
+        with self._lock:
+            return self._cache.get(client_id)
+
     def update_last_analysis_timestamp(self, client_id: str, timestamp: str):
         """
         Met à jour l'horodatage du dernier journal traité avec succès pour un client spécifique.
+        La mise à jour est conservée en mémoire jusqu'au prochain appel à flush().
         """
-        try:
-            doc = {
-                "analysis_timestamp": datetime.utcnow().isoformat(timespec='milliseconds') + "Z",
-                "client_id": client_id, # Crucially, store the client ID
-                "last_processed_timestamp": timestamp,
-                "status": "completed"
+        doc = {
+            "analysis_timestamp": datetime.utcnow().isoformat(timespec='milliseconds') + "Z",
+            "client_id": client_id, # Crucially, store the client ID
+            "last_processed_timestamp": timestamp,
+            "status": "completed"
+        }
+        with self._lock:
+            self._cache[client_id] = timestamp
+            self._loaded.add(client_id)
+            self._pending[client_id] = doc
+        logger.debug(f"État d'analyse mis en attente pour le client '{client_id}': traité jusqu'à {timestamp}")
+
+    def discard_updates(self, client_ids):
+        """
+        Annule les mises à jour d'état en attente de ces clients (par exemple parce que leurs résultats
+        n'ont pas pu être écrits) : leur état est relu depuis Elasticsearch au prochain accès, et les journaux
+        concernés sont analysés de nouveau.
+        """
+        with self._lock:
+            for client_id in client_ids:
+                self._pending.pop(client_id, None)
+                self._cache.pop(client_id, None)
+                self._loaded.discard(client_id)
+
+    def flush(self):
+        """
+        Écrit en une seule requête bulk tous les états en attente, un document par client (upsert par _id).
+        Les mises à jour en échec sont conservées pour le prochain flush.
+        Avec un journal d'écriture, les états y sont ajoutés et écrits sur disque.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        ids_to_clients = {self._state_doc_id(client_id): client_id for client_id in pending}
+        if self.spool is not None:
+            # Ajoutés après les résultats du cycle : le journal ne fait jamais avancer l'état avant leur écriture
+            for doc_id, client_id in ids_to_clients.items():
+                self.spool.append({"_op_type": "index", "_index": settings.ANALYSIS_STATE_INDEX, "_id": doc_id, "_source": pending[client_id]})
+            self.spool.sync()
+            with self._lock:
+                self._spooled.update({client_id: doc["last_processed_timestamp"] for client_id, doc in pending.items()})
+            metrics.STATE_WRITES.inc(len(pending), outcome="spooled")
+            logger.info(f"État d'analyse de {len(pending)} clients ajouté au journal d'écriture.")
+            return
+        actions = [
+            {
+                "_op_type": "index", # « index » crée le document s'il n'existe pas et le remplace sinon
+                "_index": settings.ANALYSIS_STATE_INDEX,
+                "_id": doc_id,
+                "_source": pending[client_id],
             }
-            # Utilisez « create » avec un ID dérivé de client_id pour éviter les doublons au redémarrage
-            # Ou utilisez « index » qui mettra à jour s'il existe, créera s'il n'existe pas
-            self.es_client.es.index(index=settings.ANALYSIS_STATE_INDEX, document=doc)
-            logger.info(f"État d'analyse mis à jour pour le client '{client_id}': traité jusqu'à {timestamp}")
+            for doc_id, client_id in ids_to_clients.items()
+        ]
+        try:
+            with self.es_client.write_slots:
+                success, errors = bulk(self.es_client.es, actions, raise_on_error=False)
+            failed = [ids_to_clients[error['index']['_id']] for error in errors]
         except Exception as e:
-            logger.error(f"Erreur lors de la mise à jour de l'état d'analyse pour le client '{client_id}': {e}", exc_info=True)
\ No newline at end of file
+            logger.error(f"Erreur lors de l'écriture groupée de l'état d'analyse: {e}", exc_info=True)
+            success, failed = 0, list(pending)
+
+        metrics.STATE_WRITES.inc(len(pending) - len(failed), outcome="ok")
+        if failed:
+            metrics.STATE_WRITES.inc(len(failed), outcome="failed")
+            logger.error(f"Échec de la mise à jour de l'état d'analyse pour {len(failed)} clients, nouvel essai au prochain flush.")
+            with self._lock:
+                for client_id in failed:
+                    # Ne pas écraser une mise à jour plus récente arrivée entre-temps
+                    self._pending.setdefault(client_id, pending[client_id])
+        logger.info(f"État d'analyse mis à jour pour {success} clients.")
\ No newline at end of file
@@ -0,0 +1,64 @@
+import hashlib
+import logging
+from datetime import datetime
+
+from config import settings
+from core.elasticsearch_client import ElasticsearchClient
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+BACKFILL_DOC_PREFIX = "backfill#"
+
+class BackfillCheckpoints:
+    """
+    Points de reprise d'un rejeu historique : un document « backfill# » par tranche terminée (client, début de tranche)
+    dans l'index d'état, à côté des états d'analyse des clients, qu'il ne modifie pas.
+    Relancer le même rejeu ne traite que les tranches sans point de reprise.
+    """
+    def __init__(self, es_client: ElasticsearchClient, job_id: str):
+        self.es_client = es_client
+        self.index_name = settings.ANALYSIS_STATE_INDEX
+        self.job_id = job_id
+
+    def _doc_id(self, client_id: str, slice_start: str) -> str:
+        doc_id = f"{BACKFILL_DOC_PREFIX}{self.job_id}#{client_id}#{slice_start}"
+        if len(doc_id.encode("utf-8")) <= 512:
+            return doc_id
+        return BACKFILL_DOC_PREFIX + hashlib.sha1(doc_id.encode("utf-8")).hexdigest()
+
+    def completed(self, slices: list) -> set:
+        """
+        Renvoie, parmi les tranches (client_id, début de tranche) du rejeu, celles qui sont déjà terminées
+        (requêtes mget par paquets de 1000 identifiants déterministes).
+        """
+        ids_to_slices = {self._doc_id(client_id, slice_start): (client_id, slice_start) for client_id, slice_start in slices}
+        ids = list(ids_to_slices)
+        done = set()
+        for offset in range(0, len(ids), 1000):
+            res = self.es_client.es.mget(index=self.index_name, ids=ids[offset:offset + 1000], _source=False)
+            done.update(ids_to_slices[doc['_id']] for doc in res['docs'] if doc.get('found'))
+        return done
+
+    def mark_done(self, client_id: str, slice_start: str, slice_end: str, outcome: dict):
+        """
+        Enregistre une tranche terminée. À appeler une fois ses résultats écrits (BulkResultWriter.flush) :
+        une tranche interrompue avant son point de reprise est analysée de nouveau à la reprise.
+        """
+        self.es_client.es.index(index=self.index_name, id=self._doc_id(client_id, slice_start), document={
+            "doc_type": "backfill_slice",
+            "backfill_job": self.job_id,
+            "client_id": client_id,
+            "slice_start": slice_start,
+            "slice_end": slice_end,
+            "analysis_timestamp": datetime.utcnow().isoformat(timespec='milliseconds') + "Z",
+            "status": "completed",
+            "batches": outcome["batches"],
+            "logs": outcome["logs"],
+        })
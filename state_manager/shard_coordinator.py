@@ -0,0 +1,262 @@
+import bisect
+import hashlib
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from elasticsearch.helpers import streaming_bulk
+
+from config import settings
+from core.elasticsearch_client import ElasticsearchClient
+from utils import metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+MEMBER_DOC_PREFIX = "member#"
+LEASE_DOC_PREFIX = "lease#"
+
+def _utc_iso(moment: datetime) -> str:
+    return moment.isoformat(timespec='milliseconds') + "Z"
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.sha1(value.encode("utf-8")).digest()[:8], "big")
+
+class HashRing:
+    """
+    Anneau de hachage cohérent : chaque instance occupe plusieurs points virtuels, et un client appartient
+    à la première instance rencontrée après son empreinte. L'ajout ou le départ d'une instance
+    ne déplace que les clients de la portion d'anneau concernée.
+    """
+    def __init__(self, members: list, virtual_nodes: int = 64):
+        points = sorted((_hash(f"{member}#{index}"), member) for member in members for index in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._members = [member for _, member in points]
+
+    def owner(self, client_id: str):
+        if not self._hashes:
+            return None
+        position = bisect.bisect_right(self._hashes, _hash(client_id)) % len(self._hashes)
+        return self._members[position]
+
+class ShardCoordinator:
+    """
+    Répartit les clients entre plusieurs instances de l'analyseur.
+
+    Chaque instance publie un battement de cœur (document « member# » dans l'index d'état) et les instances
+    vivantes se partagent les clients par hachage cohérent. Avant de traiter un client, une instance obtient
+    un bail (document « lease# ») écrit avec contrôle de concurrence optimiste (op_type create ou
+    if_seq_no/if_primary_term) : un client n'est traité que par le détenteur de son bail.
+    Les baux sont renouvelés avec le battement de cœur; ceux d'une instance arrêtée expirent
+    et ses clients sont repris par les instances restantes.
+    """
+    def __init__(self, es_client: ElasticsearchClient, instance_id: str = None):
+        self.es_client = es_client
+        self.index_name = settings.ANALYSIS_STATE_INDEX
+        self.instance_id = instance_id or settings.INSTANCE_ID or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.heartbeat_interval = settings.SHARD_HEARTBEAT_INTERVAL_SECONDS
+        self.member_ttl = timedelta(seconds=settings.SHARD_MEMBER_TTL_SECONDS)
+        self.lease_ttl = timedelta(seconds=settings.SHARD_LEASE_TTL_SECONDS)
+        self.virtual_nodes = settings.SHARD_VIRTUAL_NODES
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock() # Sérialise les écritures de baux (cycle et thread de battement de cœur)
+        self._held = {} # client_id -> (_seq_no, _primary_term) du bail détenu
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _lease_doc_id(client_id: str) -> str:
+        lease_id = LEASE_DOC_PREFIX + client_id
+        if len(lease_id.encode("utf-8")) <= 512:
+            return lease_id
+        return LEASE_DOC_PREFIX + hashlib.sha1(client_id.encode("utf-8")).hexdigest()
+
+    def start(self):
+        """
+        Enregistre l'instance et démarre le thread de battement de cœur (qui renouvelle aussi les baux).
+        """
+        self.heartbeat()
+        self._thread = threading.Thread(target=self._run, name="shard-heartbeat", daemon=True)
+        self._thread.start()
+        logger.info(f"Instance '{self.instance_id}' enregistrée pour la répartition des clients.")
+
+    def _run(self):
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+                self._renew_leases()
+            except Exception as e:
+                logger.error(f"Échec du battement de cœur de l'instance '{self.instance_id}': {e}", exc_info=True)
+
+    def heartbeat(self):
+        now = datetime.utcnow()
+        self.es_client.es.index(index=self.index_name, id=MEMBER_DOC_PREFIX + self.instance_id, document={
+            "doc_type": "member",
+            "instance_id": self.instance_id,
+            "heartbeat": _utc_iso(now),
+            "expires_at": _utc_iso(now + self.member_ttl),
+        })
+
+    def live_members(self) -> list:
+        """
+        Renvoie les instances dont le battement de cœur n'a pas expiré (toujours au moins cette instance).
+        """
+        members = {self.instance_id}
+        try:
+            res = self.es_client.es.search(index=self.index_name, body={
+                "size": 10000,
+                "query": {"bool": {"filter": [
+                    {"term": {"doc_type": "member"}},
+                    {"range": {"expires_at": {"gt": _utc_iso(datetime.utcnow())}}},
+                ]}},
+            })
+            members.update(hit["_source"]["instance_id"] for hit in res["hits"]["hits"])
+        except Exception as e:
+            logger.warning(f"Impossible de lire les instances actives, répartition sur les instances connues: {e}")
+        return sorted(members)
+
+    def claim(self, client_ids):
+        """
+        Renvoie les clients de client_ids attribués à cette instance et dont elle détient le bail.
+        client_ids peut être une liste ou un dictionnaire (voir ElasticsearchClient.get_active_clients_with_latest),
+        renvoyé sous la même forme. Les baux des clients attribués à une autre instance sont libérés.
+        """
+        members = self.live_members()
+        ring = HashRing(members, self.virtual_nodes)
+        wanted = [client_id for client_id in client_ids if ring.owner(client_id) == self.instance_id]
+
+        with self._write_lock:
+            wanted_set = set(wanted)
+            with self._lock:
+                released = [client_id for client_id in self._held if client_id not in wanted_set]
+            if released:
+                self._release(released)
+            granted = self._acquire(wanted)
+        metrics.SHARD_MEMBERS.set(len(members))
+        metrics.SHARD_OWNED_CLIENTS.set(len(granted))
+        logger.info(f"{len(members)} instance(s) active(s) : {len(wanted)} clients attribués à '{self.instance_id}', "
+                    f"{len(granted)} baux obtenus, {len(released)} libérés.")
+        if isinstance(client_ids, dict):
+            return {client_id: client_ids[client_id] for client_id in granted}
+        return granted
+
+    def _lease_action(self, client_id: str, current: tuple = None) -> dict:
+        now = datetime.utcnow()
+        action = {
+            "_index": self.index_name,
+            "_id": self._lease_doc_id(client_id),
+            "_source": {
+                "doc_type": "lease",
+                "lease_client_id": client_id,
+                "holder": self.instance_id,
+                "renewed_at": _utc_iso(now),
+                "expires_at": _utc_iso(now + self.lease_ttl),
+            },
+        }
+        if current is None:
+            action["_op_type"] = "create" # Échoue si une autre instance a créé le bail entre-temps
+        else:
+            action["_op_type"] = "index"
+            action["if_seq_no"], action["if_primary_term"] = current
+        return action
+
+    def _acquire(self, client_ids: list) -> list:
+        """
+        Obtient ou renouvelle les baux des clients donnés. Un bail détenu par une autre instance
+        n'est repris qu'après son expiration.
+        """
+        if not client_ids:
+            return []
+        ids_to_clients = {self._lease_doc_id(client_id): client_id for client_id in client_ids}
+        try:
+            res = self.es_client.es.mget(index=self.index_name, ids=list(ids_to_clients))
+        except Exception as e:
+            logger.error(f"Impossible de lire les baux des clients: {e}")
+            return []
+
+        now_iso = _utc_iso(datetime.utcnow())
+        actions = []
+        for doc in res["docs"]:
+            client_id = ids_to_clients[doc["_id"]]
+            if not doc.get("found"):
+                actions.append(self._lease_action(client_id))
+                continue
+            lease = doc["_source"]
+            if lease.get("holder") == self.instance_id or lease.get("expires_at", "") <= now_iso:
+                actions.append(self._lease_action(client_id, (doc["_seq_no"], doc["_primary_term"])))
+            else:
+                logger.debug(f"Bail du client '{client_id}' détenu par '{lease.get('holder')}' jusqu'à {lease.get('expires_at')}.")
+        return self._write_leases(actions)
+
+    def _renew_leases(self):
+        with self._write_lock:
+            with self._lock:
+                held = dict(self._held)
+            if held:
+                self._write_leases([self._lease_action(client_id, current) for client_id, current in held.items()])
+
+    def _write_leases(self, actions: list) -> list:
+        """
+        Écrit les baux par requête bulk et met à jour les baux détenus. Renvoie les clients dont le bail est obtenu.
+        """
+        granted = []
+        lost = []
+        for action, (ok, item) in zip(actions, streaming_bulk(self.es_client.es, actions, raise_on_error=False,
+                                                              raise_on_exception=False, yield_ok=True)):
+            client_id = action["_source"]["lease_client_id"]
+            info = next(iter(item.values()), {})
+            if ok:
+                granted.append(client_id)
+                with self._lock:
+                    self._held[client_id] = (info["_seq_no"], info["_primary_term"])
+            else:
+                lost.append(client_id)
+                with self._lock:
+                    self._held.pop(client_id, None)
+        if lost:
+            metrics.SHARD_LEASE_CONFLICTS.inc(len(lost))
+            logger.info(f"{len(lost)} baux non obtenus ou perdus (détenus par une autre instance).")
+        return granted
+
+    def _release(self, client_ids: list):
+        """
+        Supprime les baux des clients donnés, sauf s'ils ont été repris entre-temps.
+        """
+        with self._lock:
+            actions = [
+                {"_op_type": "delete", "_index": self.index_name, "_id": self._lease_doc_id(client_id),
+                 "if_seq_no": self._held[client_id][0], "if_primary_term": self._held[client_id][1]}
+                for client_id in client_ids if client_id in self._held
+            ]
+            for client_id in client_ids:
+                self._held.pop(client_id, None)
+        for ok, item in streaming_bulk(self.es_client.es, actions, raise_on_error=False, raise_on_exception=False):
+            if not ok:
+                logger.debug(f"Bail déjà repris ou supprimé: {item}")
+
+    def stop(self):
+        """
+        Arrête le battement de cœur, libère les baux et retire l'instance pour que ses clients soient repris sans attendre.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        try:
+            with self._write_lock:
+                with self._lock:
+                    held = list(self._held)
+                self._release(held)
+            self.es_client.es.delete(index=self.index_name, id=MEMBER_DOC_PREFIX + self.instance_id)
+            logger.info(f"Instance '{self.instance_id}' retirée, {len(held)} baux libérés.")
+        except Exception as e:
+            logger.warning(f"Échec du retrait de l'instance '{self.instance_id}': {e}")
@@ -0,0 +1,53 @@
+from datetime import timedelta
+
+from core.backfill import split_slices
+from utils.time_utils import parse_timestamp
+
+def _check_contiguous(slices: list, start_timestamp: str, end_timestamp: str, slice_seconds: int):
+    assert parse_timestamp(slices[0][0]) == parse_timestamp(start_timestamp)
+    assert parse_timestamp(slices[-1][1]) == parse_timestamp(end_timestamp)
+    for (_, previous_end), (next_start, _) in zip(slices, slices[1:]):
+        assert previous_end == next_start
+    for slice_start, slice_end in slices:
+        assert timedelta(0) < parse_timestamp(slice_end) - parse_timestamp(slice_start) <= timedelta(seconds=slice_seconds)
+
+def test_split_slices_across_utc_day_and_year_boundary():
+    slices = split_slices("2026-12-31T23:30:00Z", "2027-01-01T00:45:00Z", 1800)
+    assert slices == [
+        ("2026-12-31T23:30:00.000Z", "2027-01-01T00:00:00.000Z"),
+        ("2027-01-01T00:00:00.000Z", "2027-01-01T00:30:00.000Z"),
+        ("2027-01-01T00:30:00.000Z", "2027-01-01T00:45:00.000Z"),
+    ]
+    _check_contiguous(slices, "2026-12-31T23:30:00Z", "2027-01-01T00:45:00Z", 1800)
+
+def test_split_slices_across_spring_forward_uses_elapsed_time():
+    # Europe/Paris, 29 mars 2026 : 02:00 (+01:00) devient 03:00 (+02:00); 01:30 -> 04:30 locales = 2 heures réelles
+    slices = split_slices("2026-03-29T01:30:00+01:00", "2026-03-29T04:30:00+02:00", 3600)
+    assert slices == [
+        ("2026-03-29T00:30:00.000Z", "2026-03-29T01:30:00.000Z"),
+        ("2026-03-29T01:30:00.000Z", "2026-03-29T02:30:00.000Z"),
+    ]
+
+def test_split_slices_across_fall_back_keeps_the_repeated_hour():
+    # Europe/Paris, 25 octobre 2026 : 03:00 (+02:00) redevient 02:00 (+01:00); même heure locale, une heure réelle d'écart
+    slices = split_slices("2026-10-25T02:30:00+02:00", "2026-10-25T02:30:00+01:00", 1800)
+    assert slices == [
+        ("2026-10-25T00:30:00.000Z", "2026-10-25T01:00:00.000Z"),
+        ("2026-10-25T01:00:00.000Z", "2026-10-25T01:30:00.000Z"),
+    ]
+
+def test_split_slices_with_mixed_offsets_and_fractional_seconds():
+    slices = split_slices("2026-06-30T23:59:59.123456789Z", "2026-07-01T03:00:00.5+02:00", 3600)
+    assert slices[0][0] == "2026-06-30T23:59:59.123Z"
+    assert slices[-1][1] == "2026-07-01T01:00:00.500Z"
+    # Bornes écrites à la milliseconde (précision des dates Elasticsearch)
+    _check_contiguous(slices, "2026-06-30T23:59:59.123Z", "2026-07-01T01:00:00.5Z", 3600)
+
+def test_split_slices_treats_naive_timestamps_as_utc():
+    assert split_slices("2026-03-29T00:00:00", "2026-03-29T01:00:00", 3600) == [("2026-03-29T00:00:00.000Z", "2026-03-29T01:00:00.000Z")]
+
+def test_split_slices_empty_or_degenerate_ranges():
+    assert split_slices("2026-01-01T01:00:00Z", "2026-01-01T01:00:00Z", 3600) == []
+    assert split_slices("2026-01-01T02:00:00Z", "2026-01-01T01:00:00Z", 3600) == []
+    # Durée de tranche nulle : ramenée à une seconde
+    assert len(split_slices("2026-01-01T00:00:00Z", "2026-01-01T00:00:03Z", 0)) == 3
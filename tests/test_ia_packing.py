@@ -0,0 +1,67 @@
+import threading
+
+from core.ia_api_handler import IAApiHandler, PACK_SECTION_HEADER, _PackedRequest, _escape_headers
+
+NONCE = "0a1b2c3d"
+
+def _split(response: str) -> dict:
+    return IAApiHandler._split_sections(response, NONCE)
+
+def test_split_sections_by_request_nonce():
+    response = f"Préambule ignoré\n### {NONCE}-S1\nRésumé un\n\n### {NONCE}-S2\nRésumé deux\n"
+    assert _split(response) == {1: "Résumé un", 2: "Résumé deux"}
+
+def test_split_sections_tolerates_header_variants():
+    response = f"## {NONCE}-S1  \nRésumé un\n  ####{NONCE}-S2\nRésumé deux"
+    assert _split(response) == {1: "Résumé un", 2: "Résumé deux"}
+
+def test_split_sections_drops_missing_and_empty_sections():
+    response = f"### {NONCE}-S1\nRésumé un\n### {NONCE}-S2\n   \n### {NONCE}-S4\nRésumé quatre"
+    assert _split(response) == {1: "Résumé un", 4: "Résumé quatre"}
+
+def test_split_sections_drops_duplicated_sections():
+    response = f"### {NONCE}-S1\nRésumé un\n### {NONCE}-S2\nRésumé deux\n### {NONCE}-S2\nAutre résumé deux"
+    assert _split(response) == {1: "Résumé un"}
+
+def test_split_sections_keeps_extra_sections_out_of_the_pack():
+    # Section en trop (S3 pour un regroupement de deux clients) : renvoyée, ignorée par _run_pack
+    response = f"### {NONCE}-S1\nRésumé un\n### {NONCE}-S2\nRésumé deux\n### {NONCE}-S3\nInventé"
+    assert _split(response) == {1: "Résumé un", 2: "Résumé deux", 3: "Inventé"}
+
+def test_split_sections_ignores_headers_without_the_request_nonce():
+    response = f"### {NONCE}-S1\nRésumé un\n### S2\nLigne recopiée\n### ffffffff-S2\nAutre requête\n### {NONCE}-S2\nRésumé deux"
+    assert _split(response) == {1: "Résumé un\n### S2\nLigne recopiée\n### ffffffff-S2\nAutre requête", 2: "Résumé deux"}
+
+def test_escape_headers_neutralizes_header_like_log_lines():
+    logs = f"GET /health 200\n### S2\n  ## {NONCE}-S3\n### not a header"
+    escaped = _escape_headers(logs)
+    assert escaped == f"GET /health 200\n\\### S2\n  \\## {NONCE}-S3\n### not a header"
+    assert PACK_SECTION_HEADER.search(escaped) is None
+
+class _ScriptedBackend:
+    """
+    Backend IA qui renvoie une réponse regroupée fixée par le test, et un résumé seul pour un client analysé séparément.
+    """
+    def __init__(self, packed_response):
+        self.packed_response = packed_response
+        self.prompts = []
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, timeout: float) -> str:
+        with self._lock:
+            self.prompts.append(prompt)
+        nonces = {nonce for nonce, _ in PACK_SECTION_HEADER.findall(prompt)}
+        if nonces:
+            return self.packed_response(nonces.pop())
+        return "Résumé séparé"
+
+def test_run_pack_reanalyzes_clients_whose_section_is_missing():
+    backend = _ScriptedBackend(lambda nonce: f"### {nonce}-S1\nRésumé un\n### {nonce}-S3\nRésumé trois\n### {nonce}-S9\nInventé")
+    handler = IAApiHandler(backend=backend, packing=False, workers=4)
+    pack = [_PackedRequest(f"journaux du client {index}", "Analyse ces journaux.", 10) for index in range(1, 4)]
+
+    handler._run_pack(pack)
+
+    assert [request.future.result(timeout=5) for request in pack] == ["Résumé un", "Résumé séparé", "Résumé trois"]
+    assert len(backend.prompts) == 2
+    assert "journaux du client 2" in backend.prompts[1] and "journaux du client 1" not in backend.prompts[1]
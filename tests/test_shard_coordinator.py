@@ -0,0 +1,80 @@
+from datetime import timedelta
+
+from benchmarks.fakes import FakeElasticsearchClient
+from state_manager.shard_coordinator import HashRing, ShardCoordinator
+
+CLIENTS = [f"client-{index:03d}" for index in range(300)]
+
+def _owners(ring: HashRing) -> dict:
+    return {client_id: ring.owner(client_id) for client_id in CLIENTS}
+
+def test_ring_only_moves_clients_to_a_joining_instance():
+    before = _owners(HashRing(["instance-a", "instance-b"]))
+    after = _owners(HashRing(["instance-a", "instance-b", "instance-c"]))
+
+    moved = [client_id for client_id in CLIENTS if before[client_id] != after[client_id]]
+    assert moved
+    assert all(after[client_id] == "instance-c" for client_id in moved)
+    # Répartition à peu près équilibrée entre les trois instances
+    assert 50 < len(moved) < 150
+
+def test_ring_only_moves_clients_of_a_departing_instance():
+    before = _owners(HashRing(["instance-a", "instance-b", "instance-c"]))
+    after = _owners(HashRing(["instance-a", "instance-c"]))
+
+    for client_id in CLIENTS:
+        if before[client_id] != "instance-b":
+            assert after[client_id] == before[client_id]
+        else:
+            assert after[client_id] in ("instance-a", "instance-c")
+
+def test_ring_is_independent_of_member_order():
+    assert _owners(HashRing(["instance-a", "instance-b", "instance-c"])) == _owners(HashRing(["instance-c", "instance-a", "instance-b"]))
+    assert HashRing([]).owner("client-000") is None
+
+def test_lease_held_by_another_instance_is_not_taken_until_released():
+    es_client = FakeElasticsearchClient()
+    first = ShardCoordinator(es_client, instance_id="instance-a")
+    second = ShardCoordinator(es_client, instance_id="instance-b")
+
+    first.heartbeat()
+    assert sorted(first.claim(CLIENTS)) == CLIENTS
+
+    # La seconde instance rejoint l'anneau : sa part est encore sous bail de la première
+    second.heartbeat()
+    ring = HashRing(["instance-a", "instance-b"], second.virtual_nodes)
+    share = [client_id for client_id in CLIENTS if ring.owner(client_id) == "instance-b"]
+    assert share
+    assert second.claim(CLIENTS) == []
+
+    # Au cycle suivant, la première instance libère les baux des clients qui ne lui sont plus attribués
+    assert sorted(first.claim(CLIENTS)) == sorted(set(CLIENTS) - set(share))
+    assert sorted(second.claim(CLIENTS)) == sorted(share)
+
+def test_expired_lease_is_taken_over_and_lost_by_its_former_holder():
+    es_client = FakeElasticsearchClient()
+    stopped = ShardCoordinator(es_client, instance_id="instance-a")
+    stopped.lease_ttl = timedelta(seconds=-1) # Baux déjà expirés : instance arrêtée sans les libérer
+    survivor = ShardCoordinator(es_client, instance_id="instance-b")
+
+    clients = CLIENTS[:20]
+    assert sorted(stopped.claim(clients)) == clients
+    # L'instance arrêtée n'a plus de battement de cœur : tous les clients reviennent à la survivante
+    assert sorted(survivor.claim(clients)) == clients
+
+    # Le renouvellement de l'ancienne instance échoue (numéro de séquence changé) : ses baux sont perdus
+    stopped._renew_leases()
+    assert stopped._held == {}
+    assert sorted(survivor._held) == clients
+
+def test_stop_releases_leases_for_immediate_takeover():
+    es_client = FakeElasticsearchClient()
+    leaving = ShardCoordinator(es_client, instance_id="instance-a")
+    staying = ShardCoordinator(es_client, instance_id="instance-b")
+    leaving.heartbeat()
+    staying.heartbeat()
+    leaving.claim(CLIENTS)
+    staying.claim(CLIENTS)
+
+    leaving.stop()
+    assert sorted(staying.claim(CLIENTS)) == CLIENTS
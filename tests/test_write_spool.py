@@ -0,0 +1,118 @@
+import json
+import os
+
+from benchmarks.fakes import FakeElasticsearchClient
+from core.write_spool import DEAD_LETTER_FILE, RECORD_HEADER, WriteSpool, _Segment
+
+RESULTS_INDEX = "ia-analysis-results-test"
+STATE_INDEX = "ia-analysis-state-test"
+
+def _result_action(doc_id: str, client_id: str = "client-a") -> dict:
+    return {"_op_type": "create", "_index": RESULTS_INDEX, "_id": doc_id, "_source": {"client_id": client_id, "summary": doc_id}}
+
+def test_segment_reopen_keeps_unacked_records(tmp_path):
+    segment = _Segment(str(tmp_path), 1)
+    for position in range(4):
+        segment.append(json.dumps(_result_action(f"doc-{position}")).encode("utf-8"), 1.0)
+    segment.ack(2)
+    segment.sync()
+    segment.close()
+
+    reopened = _Segment(str(tmp_path), 1)
+    assert (reopened.count, reopened.acked) == (4, 2)
+    assert [json.loads(reopened.read(position)[1])["_id"] for position in range(reopened.acked, reopened.count)] == ["doc-2", "doc-3"]
+    reopened.close()
+
+def test_segment_reopen_drops_records_missing_from_truncated_data_file(tmp_path):
+    segment = _Segment(str(tmp_path), 1)
+    for position in range(4):
+        segment.append(f"payload-{position}".encode("utf-8"), 1.0)
+    segment.ack(4)
+    segment.sync()
+    third_offset = segment.offset(2)
+    segment.close()
+    # Coupure au milieu de l'en-tête du troisième enregistrement (disque plein, copie incomplète)
+    with open(segment.data_path, "r+b") as data_file:
+        data_file.truncate(third_offset + RECORD_HEADER.size // 2)
+
+    reopened = _Segment(str(tmp_path), 1)
+    assert (reopened.count, reopened.acked) == (2, 2)
+    assert reopened.write_position == third_offset
+    assert os.path.getsize(reopened.data_path) == third_offset
+    reopened.append(b"after-recovery", 2.0)
+    assert reopened.read(2)[:2] == (2.0, b"after-recovery")
+    reopened.close()
+
+def test_spool_replays_pending_records_after_restart(tmp_path):
+    # Enregistrements écrits par une instance arrêtée avant leur relecture
+    segment = _Segment(str(tmp_path), 1)
+    for position in range(3):
+        segment.append(json.dumps(_result_action(f"doc-{position}")).encode("utf-8"), 1.0)
+    segment.append(json.dumps({"_op_type": "index", "_index": STATE_INDEX, "_id": "state-a",
+                               "_source": {"client_id": "client-a", "last_processed_timestamp": "2026-01-01T00:00:00.000Z"}}).encode("utf-8"), 1.0)
+    segment.sync()
+    segment.close()
+
+    es_client = FakeElasticsearchClient()
+    spool = WriteSpool(es_client, directory=str(tmp_path))
+    spool.close()
+
+    assert spool.pending_records == 0
+    assert sorted(doc["summary"] for doc in es_client.es.documents(RESULTS_INDEX)) == ["doc-0", "doc-1", "doc-2"]
+    assert es_client.es.documents(STATE_INDEX)[0]["last_processed_timestamp"] == "2026-01-01T00:00:00.000Z"
+    assert not os.path.exists(os.path.join(tmp_path, DEAD_LETTER_FILE))
+
+def test_spool_counts_create_conflict_as_written(tmp_path):
+    es_client = FakeElasticsearchClient()
+    # Document déjà écrit par une relecture interrompue avant l'acquittement
+    es_client.es.create(index=RESULTS_INDEX, id="doc-0", document={"client_id": "client-a", "summary": "doc-0"})
+
+    spool = WriteSpool(es_client, directory=str(tmp_path))
+    spool.append(_result_action("doc-0"))
+    spool.append(_result_action("doc-1"))
+    spool.close()
+
+    assert spool.pending_records == 0
+    assert sorted(doc["summary"] for doc in es_client.es.documents(RESULTS_INDEX)) == ["doc-0", "doc-1"]
+    assert not os.path.exists(os.path.join(tmp_path, DEAD_LETTER_FILE))
+
+def test_spool_moves_rejected_writes_to_dead_letter_file(tmp_path):
+    es_client = FakeElasticsearchClient()
+    spool = WriteSpool(es_client, directory=str(tmp_path))
+    # Contrôle de concurrence sur un document inexistant : rejet définitif (409 sur une opération index)
+    rejected = {"_op_type": "index", "_index": STATE_INDEX, "_id": "state-a", "if_seq_no": 7, "if_primary_term": 1,
+                "_source": {"client_id": "client-a"}}
+    spool.append(rejected)
+    spool.append(_result_action("doc-0"))
+    spool.close()
+
+    assert spool.pending_records == 0
+    assert [doc["summary"] for doc in es_client.es.documents(RESULTS_INDEX)] == ["doc-0"]
+    with open(os.path.join(tmp_path, DEAD_LETTER_FILE), encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert len(entries) == 1
+    assert entries[0]["status"] == 409
+    assert entries[0]["action"] == rejected
+
+def test_replay_dead_letters_requeues_rejected_writes(tmp_path):
+    es_client = FakeElasticsearchClient()
+    spool = WriteSpool(es_client, directory=str(tmp_path))
+    spool.append({"_op_type": "index", "_index": STATE_INDEX, "_id": "state-a", "if_seq_no": 7, "if_primary_term": 1,
+                  "_source": {"client_id": "client-a"}})
+    spool.close()
+
+    # Cause corrigée : l'écriture rejouée n'a plus de condition de concurrence
+    dead_letter_path = os.path.join(tmp_path, DEAD_LETTER_FILE)
+    with open(dead_letter_path, encoding="utf-8") as f:
+        entry = json.loads(f.readline())
+    del entry["action"]["if_seq_no"], entry["action"]["if_primary_term"]
+    with open(dead_letter_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+    spool = WriteSpool(es_client, directory=str(tmp_path))
+    assert spool.replay_dead_letters() == 1
+    spool.close()
+
+    assert es_client.es.documents(STATE_INDEX) == [{"client_id": "client-a"}]
+    assert not os.path.exists(dead_letter_path)
+    assert spool.replay_dead_letters() == 0
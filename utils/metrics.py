@@ -0,0 +1,281 @@
+"""
+Métriques internes de l'analyseur (compteurs, jauges, histogrammes) exposées au format texte Prometheus
+sur un petit point d'accès HTTP local.
+
+L'enregistrement d'une mesure se limite à une recherche dans un dictionnaire et à une addition sous verrou,
+pour rester négligeable sur le chemin critique.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+if not logger.handlers:
+    ch = logging.StreamHandler()
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    ch.setFormatter(formatter)
+    logger.addHandler(ch)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+CYCLE_BUCKETS = (1, 5, 10, 30, 60, 120, 300, 600, 1200, 3600)
+PACK_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items: list) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+class Counter(_Metric):
+    """
+    Compteur monotone, éventuellement étiqueté.
+    """
+    metric_type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    """
+    Valeur instantanée, éventuellement étiquetée.
+    """
+    metric_type = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """
+    Histogramme à seaux cumulés (le), avec somme et nombre d'observations.
+    """
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value) # Premier seau dont la borne est >= value
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _render_samples(self, items: list) -> list:
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_label = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, bucket_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Ensemble des métriques exposées par le point d'accès.
+    """
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+# Étapes du pipeline
+STAGE_DURATION = REGISTRY.histogram(
+    "ia_log_analyzer_stage_duration_seconds", "Durée de chaque étape de l'analyse.", ("stage",))
+CLIENT_STAGE_SECONDS = REGISTRY.counter(
+    "ia_log_analyzer_client_stage_seconds_total", "Temps cumulé par client et par étape.", ("client_id", "stage"))
+STAGE_ERRORS = REGISTRY.counter(
+    "ia_log_analyzer_stage_errors_total", "Erreurs par étape.", ("stage",))
+
+# Volumes par client
+LOGS_FETCHED = REGISTRY.counter(
+    "ia_log_analyzer_logs_fetched_total", "Journaux récupérés depuis Elasticsearch.", ("client_id",))
+LOGS_SENT_TO_IA = REGISTRY.counter(
+    "ia_log_analyzer_logs_sent_to_ia_total", "Journaux retenus par le filtre local et envoyés à l'IA.", ("client_id",))
+IA_INPUT_BYTES = REGISTRY.counter(
+    "ia_log_analyzer_ia_input_bytes_total", "Octets de journaux formatés envoyés à l'IA.", ("client_id",))
+IA_INPUT_TOKENS = REGISTRY.counter(
+    "ia_log_analyzer_ia_input_tokens_total", "Jetons estimés des journaux formatés envoyés à l'IA.", ("client_id",))
+BATCHES = REGISTRY.counter(
+    "ia_log_analyzer_batches_total", "Lots traités par client et par issue (analyzed, cached, filtered_out, gated, silent, failed).", ("client_id", "outcome"))
+
+# Appels IA
+IA_CALLS = REGISTRY.counter(
+    "ia_log_analyzer_ia_calls_total", "Appels au backend IA par issue (success, retryable_error, error).", ("outcome",))
+IA_PACKED_SECTIONS = REGISTRY.counter(
+    "ia_log_analyzer_ia_packed_sections_total", "Sections client des requêtes IA regroupées par issue (parsed, retried).", ("outcome",))
+IA_PACK_SIZE = REGISTRY.histogram(
+    "ia_log_analyzer_ia_pack_size", "Nombre de clients par requête IA regroupée.", buckets=PACK_SIZE_BUCKETS)
+IA_RATE_LIMIT_WAIT = REGISTRY.counter(
+    "ia_log_analyzer_ia_rate_limit_wait_seconds_total", "Temps d'attente imposé par les limites de débit IA.")
+
+# Écritures Elasticsearch
+RESULTS_WRITTEN = REGISTRY.counter(
+    "ia_log_analyzer_results_written_total", "Résultats IA écrits par issue (ok, retried, rejected, dropped, spooled).", ("outcome",))
+STATE_WRITES = REGISTRY.counter(
+    "ia_log_analyzer_state_writes_total", "Mises à jour de l'état d'analyse par issue (ok, failed, spooled).", ("outcome",))
+
+# Journal d'écriture local (résultats et états en attente de relecture vers Elasticsearch)
+SPOOL_PENDING_RECORDS = REGISTRY.gauge(
+    "ia_log_analyzer_spool_pending_records", "Écritures en attente dans le journal d'écriture.")
+SPOOL_PENDING_BYTES = REGISTRY.gauge(
+    "ia_log_analyzer_spool_pending_bytes", "Octets en attente dans le journal d'écriture.")
+SPOOL_OLDEST_AGE = REGISTRY.gauge(
+    "ia_log_analyzer_spool_oldest_age_seconds", "Âge de la plus ancienne écriture en attente.")
+SPOOL_REPLAYED = REGISTRY.counter(
+    "ia_log_analyzer_spool_replayed_total", "Écritures relues vers Elasticsearch par issue (ok, retried, rejected : déplacées dans dead-letter.jsonl).", ("outcome",))
+SPOOL_THROTTLE_SECONDS = REGISTRY.counter(
+    "ia_log_analyzer_spool_throttle_seconds_total", "Temps d'attente de l'analyse imposé par un journal d'écriture plein.")
+
+# Alertes
+ALERTS = REGISTRY.counter(
+    "ia_log_analyzer_alerts_total", "Alertes client par issue (queued, deduplicated).", ("outcome",))
+EMAILS = REGISTRY.counter(
+    "ia_log_analyzer_emails_total", "E-mails d'alerte par issue (sent, failed).", ("outcome",))
+
+# Répartition entre instances
+SHARD_MEMBERS = REGISTRY.gauge(
+    "ia_log_analyzer_shard_members", "Instances actives vues au dernier cycle.")
+SHARD_OWNED_CLIENTS = REGISTRY.gauge(
+    "ia_log_analyzer_shard_owned_clients", "Clients dont cette instance détient le bail.")
+SHARD_LEASE_CONFLICTS = REGISTRY.counter(
+    "ia_log_analyzer_shard_lease_conflicts_total", "Baux non obtenus ou perdus au profit d'une autre instance.")
+
+# Planification par client
+SCHEDULED_CLIENTS = REGISTRY.gauge(
+    "ia_log_analyzer_scheduled_clients", "Clients planifiés par le planificateur.")
+CLIENT_INTERVAL = REGISTRY.gauge(
+    "ia_log_analyzer_client_interval_seconds", "Intervalle d'analyse courant par client.", ("client_id",))
+
+# Cycles
+CYCLE_DURATION = REGISTRY.histogram(
+    "ia_log_analyzer_cycle_duration_seconds", "Durée d'un tour d'analyse (clients échus).", buckets=CYCLE_BUCKETS)
+CYCLE_OVERRUNS = REGISTRY.counter(
+    "ia_log_analyzer_cycle_overruns_total", "Tours plus longs que ANALYSIS_INTERVAL_SECONDS.")
+ACTIVE_CLIENTS = REGISTRY.gauge(
+    "ia_log_analyzer_active_clients", "Clients actifs découverts au dernier cycle.")
+LAST_CYCLE_END = REGISTRY.gauge(
+    "ia_log_analyzer_last_cycle_end_timestamp_seconds", "Horodatage Unix de la fin du dernier tour.")
+
+@contextmanager
+def stage_timer(stage: str, client_id: str = None):
+    """
+    Mesure la durée d'une étape (histogramme par étape et temps cumulé par client) et compte ses erreurs.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        if client_id is not None:
+            CLIENT_STAGE_SECONDS.inc(elapsed, client_id=client_id, stage=stage)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Pas de journal par requête de collecte
+
+def start_metrics_server(host: str, port: int):
+    """
+    Démarre le point d'accès /metrics dans un thread d'arrière-plan. Renvoie le serveur, ou None en cas d'échec
+    (l'analyse continue sans métriques exposées).
+    """
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    except OSError as e:
+        logger.error(f"Impossible de démarrer le point d'accès des métriques sur {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Métriques Prometheus exposées sur http://{host}:{server.server_address[1]}/metrics")
+    return server
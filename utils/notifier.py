@@ -1,37 +1,219 @@
+import hashlib
+import re
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 import logging
 
 from config import settings
+from utils import metrics
 
 # Configure logging
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO) 
+logger.setLevel(logging.INFO)
 if not logger.handlers:
     ch = logging.StreamHandler()
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     ch.setFormatter(formatter)
     logger.addHandler(ch)
 
+_VOLATILE_RE = re.compile(r"\d+")
+_SPACES_RE = re.compile(r"\s+")
+
 class Notifier:
+    """
+    Envoie les alertes par e-mail depuis un thread d'arrière-plan, sur une connexion SMTP persistante
+    (reconnectée si le serveur l'a fermée), sans bloquer l'analyse.
+    Les alertes des clients sont regroupées pendant ALERT_COALESCE_WINDOW_SECONDS dans un e-mail de synthèse,
+    et une alerte identique à la dernière envoyée pour le même client est ignorée pendant ALERT_DEDUP_SECONDS.
+    Une alerte n'est comptée comme envoyée qu'une fois l'e-mail accepté par le serveur SMTP : si l'envoi échoue,
+    la même alerte sera de nouveau mise en file au cycle suivant.
+    """
+    def __init__(self):
+        self.enabled = settings.ENABLE_EMAIL_NOTIFICATIONS
+        self.coalesce_window = settings.ALERT_COALESCE_WINDOW_SECONDS
+        self.dedup_seconds = settings.ALERT_DEDUP_SECONDS
+
+        self._condition = threading.Condition()
+        self._messages = [] # E-mails à envoyer immédiatement (sujet, corps)
+        self._alerts = [] # Alertes client en attente de synthèse (gravité, client_id, résumé, empreinte)
+        self._sending = [] # Alertes de l'e-mail de synthèse en cours d'envoi
+        self._oldest_alert = None
+        self._last_sent = {} # client_id -> (empreinte de la dernière alerte envoyée, horodatage de l'envoi)
+        self._closed = False
+        self._smtp = None
+        self._thread = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, name="email-notifier", daemon=True)
+            self._thread.start()
+
     def send_email_alert(self, subject: str, body: str):
         """
-        Envoie une alerte par e-mail si les notifications par e-mail sont activées dans les paramètres.
+        Met en file une alerte par e-mail à envoyer dès que possible, si les notifications par e-mail sont activées.
         """
-        if not settings.ENABLE_EMAIL_NOTIFICATIONS:
+        if not self.enabled:
             logger.debug("Les notifications par e-mail sont désactivées.")
             return
+        with self._condition:
+            self._messages.append((subject, body))
+            self._condition.notify()
+
+    def queue_client_alert(self, client_id: str, severity: str, summary: str):
+        """
+        Met en file l'alerte d'un client pour le prochain e-mail de synthèse.
+        Une alerte identique (à des nombres près) à la dernière envoyée pour ce client, ou à une alerte
+        déjà en file, est ignorée.
+        """
+        if not self.enabled:
+            logger.debug("Les notifications par e-mail sont désactivées.")
+            return
+        fingerprint = self._alert_fingerprint(severity, summary)
+        now = time.monotonic()
+        with self._condition:
+            previous = self._last_sent.get(client_id)
+            pending = any(alert[1] == client_id and alert[3] == fingerprint for alert in self._alerts + self._sending)
+            if pending or (previous and previous[0] == fingerprint and now - previous[1] < self.dedup_seconds):
+                metrics.ALERTS.inc(outcome="deduplicated")
+                logger.info(f"Alerte '{severity}' identique à la précédente pour le client '{client_id}', non renvoyée.")
+                return
+            self._alerts.append((severity, client_id, summary, fingerprint))
+            if self._oldest_alert is None:
+                self._oldest_alert = now
+            self._condition.notify()
+        metrics.ALERTS.inc(outcome="queued")
+
+    @staticmethod
+    def _alert_fingerprint(severity: str, summary: str) -> str:
+        normalized = _SPACES_RE.sub(" ", _VOLATILE_RE.sub("#", summary.lower())).strip()
+        return hashlib.sha1(f"{severity}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._closed and not self._messages and not self._digest_due():
+                    timeout = None
+                    if self._oldest_alert is not None:
+                        timeout = max(0.0, self._oldest_alert + self.coalesce_window - time.monotonic())
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+                messages, self._messages = self._messages, []
+                alerts = []
+                if self._digest_due():
+                    alerts, self._alerts, self._oldest_alert = self._alerts, [], None
+                    self._sending = alerts
+            for subject, body in messages:
+                self._deliver(subject, body)
+            if alerts:
+                self._deliver_digest(alerts)
+
+    def _deliver_digest(self, alerts: list):
+        """
+        Envoie l'e-mail de synthèse, puis enregistre ses alertes comme envoyées (déduplication) s'il a été accepté.
+        """
+        delivered = self._deliver(*self._build_digest(alerts))
+        now = time.monotonic()
+        with self._condition:
+            self._sending = []
+            if delivered:
+                for _, client_id, _, fingerprint in alerts:
+                    self._last_sent[client_id] = (fingerprint, now)
+            else:
+                logger.warning(f"{len(alerts)} alertes non envoyées : elles ne sont pas comptées pour la déduplication.")
 
+    def _digest_due(self) -> bool:
+        return self._oldest_alert is not None and time.monotonic() - self._oldest_alert >= self.coalesce_window
+
+    def _build_digest(self, alerts: list) -> tuple:
+        """
+        Construit un e-mail unique pour les alertes regroupées, classées par gravité puis par client.
+        """
+        if len(alerts) == 1:
+            severity, client_id, summary, _ = alerts[0]
+            return (f"ALERTE IA - Client {client_id}: {severity.upper()} Problème détecté !",
+                    f"L'IA a détecté un {severity} problème pour le client '{client_id}' dans les journaux récents.\n\nRésumé de l'IA:\n{summary}\n\nConsultez Kibana pour plus de détails, filtrez par client_id: '{client_id}'.")
+
+        severity_order = {severity: index for index, severity in enumerate(settings.ALERT_SEVERITIES)}
+        alerts = sorted(alerts, key=lambda alert: (severity_order.get(alert[0], len(severity_order)), alert[1]))
+        clients = sorted({client_id for _, client_id, _, _ in alerts})
+        sections = []
+        current_severity = None
+        for severity, client_id, summary, _ in alerts:
+            if severity != current_severity:
+                current_severity = severity
+                count = sum(1 for alert in alerts if alert[0] == severity)
+                sections.append(f"=== {severity.upper()} ({count} alerte(s)) ===")
+            sections.append(f"--- Client '{client_id}' ---\n{summary}\n")
+        subject = f"ALERTE IA - {len(alerts)} problèmes détectés pour {len(clients)} client(s)"
+        body = (f"L'IA a détecté des problèmes pour {len(clients)} client(s) au cours des {self.coalesce_window:.0f} dernières secondes.\n\n"
+                + "\n".join(sections)
+                + "\nConsultez Kibana pour plus de détails, filtrez par client_id.")
+        return subject, body
+
+    def _connect(self):
+        server = smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT, timeout=settings.SMTP_TIMEOUT_SECONDS)
+        server.starttls() # Enable TLS encryption
+        if settings.SMTP_USERNAME and settings.SMTP_PASSWORD:
+            server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
+        return server
+
+    def _deliver(self, subject: str, body: str) -> bool:
+        """
+        Envoie un e-mail sur la connexion persistante; en cas de connexion perdue, reconnecte et réessaie une fois.
+        Renvoie True si l'e-mail a été envoyé.
+        """
         msg = MIMEText(body)
         msg['Subject'] = f"{settings.EMAIL_SUBJECT_PREFIX} {subject}"
         msg['From'] = settings.EMAIL_FROM
-        msg['To'] = ", ".join(settings.EMAIL_TO) 
-        try:
-            with smtplib.SMTP(settings.SMTP_SERVER, settings.SMTP_PORT) as server:
-                server.starttls() # Enable TLS encryption
-                if settings.SMTP_USERNAME and settings.SMTP_PASSWORD:
-                    server.login(settings.SMTP_USERNAME, settings.SMTP_PASSWORD)
-                server.send_message(msg)
-            logger.info(f"Alerte par e-mail envoyée: '{msg['Subject']}' to {msg['To']}")
-        except Exception as e:
-            logger.error(f"Échec de l'envoi de l'alerte par e-mail: {e}", exc_info=True)
\ No newline at end of file
+        msg['To'] = ", ".join(settings.EMAIL_TO)
+        for attempt in range(2):
+            try:
+                if self._smtp is None:
+                    self._smtp = self._connect()
+                self._smtp.send_message(msg)
+                metrics.EMAILS.inc(outcome="sent")
+                logger.info(f"Alerte par e-mail envoyée: '{msg['Subject']}' to {msg['To']}")
+                return True
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError) as e:
+                self._disconnect()
+                if attempt == 0:
+                    logger.warning(f"Connexion SMTP perdue ({e}), reconnexion.")
+                    continue
+                metrics.EMAILS.inc(outcome="failed")
+                logger.error(f"Échec de l'envoi de l'alerte par e-mail: {e}", exc_info=True)
+            except Exception as e:
+                self._disconnect()
+                metrics.EMAILS.inc(outcome="failed")
+                logger.error(f"Échec de l'envoi de l'alerte par e-mail: {e}", exc_info=True)
+                return False
+        return False
+
+    def _disconnect(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass # La connexion est déjà fermée côté serveur
+            self._smtp = None
+
+    def close(self):
+        """
+        Envoie les e-mails et alertes en attente (sans attendre la fin de la fenêtre de regroupement),
+        puis arrête le thread d'arrière-plan et ferme la connexion SMTP.
+        """
+        if self._thread is None:
+            return
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
+        messages, alerts = self._messages, self._alerts
+        self._messages, self._alerts, self._oldest_alert = [], [], None
+        for subject, body in messages:
+            self._deliver(subject, body)
+        if alerts:
+            self._deliver_digest(alerts)
+        self._disconnect()
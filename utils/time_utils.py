@@ -0,0 +1,16 @@
+import re
+from datetime import datetime, timezone
+
+_FRACTION_RE = re.compile(r"\.(\d+)")
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Convertit un horodatage ISO 8601 (format Elasticsearch « strict_date_optional_time ») en datetime UTC.
+    Accepte le suffixe « Z » et une précision fractionnaire quelconque (tronquée à la microseconde).
+    """
+    value = value.strip().replace("Z", "+00:00")
+    value = _FRACTION_RE.sub(lambda match: "." + match.group(1)[:6].ljust(6, "0"), value, count=1)
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)